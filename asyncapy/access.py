@@ -0,0 +1,309 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import collections
+import threading
+import time
+from typing import Optional
+
+
+# The record of the request that is being processed by the current task, if the access log is enabled
+current_record = contextvars.ContextVar("current_record", default=None)
+
+_LINE = (
+    '{"time":%.6f,"session_id":"%s","peer":%s,"encoding":%s,"request_bytes":%d,"response_bytes":%d,'
+    '"handler":%s,"group":%s,"status":%s,"duration":%.0f,"stages":{%s}}\n'
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def _encode(value) -> str:
+    """
+    Encodes a field as JSON. Fields only take a handful of distinct values (handler names,
+    statuses, peers), so caching them is much cheaper than calling ``json.dumps()`` every time
+    """
+
+    return json.dumps(value)
+
+
+class AccessRecord:
+    """
+    Everything the access log knows about a single request. When the access log is enabled,
+    the server creates one record per request and fills it in as the request moves through
+    the pipeline
+
+    :param session_id: The UUID of the session the request belongs to
+    :type session_id: str
+    :param peer: The address of the client
+    :type peer: str
+    """
+
+    __slots__ = (
+        "session_id",
+        "peer",
+        "encoding",
+        "request_bytes",
+        "response_bytes",
+        "handler",
+        "group",
+        "status",
+        "time",
+        "stages",
+        "sampled",
+        "profiler",
+        "_start",
+        "_mark",
+    )
+
+    def __init__(self, session_id, peer: str):
+        """
+        Object constructor
+        """
+
+        self.session_id = session_id
+        self.peer = peer
+        self.encoding = None
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.handler = None
+        self.group = None
+        self.status = None
+        self.time = time.time()
+        # Stage name -> duration in seconds
+        self.stages = {}
+        # Whether the request was sampled for tracing, see Server.trace_sample_rate
+        self.sampled = False
+        self.profiler = None
+        self._start = self._mark = time.perf_counter()
+
+    def lap(self, stage: str):
+        """
+        Ends the current stage of the request, recording how long it took under ``stage``,
+        and starts the next one
+        """
+
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0) + now - self._mark
+        self._mark = now
+
+    def add(self, stage: str, duration: float):
+        """
+        Adds ``duration`` seconds to ``stage``, without affecting the current stage
+        """
+
+        self.stages[stage] = self.stages.get(stage, 0) + duration
+
+    def finish(self, status: str):
+        """
+        Marks the end of the request
+
+        :param status: The status of the request, unless it was already set (e.g. to an ``ERR_*`` code)
+        :type status: str
+        """
+
+        self._mark = time.perf_counter()
+        if self.status is None:
+            self.status = status
+
+    @property
+    def duration(self) -> float:
+        """
+        The time elapsed since the request started, in seconds
+        """
+
+        return self._mark - self._start
+
+    def to_line(self) -> str:
+        """
+        Returns the record as a JSON line, like ``json.dumps(self.to_dict())`` but several times faster
+        """
+
+        return _LINE % (
+            self.time,
+            self.session_id,
+            _encode(self.peer),
+            _encode(self.encoding),
+            self.request_bytes,
+            self.response_bytes,
+            _encode(self.handler),
+            _encode(self.group),
+            _encode(self.status),
+            self.duration * 1e6,
+            ",".join([f'"{stage}":{value * 1e6:.0f}' for stage, value in self.stages.items()]),
+        )
+
+    def to_dict(self) -> dict:
+        """
+        Returns the record as a dictionary. Durations are in microseconds
+        """
+
+        return {
+            "time": round(self.time, 6),
+            "session_id": str(self.session_id),
+            "peer": self.peer,
+            "encoding": self.encoding,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "handler": self.handler,
+            "group": self.group,
+            "status": self.status,
+            "duration": round(self.duration * 1e6),
+            "stages": {stage: round(value * 1e6) for stage, value in self.stages.items()},
+        }
+
+
+class AccessLog:
+    """
+    Writes one JSON line per request to a rotating file. Records are appended to a bounded buffer
+    that a background thread writes out in batches every ``flush_interval`` seconds, so that the
+    event loop never waits for the disk and is never woken up by the writer. Records that don't fit
+    in the buffer are dropped and counted in ``self.dropped``
+
+    :param path: The path of the log file
+    :type path: str
+    :param max_bytes: The size at which the file is rotated, defaults to 64 MiB. If 0, the file is never rotated
+    :type max_bytes: int, optional
+    :param backup_count: How many rotated files (``path.1``, ``path.2``, ...) are kept, defaults to 5
+    :type backup_count: int, optional
+    :param flush_interval: How often (in seconds) buffered records are written, defaults to 0.5
+    :type flush_interval: float, optional
+    :param batch_size: The maximum number of records written at once, defaults to 4096
+    :type batch_size: int, optional
+    :param queue_size: The maximum number of records waiting to be written, defaults to 65536
+    :type queue_size: int, optional
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        backup_count: int = 5,
+        flush_interval: float = 0.5,
+        batch_size: int = 4096,
+        queue_size: int = 65536,
+    ):
+        """
+        Object constructor
+        """
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.dropped = 0
+        # Appending to a deque is atomic, so the event loop never takes a lock
+        self._records = collections.deque()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._file = None
+
+    def start(self):
+        """
+        Opens the log file and starts the writer thread
+        """
+
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="asyncapy-access-log", daemon=True)
+        self._thread.start()
+
+    def write(self, record: AccessRecord):
+        """
+        Queues a record to be written. This never blocks
+        """
+
+        if len(self._records) >= self.queue_size:
+            self.dropped += 1
+        else:
+            self._records.append(record)
+
+    def stop(self):
+        """
+        Writes the records that are still queued, stops the writer thread and closes the file
+        """
+
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+
+    def _rotate(self):
+        """
+        Internal method to rotate the log file
+        """
+
+        self._file.close()
+        if self.backup_count:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _flush(self):
+        """
+        Writes all the buffered records
+        """
+
+        while self._records:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._records.popleft())
+            except IndexError:
+                pass
+            try:
+                self._file.write("".join([record.to_line() for record in batch]))
+                self._file.flush()
+                if self.max_bytes and self._file.tell() >= self.max_bytes:
+                    self._rotate()
+            except (OSError, ValueError) as error:
+                logging.error("{Access log} Could not write %s record(s) -> %s", len(batch), error)
+
+    def _run(self):
+        """
+        The writer thread's main loop
+        """
+
+        while not self._stopping.wait(self.flush_interval):
+            self._flush()
+        self._flush()
+
+
+def worker_path(path: str, worker_id: Optional[int]) -> str:
+    """
+    Returns the path of the access log of a worker process: workers can't share the
+    same file, since each of them rotates its own
+    """
+
+    if worker_id is None:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.worker{worker_id}{extension}"
@@ -0,0 +1,438 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import collections
+import json
+import logging
+import select
+import ssl
+import time
+from typing import Any, Dict, Optional, Union
+import trio
+import ziproto
+from .backends import AsyncioStream
+
+
+class _TrioIO:
+    """
+    The primitives the client needs, on trio
+    """
+
+    name = "trio"
+
+    @staticmethod
+    async def connect(host: str, port: int, unix_path: Optional[str], ssl_context, server_hostname):
+        if unix_path:
+            stream = await trio.open_unix_socket(unix_path)
+        else:
+            stream = await trio.open_tcp_stream(host, port)
+        if ssl_context is not None:
+            stream = trio.SSLStream(stream, ssl_context, server_hostname=server_hostname)
+            await stream.do_handshake()
+        return stream
+
+    @staticmethod
+    def semaphore(value: int):
+        return trio.Semaphore(value)
+
+    @staticmethod
+    async def timeout(coroutine, seconds: float):
+        with trio.move_on_after(seconds) as scope:
+            return await coroutine
+        if scope.cancelled_caught:
+            raise TimeoutError(f"No response in {seconds} seconds")
+
+    @staticmethod
+    def readable(stream) -> bool:
+        """
+        Returns whether an idle connection has something to read, that is, the server
+        closed it (or sent something nobody asked for). It can't be reused either way
+        """
+
+        if isinstance(stream, trio.SSLStream):
+            stream = stream.transport_stream
+        fileno = stream.socket.fileno()
+        if fileno < 0:
+            return True
+        if hasattr(select, "poll"):
+            poll = select.poll()
+            poll.register(fileno, select.POLLIN)
+            return bool(poll.poll(0))
+        return bool(select.select([fileno], [], [], 0)[0])
+
+
+class _AsyncioIO:
+    """
+    The primitives the client needs, on asyncio. Connections are wrapped
+    in ``AsyncioStream``, so that they behave like trio streams
+    """
+
+    name = "asyncio"
+
+    @staticmethod
+    async def connect(host: str, port: int, unix_path: Optional[str], ssl_context, server_hostname):
+        if unix_path:
+            reader, writer = await asyncio.open_unix_connection(unix_path)
+        else:
+            reader, writer = await asyncio.open_connection(
+                host, port, ssl=ssl_context, server_hostname=server_hostname if ssl_context else None
+            )
+        return AsyncioStream(reader, writer)
+
+    @staticmethod
+    def semaphore(value: int):
+        return asyncio.Semaphore(value)
+
+    @staticmethod
+    async def timeout(coroutine, seconds: float):
+        try:
+            return await asyncio.wait_for(coroutine, seconds)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No response in {seconds} seconds") from None
+
+    @staticmethod
+    def readable(stream: AsyncioStream) -> bool:
+        # asyncio reads eagerly, so the data (or the end of the stream) is already in the reader's buffer
+        return stream._reader.at_eof() or bool(len(stream._reader._buffer)) or stream._writer.is_closing()
+
+
+class _Connection:
+    """
+    A pooled connection
+    """
+
+    __slots__ = ("stream", "buffer", "last_used", "reused")
+
+    def __init__(self, stream):
+        self.stream = stream
+        # Bytes received past the end of the last response
+        self.buffer = bytearray()
+        self.last_used = time.monotonic()
+        # Whether the connection already carried a request
+        self.reused = False
+
+
+class AsyncClient:
+    """
+    An asynchronous AsyncAProto client keeping a pool of connections to a server, usable from both trio and
+    asyncio (whichever is running when it's first used). Requests can be made concurrently: each of them
+    takes a connection from the pool for as long as it waits for its response, and new connections are opened
+    as needed, up to ``max_size``. Requests over that wait for a connection to be free.
+
+    Connections are only reused if the server keeps them alive (``Server(keep_alive=True)``). Unless ``keep_alive``
+    is set, the client finds out by itself: idle connections are checked before they're reused, and if the server
+    closed them after answering, the client stops pooling connections. A request sent on a reused connection that
+    the server closed before answering is retried once on a new connection.
+
+    Every request must get exactly one response: requests matching no handler, or whose handler sends more than
+    one response, can't be told apart from slow ones and eventually time out
+
+    :param host: The address of the server, defaults to ``'127.0.0.1'``
+    :type host: str, optional
+    :param port: The port of the server, defaults to 1500
+    :type port: int, optional
+    :param unix_path: If set, connects to the Unix domain socket at this path instead of ``host:port``.
+    These connections never leave the machine and aren't encrypted, even if ``tls`` is ``True``,
+    defaults to ``None``
+    :type unix_path: str, optional
+    :param encoding: The encoding of requests, ``'json'`` or ``'ziproto'``, defaults to ``'json'``
+    :type encoding: str, optional
+    :param header_size: The size in bytes of the ``Content-Length`` header, defaults to 4
+    :type header_size: int, optional
+    :param byteorder: The byte order of the ``Content-Length`` header, defaults to ``'big'``
+    :type byteorder: str, optional
+    :param tls: If ``True``, connections are encrypted with TLS, defaults to ``True``
+    :type tls: bool, optional
+    :param ssl_context: The ``ssl.SSLContext`` used when ``tls`` is ``True``, defaults to ``None``
+    (``ssl.create_default_context()``)
+    :type ssl_context: class: ``ssl.SSLContext``, optional
+    :param verify: If ``False``, the default SSL context won't verify the server's certificate and hostname,
+    defaults to ``True``
+    :type verify: bool, optional
+    :param timeout: How long (in seconds) a request waits for its response, defaults to 60
+    :type timeout: float, optional
+    :param min_size: The number of idle connections kept open even when they're not used, which ``open()`` opens
+    in advance, defaults to 0
+    :type min_size: int, optional
+    :param max_size: The maximum number of connections, defaults to 10
+    :type max_size: int, optional
+    :param idle_timeout: Idle connections are closed after this many seconds (unless there are only ``min_size``
+    of them), defaults to 60
+    :type idle_timeout: float, optional
+    :param keep_alive: Whether the server keeps connections alive, defaults to ``None`` (find out)
+    :type keep_alive: bool, optional
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 1500,
+        unix_path: Optional[str] = None,
+        encoding: str = "json",
+        header_size: int = 4,
+        byteorder: str = "big",
+        tls: bool = True,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        verify: bool = True,
+        timeout: float = 60,
+        min_size: int = 0,
+        max_size: int = 10,
+        idle_timeout: float = 60,
+        keep_alive: Optional[bool] = None,
+    ):
+        """
+        Object constructor
+        """
+
+        if byteorder not in ("big", "little"):
+            raise ValueError("byteorder must either be 'big' or 'little'!")
+        if not isinstance(header_size, int):
+            raise ValueError("header_size must be an integer!")
+        if encoding not in ("json", "ziproto"):
+            raise ValueError("encoding must either be 'json' or 'ziproto'!")
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError("min_size and max_size must satisfy 0 <= min_size <= max_size and max_size >= 1!")
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.encoding = encoding
+        self.header_size = header_size
+        self.byteorder = byteorder
+        self.tls = tls
+        self.ssl_context = ssl_context
+        self.verify = verify
+        self.timeout = timeout
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.keep_alive = keep_alive
+        # Idle connections, the most recently used last
+        self._idle = collections.deque()
+        # The number of open connections, idle or not
+        self.size = 0
+        self._io = None
+        self._slots = None
+        # Whether a reused connection ever got a response, see _request()
+        self._reuse_worked = False
+        self._closed = False
+
+    def _setup(self):
+        """
+        Picks the I/O primitives of the running event loop, on first use
+        """
+
+        if self._io is not None:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._io = _TrioIO
+        else:
+            self._io = _AsyncioIO
+        self._slots = self._io.semaphore(self.max_size)
+        if self.tls and self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+            if not self.verify:
+                self.ssl_context.check_hostname = False
+                self.ssl_context.verify_mode = ssl.CERT_NONE
+
+    async def _connect(self) -> _Connection:
+        # Like the server, Unix domain sockets don't use TLS
+        ssl_context = self.ssl_context if self.tls and not self.unix_path else None
+        stream = await self._io.connect(self.host, self.port, self.unix_path, ssl_context, self.host)
+        self.size += 1
+        return _Connection(stream)
+
+    async def _close(self, connection: _Connection):
+        self.size -= 1
+        try:
+            await connection.stream.aclose()
+        except (trio.BrokenResourceError, trio.ClosedResourceError, OSError):
+            pass
+
+    async def _checkout(self) -> _Connection:
+        """
+        Returns a healthy idle connection, or a new one
+        """
+
+        while self._idle:
+            connection = self._idle.pop()
+            if not self._io.readable(connection.stream):
+                return connection
+            logging.debug("{Async client} Discarding a connection closed by the server")
+            if self.keep_alive is None and not self._reuse_worked:
+                # The server closed the connection right after answering: it doesn't keep connections alive
+                logging.debug("{Async client} The server doesn't keep connections alive, not pooling them")
+                self.keep_alive = False
+            await self._close(connection)
+        return await self._connect()
+
+    async def _checkin(self, connection: _Connection):
+        """
+        Puts a connection back in the pool, and closes the connections that were idle for too long
+        """
+
+        connection.last_used = now = time.monotonic()
+        if self.keep_alive is False or self._closed or connection.buffer:
+            # Unexpected data after a response means the connection is out of sync
+            await self._close(connection)
+        else:
+            connection.reused = True
+            self._idle.append(connection)
+        while len(self._idle) > self.min_size and now - self._idle[0].last_used > self.idle_timeout:
+            await self._close(self._idle.popleft())
+
+    async def open(self):
+        """
+        Opens ``min_size`` connections in advance
+        """
+
+        self._setup()
+        while self.size < self.min_size:
+            connection = await self._connect()
+            connection.reused = True
+            self._idle.append(connection)
+
+    async def aclose(self):
+        """
+        Closes the idle connections. Connections in use are closed once their request completes
+        """
+
+        self._closed = True
+        while self._idle:
+            await self._close(self._idle.popleft())
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.aclose()
+
+    def encode(self, payload: Union[str, Dict[Any, Any]]) -> bytes:
+        """
+        Returns the complete frame of a request, headers included
+
+        :param payload: The payload, either a dictionary or a valid JSON string
+        :type payload: Union[str, dict]
+        """
+
+        if self.encoding == "json":
+            content = payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload).encode("utf-8")
+        else:
+            content = ziproto.encode(json.loads(payload) if isinstance(payload, str) else payload)
+        return (
+            (len(content) + 2).to_bytes(self.header_size, self.byteorder)
+            + bytes((22, 0 if self.encoding == "json" else 1))
+            + content
+        )
+
+    def decode(self, frame: bytes) -> Dict[Any, Any]:
+        """
+        Decodes a complete response frame, according to its ``Content-Encoding`` header
+        """
+
+        content = frame[self.header_size + 2:]
+        if frame[self.header_size + 1] == 0:
+            return json.loads(content)
+        return ziproto.decode(content)
+
+    async def request(self, payload: Union[str, Dict[Any, Any]], timeout: Optional[float] = None) -> Dict[Any, Any]:
+        """
+        Sends a request and returns the decoded response
+
+        :param payload: The payload, either a dictionary or a valid JSON string
+        :type payload: Union[str, dict]
+        :param timeout: How long to wait for the response, defaults to ``None`` (``self.timeout``)
+        :type timeout: float, optional
+        :raises TimeoutError: If the response doesn't come in time
+        :raises ConnectionError: If the server closed the connection without answering
+        """
+
+        return self.decode(await self.request_raw(self.encode(payload), timeout))
+
+    async def request_raw(self, frame: bytes, timeout: Optional[float] = None) -> bytes:
+        """
+        Sends a complete request frame and returns the complete response frame, headers included
+
+        :param frame: The request frame, see ``encode()``
+        :type frame: bytes
+        :param timeout: How long to wait for the response, defaults to ``None`` (``self.timeout``)
+        :type timeout: float, optional
+        :raises TimeoutError: If the response doesn't come in time
+        :raises ConnectionError: If the server closed the connection without answering
+        """
+
+        self._setup()
+        async with self._slots:
+            return await self._io.timeout(self._request(frame), timeout or self.timeout)
+
+    async def _request(self, frame: bytes) -> bytes:
+        while True:
+            connection = await self._checkout()
+            try:
+                try:
+                    await connection.stream.send_all(frame)
+                except (trio.BrokenResourceError, trio.ClosedResourceError) as error:
+                    raise ConnectionError(f"The connection broke while sending the request -> {error}") from error
+                response = await self._receive(connection)
+            except ConnectionError:
+                await self._close(connection)
+                if connection.reused:
+                    # The server closed the connection before reading the request, try again with a new one
+                    if self.keep_alive is None and not self._reuse_worked:
+                        self.keep_alive = False
+                    continue
+                raise
+            except BaseException:
+                # Timed out or cancelled while the response was on its way: the connection can't be reused
+                await self._close(connection)
+                raise
+            if connection.reused:
+                self._reuse_worked = True
+            await self._checkin(connection)
+            return response
+
+    async def _receive(self, connection: _Connection) -> bytes:
+        """
+        Reads a complete frame, keeping whatever comes after it in ``connection.buffer``
+        """
+
+        buffer = connection.buffer
+        header_size = self.header_size
+        end = None
+        while True:
+            if end is None and len(buffer) >= header_size:
+                end = header_size + int.from_bytes(buffer[:header_size], self.byteorder)
+            if end is not None and len(buffer) >= end:
+                frame = bytes(buffer[:end])
+                del buffer[:end]
+                return frame
+            try:
+                chunk = await connection.stream.receive_some(65536)
+            except (trio.BrokenResourceError, trio.ClosedResourceError) as error:
+                chunk = b""
+                if buffer:
+                    raise ConnectionError(f"The connection broke in the middle of a response -> {error}")
+            if not chunk:
+                if buffer:
+                    raise ConnectionError("The server closed the connection in the middle of a response")
+                # Nothing of the response came through, so the request can safely be sent again on a reused connection
+                raise ConnectionError("The server closed the connection without answering")
+            buffer += chunk
@@ -0,0 +1,514 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import errno
+import functools
+import logging
+import signal
+import socket
+from typing import Union, List
+import trio
+
+
+class TrioBackend:
+    """
+    The default I/O backend, which runs the server on trio
+    """
+
+    name = "trio"
+    Cancelled = trio.Cancelled
+
+    def __init__(self):
+        """
+        Object constructor
+        """
+
+        self._server = None
+        self._accept_scope = None
+        self._drain_scope = None
+        self._slots = None
+
+    def run(self, async_fn):
+        """
+        Runs ``async_fn`` until it completes
+        """
+
+        return trio.run(async_fn)
+
+    async def sleep(self, seconds: float):
+        """
+        Sleeps for the given amount of seconds
+        """
+
+        await trio.sleep(seconds)
+
+    # noinspection PyMethodMayBeStatic
+    def cancel_scope(self) -> trio.CancelScope:
+        """
+        Returns a new cancel scope. Calling ``cancel()`` on it interrupts the code running inside it
+        """
+
+        return trio.CancelScope()
+
+    # noinspection PyMethodMayBeStatic
+    def event(self) -> trio.Event:
+        """
+        Returns a new event, which tasks can wait for until it's set
+        """
+
+        return trio.Event()
+
+    async def run_sync_in_thread(self, sync_fn, *args, cancellable=False, limiter=None):
+        """
+        Runs a blocking function in a worker thread, see ``trio.to_thread.run_sync()``
+        """
+
+        return await trio.to_thread.run_sync(
+            sync_fn, *args, cancellable=cancellable, limiter=limiter
+        )
+
+    # noinspection PyMethodMayBeStatic
+    def get_socket(self, stream: Union[trio.SocketStream, trio.SSLStream]) -> trio.socket.SocketType:
+        """
+        Returns the socket underlying a stream, unwrapping TLS streams
+        """
+
+        if isinstance(stream, trio.SSLStream):
+            stream = stream.transport_stream
+        return stream.socket
+
+    def _make_listener(self, sock: socket.socket):
+        """
+        Wraps a listening socket into a trio listener, adding TLS on top of TCP sockets if it's enabled
+        """
+
+        listener = trio.SocketListener(trio.socket.from_stdlib_socket(sock))
+        context = self._server._get_ssl_context()
+        if context is None or sock.family == socket.AF_UNIX:
+            return listener
+        return trio.SSLListener(listener, context, https_compatible=False)
+
+    async def _handle(self, stream):
+        """
+        Handles a connection and releases its slot when it's done
+        """
+
+        try:
+            await self._server._handle_client(stream)
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    async def _accept(self, listener, nursery: trio.Nursery):
+        """
+        Accepts connections from a listener and starts a task to handle each of them in ``nursery``.
+        If ``max_connections`` is set, no connection is accepted while the limit is reached
+        """
+
+        async with listener:
+            while True:
+                if self._slots is not None:
+                    await self._slots.acquire()
+                try:
+                    stream = await listener.accept()
+                except OSError as error:
+                    if self._slots is not None:
+                        self._slots.release()
+                    if error.errno in (errno.EMFILE, errno.ENFILE, errno.ENOMEM, errno.ENOBUFS):
+                        logging.error(
+                            "{API main} Out of resources while accepting connections, retrying -> %s",
+                            error,
+                        )
+                        await trio.sleep(0.1)
+                        continue
+                    raise
+                except BaseException:
+                    if self._slots is not None:
+                        self._slots.release()
+                    raise
+                nursery.start_soon(self._handle, stream)
+
+    async def _watch_signals(self):
+        """
+        Forwards the signals the server is interested in to ``Server._handle_signal()``
+        """
+
+        with trio.open_signal_receiver(*self._server._get_signals()) as receiver:
+            async for signum in receiver:
+                self._server._handle_signal(signum)
+
+    async def serve(self, server, sockets: List[socket.socket]):
+        """
+        Serves connections from the given listening sockets until the server is drained
+
+        :param server: The server object
+        :type server: class: ``AsyncAPY.server.Server``
+        :param sockets: The listening sockets to accept connections from
+        :type sockets: list
+        """
+
+        self._server = server
+        listeners = [self._make_listener(sock) for sock in sockets]
+        async with trio.open_nursery() as nursery:
+            for task in server._background_tasks():
+                nursery.start_soon(task, self.sleep)
+            nursery.start_soon(self._watch_signals)
+            # Connections run in their own nursery, so that we can stop accepting
+            # new ones without cancelling those that are still being served
+            self._drain_scope = trio.CancelScope()
+            self._accept_scope = trio.CancelScope()
+            if server.max_connections:
+                self._slots = trio.Semaphore(server.max_connections)
+            with self._drain_scope:
+                async with trio.open_nursery() as connections:
+                    with self._accept_scope:
+                        async with trio.open_nursery() as accepting:
+                            for listener in listeners:
+                                accepting.start_soon(self._accept, listener, connections)
+            if self._drain_scope.cancelled_caught:
+                logging.warning("{API main} Drain deadline expired, some connections were cancelled")
+            nursery.cancel_scope.cancel()
+
+    def stop_accepting(self, timeout: float):
+        """
+        Stops accepting new connections and gives the current ones ``timeout`` seconds to complete
+        """
+
+        self._accept_scope.cancel()
+        self._drain_scope.deadline = trio.current_time() + timeout
+
+    def stop(self):
+        """
+        Cancels all connections right away
+        """
+
+        self._drain_scope.cancel()
+
+
+class AsyncioStream:
+    """
+    Adapts a pair of asyncio streams to the subset of trio's stream interface that AsyncAPY
+    uses (``receive_some()``, ``send_all()`` and ``aclose()``), raising trio's exceptions,
+    so that the same connection handling code runs on both backends
+
+    :param reader: The reading end of the connection
+    :type reader: class: ``asyncio.StreamReader``
+    :param writer: The writing end of the connection
+    :type writer: class: ``asyncio.StreamWriter``
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Object constructor
+        """
+
+        self._reader = reader
+        self._writer = writer
+        self._closed = False
+        self.socket = writer.get_extra_info("socket")
+
+    async def receive_some(self, max_bytes: int = 65536) -> bytes:
+        if self._closed:
+            raise trio.ClosedResourceError("this stream was already closed")
+        try:
+            return await self._reader.read(max_bytes)
+        except OSError as error:
+            raise trio.BrokenResourceError(error) from error
+
+    async def send_all(self, data: bytes):
+        if self._closed:
+            raise trio.ClosedResourceError("this stream was already closed")
+        if self._writer.is_closing():
+            raise trio.BrokenResourceError("the connection was closed by the other end")
+        self._writer.write(data)
+        try:
+            await self._writer.drain()
+        except OSError as error:
+            raise trio.BrokenResourceError(error) from error
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+
+
+class AsyncioCancelScope:
+    """
+    A minimal equivalent of ``trio.CancelScope`` for asyncio: calling ``cancel()`` cancels the
+    task that entered the scope, and the resulting ``asyncio.CancelledError`` is swallowed
+    when leaving the scope
+    """
+
+    def __init__(self):
+        """
+        Object constructor
+        """
+
+        self._task = None
+        self.cancel_called = False
+        self.cancelled_caught = False
+
+    def __enter__(self):
+        self._task = asyncio.current_task()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        task, self._task = self._task, None
+        if self.cancel_called and exc_type is not None and issubclass(exc_type, asyncio.CancelledError):
+            self.cancelled_caught = True
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+            return True
+        return False
+
+    def cancel(self):
+        if not self.cancel_called:
+            self.cancel_called = True
+            if self._task is not None:
+                self._task.cancel()
+
+
+class AsyncioBackend:
+    """
+    An I/O backend running the server on asyncio, using uvloop's event loop if it's installed
+
+    :param use_uvloop: If ``False``, the standard asyncio event loop is used even if uvloop is installed,
+    defaults to ``True``
+    :type use_uvloop: bool, optional
+
+    Note that, unlike the trio backend, this backend doesn't stop accepting connections when
+    ``max_connections`` is reached: connections past the limit are accepted, but wait for a free slot
+    before being read from
+    """
+
+    name = "asyncio"
+    Cancelled = asyncio.CancelledError
+
+    def __init__(self, use_uvloop: bool = True):
+        """
+        Object constructor
+        """
+
+        self.use_uvloop = use_uvloop
+        self._server = None
+        self._tasks = set()
+        self._slots = None
+        self._stopping = None
+        self._drain_timeout = None
+        self._forced = False
+        self._interrupted = False
+
+    def _new_event_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Returns a new uvloop event loop if uvloop is installed and enabled, or a standard one
+        """
+
+        if self.use_uvloop:
+            try:
+                import uvloop
+            except ImportError:
+                pass
+            else:
+                return uvloop.new_event_loop()
+        return asyncio.new_event_loop()
+
+    def run(self, async_fn):
+        """
+        Runs ``async_fn`` until it completes
+        """
+
+        loop = self._new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            return loop.run_until_complete(async_fn())
+        finally:
+            try:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                asyncio.set_event_loop(None)
+                loop.close()
+
+    async def sleep(self, seconds: float):
+        """
+        Sleeps for the given amount of seconds
+        """
+
+        await asyncio.sleep(seconds)
+
+    # noinspection PyMethodMayBeStatic
+    def cancel_scope(self) -> AsyncioCancelScope:
+        """
+        Returns a new cancel scope. Calling ``cancel()`` on it interrupts the code running inside it
+        """
+
+        return AsyncioCancelScope()
+
+    # noinspection PyMethodMayBeStatic
+    def event(self) -> asyncio.Event:
+        """
+        Returns a new event, which tasks can wait for until it's set
+        """
+
+        return asyncio.Event()
+
+    async def run_sync_in_thread(self, sync_fn, *args, cancellable=False, limiter=None):
+        """
+        Runs a blocking function in the event loop's default executor. ``cancellable`` and
+        ``limiter`` are only supported by the trio backend, and are ignored
+        """
+
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(sync_fn, *args)
+        )
+
+    # noinspection PyMethodMayBeStatic
+    def get_socket(self, stream: AsyncioStream):
+        """
+        Returns the socket underlying a stream
+        """
+
+        return stream.socket
+
+    async def _client_connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Called by asyncio for every new connection
+        """
+
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            if self._slots is None:
+                await self._server._handle_client(AsyncioStream(reader, writer))
+            else:
+                async with self._slots:
+                    await self._server._handle_client(AsyncioStream(reader, writer))
+        finally:
+            self._tasks.discard(task)
+
+    def _on_signal(self, signum: int):
+        """
+        Handles signals: ``SIGINT`` stops the server right away, the others are
+        forwarded to ``Server._handle_signal()``
+        """
+
+        if signum == signal.SIGINT:
+            self._interrupted = True
+            self.stop()
+        else:
+            self._server._handle_signal(signum)
+
+    async def serve(self, server, sockets: List[socket.socket]):
+        """
+        Serves connections from the given listening sockets until the server is drained
+
+        :param server: The server object
+        :type server: class: ``AsyncAPY.server.Server``
+        :param sockets: The listening sockets to accept connections from
+        :type sockets: list
+        """
+
+        self._server = server
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        if server.max_connections:
+            self._slots = asyncio.Semaphore(server.max_connections)
+        signals = list(server._get_signals())
+        if signal.getsignal(signal.SIGINT) is signal.default_int_handler:
+            # Otherwise, KeyboardInterrupt would be raised outside of the server's main loop
+            signals.append(signal.SIGINT)
+        servers = []
+        background = [loop.create_task(task(self.sleep)) for task in server._background_tasks()]
+        try:
+            for sock in sockets:
+                if sock.family == socket.AF_UNIX:
+                    servers.append(
+                        await asyncio.start_unix_server(self._client_connected, sock=sock, limit=max(server.buf, 2 ** 16))
+                    )
+                else:
+                    servers.append(
+                        await asyncio.start_server(
+                            self._client_connected,
+                            sock=sock,
+                            ssl=server._get_ssl_context(),
+                            backlog=server.backlog or socket.SOMAXCONN,
+                            limit=max(server.buf, 2 ** 16),
+                        )
+                    )
+            for signum in signals:
+                loop.add_signal_handler(signum, self._on_signal, signum)
+            await self._stopping.wait()
+            for srv in servers:
+                srv.close()
+            if self._tasks and not self._forced:
+                _, pending = await asyncio.wait(set(self._tasks), timeout=self._drain_timeout)
+                if pending:
+                    logging.warning("{API main} Drain deadline expired, some connections were cancelled")
+                    self.stop()
+            if self._tasks:
+                await asyncio.wait(set(self._tasks))
+        finally:
+            for signum in signals:
+                loop.remove_signal_handler(signum)
+            for task in background:
+                task.cancel()
+            for srv in servers:
+                srv.close()
+        if self._interrupted:
+            raise KeyboardInterrupt
+
+    def stop_accepting(self, timeout: float):
+        """
+        Stops accepting new connections and gives the current ones ``timeout`` seconds to complete
+        """
+
+        self._drain_timeout = timeout
+        self._stopping.set()
+
+    def stop(self):
+        """
+        Cancels all connections right away
+        """
+
+        self._forced = True
+        for task in self._tasks:
+            task.cancel()
+        self._stopping.set()
+
+
+BACKENDS = {"trio": TrioBackend, "asyncio": AsyncioBackend}
+
+
+def get_backend(backend: Union[str, TrioBackend, AsyncioBackend]):
+    """
+    Returns a backend object given its name (``'trio'`` or ``'asyncio'``). Backend objects are
+    returned as they are
+
+    :raises ValueError: If there is no backend with the given name
+    """
+
+    if not isinstance(backend, str):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {', '.join(map(repr, BACKENDS))}!")
+    return BACKENDS[backend]()
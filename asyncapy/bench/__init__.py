@@ -0,0 +1,26 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Load testing tools for AsyncAPY servers. Run ``python -m asyncapy.bench --help`` for usage
+"""
+
+from .loadgen import LoadGenerator, Result, encode_frame
+from .scenarios import SCENARIOS, Scenario, run_scenario
+
+__all__ = ["LoadGenerator", "Result", "encode_frame", "SCENARIOS", "Scenario", "run_scenario"]
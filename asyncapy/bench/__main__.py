@@ -0,0 +1,71 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+from .loadgen import LoadGenerator
+from .scenarios import SCENARIOS, run_scenario
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m asyncapy.bench",
+        description="Runs load test scenarios against a local AsyncAPY server, or against a running one with --port",
+        epilog="Scenarios: "
+        + "; ".join(f"{name}: {scenario.description}" for name, scenario in SCENARIOS.items()),
+    )
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help="The scenarios to run, defaults to all")
+    parser.add_argument("-c", "--connections", type=int, default=16, help="Concurrent connections (default: 16)")
+    parser.add_argument("-n", "--requests", type=int, default=10000, help="Total requests (default: 10000)")
+    parser.add_argument("-d", "--duration", type=float, help="Stop sending after this many seconds")
+    parser.add_argument("-p", "--pipeline", type=int, default=1, help="Requests in flight per connection (default: 1)")
+    parser.add_argument("-r", "--rate", type=float, help="Send this many requests per second (open loop)")
+    parser.add_argument("-e", "--encoding", choices=("json", "ziproto"), default="json")
+    parser.add_argument("-f", "--fragments", type=int, default=1, help="Write each frame in this many chunks")
+    parser.add_argument("-b", "--backend", help="The I/O backend of the local server")
+    parser.add_argument("--host", default="127.0.0.1", help="The address of a running server")
+    parser.add_argument("--port", type=int, help="Benchmark a running server on this port instead of a local one")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r}, choose from {', '.join(SCENARIOS)}")
+    options = dict(
+        connections=args.connections,
+        requests=args.requests,
+        duration=args.duration,
+        pipeline=args.pipeline,
+        rate=args.rate,
+        fragments=args.fragments,
+    )
+    results = {}
+    for name in args.scenarios:
+        if args.port is None:
+            result = run_scenario(name, encoding=args.encoding, backend=args.backend, **options)
+        else:
+            frames = SCENARIOS[name].frames(args.encoding)
+            result = LoadGenerator(frames, host=args.host, port=args.port, **options).run()
+        results[name] = result.to_dict()
+        if not args.json:
+            print(f"[{name}]\n{result}\n")
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
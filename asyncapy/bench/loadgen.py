@@ -0,0 +1,439 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import json
+import math
+from typing import Any, Dict, Optional, Sequence, Union
+import trio
+import ziproto
+
+
+def encode_frame(
+    payload: Union[Dict[Any, Any], bytes],
+    encoding: str = "json",
+    header_size: int = 4,
+    byteorder: str = "big",
+    protocol_version: int = 22,
+) -> bytes:
+    """
+    Builds an AsyncAProto frame. Frames are encoded once, before the load starts, so that
+    the cost of serializing payloads isn't measured
+
+    :param payload: The payload, either a dictionary or raw bytes that are sent as they are
+    (e.g. to send malformed payloads)
+    :type payload: Union[dict, bytes]
+    :param encoding: The Content-Encoding of the frame, ``'json'`` or ``'ziproto'``, defaults to ``'json'``
+    :type encoding: str, optional
+    :param header_size: The size in bytes of the ``Content-Length`` header, defaults to 4
+    :type header_size: int, optional
+    :param byteorder: The byte order of the ``Content-Length`` header, defaults to ``'big'``
+    :type byteorder: str, optional
+    :param protocol_version: The Protocol-Version header, defaults to 22 (V2)
+    :type protocol_version: int, optional
+    :returns: The complete frame
+    :rtype: bytes
+    """
+
+    if isinstance(payload, dict):
+        if encoding == "json":
+            payload = json.dumps(payload).encode("utf-8")
+        else:
+            payload = ziproto.encode(payload)
+    return (
+        (len(payload) + 2).to_bytes(header_size, byteorder)
+        + bytes((protocol_version, 0 if encoding == "json" else 1))
+        + payload
+    )
+
+
+# Errors after which the server closes the connection
+CLOSING_ERRORS = frozenset(
+    (
+        "ERR_REQUEST_MALFORMED",
+        "ERR_HEADER_INVALID",
+        "ERR_TIMED_OUT",
+        "ERR_SESSION_LIMIT_REACHED",
+        "ERR_FRAME_TOO_LARGE",
+        "ERR_READ_TOO_SLOW",
+        "ERR_MEMORY_BUDGET_EXCEEDED",
+    )
+)
+
+
+def _error_code(payload: bytes, encoding: int) -> Optional[str]:
+    """
+    Returns the ``ERR_*`` code of a response, if it's an error. Error codes are plain
+    strings in both encodings, so responses are only decoded when they look like an error
+    """
+
+    if b"ERR_" not in payload:
+        return None
+    try:
+        decoded = json.loads(payload) if not encoding else ziproto.decode(payload)
+    except Exception:
+        return None
+    if isinstance(decoded, dict) and isinstance(decoded.get("error"), str):
+        return decoded["error"]
+    return None
+
+
+class Result:
+    """
+    The outcome of a load test
+
+    :param latencies: The latency of every response, in seconds
+    :type latencies: list
+    :param sent: The number of requests that were sent
+    :type sent: int
+    :param errors: How many responses carried each ``ERR_*`` code
+    :type errors: dict
+    :param unanswered: The number of requests that never got a response
+    :type unanswered: int
+    :param reconnects: How many times a connection was closed by the server and opened again
+    :type reconnects: int
+    :param elapsed: The duration of the test, in seconds
+    :type elapsed: float
+    """
+
+    def __init__(
+        self,
+        latencies: list,
+        sent: int,
+        errors: Dict[str, int],
+        unanswered: int,
+        reconnects: int,
+        elapsed: float,
+    ):
+        """
+        Object constructor
+        """
+
+        self.latencies = sorted(latencies)
+        self.sent = sent
+        self.errors = errors
+        self.unanswered = unanswered
+        self.reconnects = reconnects
+        self.elapsed = elapsed
+
+    @property
+    def responses(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def throughput(self) -> float:
+        """
+        Responses per second
+        """
+
+        return self.responses / self.elapsed if self.elapsed else 0
+
+    def percentile(self, q: float) -> float:
+        """
+        Returns the ``q``-th percentile (between 0 and 100) of the latencies, in seconds,
+        or ``math.nan`` if no response was received
+        """
+
+        if not self.latencies:
+            return math.nan
+        return self.latencies[min(math.ceil(len(self.latencies) * q / 100) - 1, len(self.latencies) - 1)]
+
+    def to_dict(self) -> dict:
+        """
+        Returns a summary of the result as a dictionary. Latencies are in microseconds
+        """
+
+        return {
+            "sent": self.sent,
+            "responses": self.responses,
+            "errors": dict(self.errors),
+            "unanswered": self.unanswered,
+            "reconnects": self.reconnects,
+            "elapsed": round(self.elapsed, 6),
+            "throughput": round(self.throughput, 1),
+            "latency": {
+                name: round(self.percentile(q) * 1e6, 1) if self.latencies else None
+                for name, q in (("p50", 50), ("p99", 99), ("p999", 99.9), ("max", 100))
+            },
+        }
+
+    def __str__(self):
+        """
+        Returns a human readable report
+        """
+
+        summary = self.to_dict()
+        latency = summary["latency"]
+        lines = [
+            f"{self.sent} requests, {self.responses} responses in {self.elapsed:.2f}s "
+            f"({self.throughput:.0f} req/s)",
+        ]
+        if self.latencies:
+            lines.append(
+                f"latency p50 {latency['p50']:.0f}us, p99 {latency['p99']:.0f}us, "
+                f"p999 {latency['p999']:.0f}us, max {latency['max']:.0f}us"
+            )
+        if self.errors:
+            lines.append("errors: " + ", ".join(f"{code} x{count}" for code, count in sorted(self.errors.items())))
+        if self.unanswered or self.reconnects:
+            lines.append(f"{self.unanswered} unanswered request(s), {self.reconnects} reconnect(s)")
+        return "\n".join(lines)
+
+
+class LoadGenerator:
+    """
+    Generates load against an AsyncAPY server over many concurrent connections.
+
+    In closed-loop mode (the default), every connection keeps ``pipeline`` requests in flight and
+    sends a new one as soon as a response arrives, so the offered load adapts to the server's speed.
+    In open-loop mode (``rate`` is set), requests are sent on a fixed schedule no matter how fast
+    the server answers, which is how real clients behave: latency is then measured from the time
+    each request *should* have been sent, so that a stalled server can't hide its backlog
+    (coordinated omission).
+
+    Responses are matched to requests in order, which is how the server answers pipelined requests
+    on the same connection. When the server closes a connection, as it does after most error
+    responses (see ``CLOSING_ERRORS``), the requests still in flight on it are counted as unanswered
+    and a new connection is opened
+
+    :param frames: Pre-encoded frames (see ``encode_frame()``), sent in a round-robin fashion
+    :type frames: Sequence[bytes]
+    :param host: The address of the server, defaults to ``'127.0.0.1'``
+    :type host: str, optional
+    :param port: The port of the server, defaults to 1500
+    :type port: int, optional
+    :param unix_path: If set, connects to this unix socket instead of ``host:port``, defaults to ``None``
+    :type unix_path: str, optional
+    :param connections: The number of concurrent connections, defaults to 16
+    :type connections: int, optional
+    :param pipeline: How many requests each connection may have in flight in closed-loop mode, defaults to 1
+    :type pipeline: int, optional
+    :param rate: The total number of requests per second in open-loop mode, defaults to ``None`` (closed loop)
+    :type rate: float, optional
+    :param requests: How many requests to send in total, defaults to 10000
+    :type requests: int, optional
+    :param duration: If set, the test stops sending after this many seconds, even if fewer
+    than ``requests`` requests were sent, defaults to ``None``
+    :type duration: float, optional
+    :param fragments: Each frame is written in this many separate chunks, to exercise the server's
+    stream rebuilding code, defaults to 1 (no fragmentation)
+    :type fragments: int, optional
+    :param header_size: The size in bytes of the ``Content-Length`` header, defaults to 4
+    :type header_size: int, optional
+    :param byteorder: The byte order of the ``Content-Length`` header, defaults to ``'big'``
+    :type byteorder: str, optional
+    :param response_timeout: How long to wait for outstanding responses once everything was sent, defaults to 5
+    :type response_timeout: float, optional
+    """
+
+    def __init__(
+        self,
+        frames: Sequence[bytes],
+        host: str = "127.0.0.1",
+        port: int = 1500,
+        unix_path: Optional[str] = None,
+        connections: int = 16,
+        pipeline: int = 1,
+        rate: Optional[float] = None,
+        requests: int = 10000,
+        duration: Optional[float] = None,
+        fragments: int = 1,
+        header_size: int = 4,
+        byteorder: str = "big",
+        response_timeout: float = 5,
+    ):
+        """
+        Object constructor
+        """
+
+        if not frames:
+            raise ValueError("At least one frame is needed!")
+        if connections < 1 or pipeline < 1 or fragments < 1:
+            raise ValueError("connections, pipeline and fragments must be at least 1!")
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive!")
+        self.frames = list(frames)
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.connections = connections
+        self.pipeline = pipeline
+        self.rate = rate
+        self.requests = requests
+        self.duration = duration
+        self.fragments = fragments
+        self.header_size = header_size
+        self.byteorder = byteorder
+        self.response_timeout = response_timeout
+
+    def run(self) -> Result:
+        """
+        Runs the load test and returns its result
+        """
+
+        return trio.run(self.run_async)
+
+    async def run_async(self) -> Result:
+        """
+        Runs the load test from an existing trio event loop
+        """
+
+        self._claimed = 0
+        self._latencies = []
+        self._errors = collections.Counter()
+        self._sent = 0
+        self._unanswered = 0
+        self._reconnects = 0
+        self._start = trio.current_time()
+        self._deadline = self._start + self.duration if self.duration else math.inf
+        async with trio.open_nursery() as nursery:
+            for _ in range(self.connections):
+                nursery.start_soon(self._connection)
+        return Result(
+            self._latencies,
+            self._sent,
+            self._errors,
+            self._unanswered,
+            self._reconnects,
+            trio.current_time() - self._start,
+        )
+
+    def _next_request(self) -> Optional[int]:
+        """
+        Claims the sequence number of the next request, or returns ``None`` if the test is over
+        """
+
+        if self._over():
+            return None
+        self._claimed += 1
+        return self._claimed - 1
+
+    def _over(self) -> bool:
+        return self._claimed >= self.requests or trio.current_time() >= self._deadline
+
+    async def _connect(self) -> trio.abc.Stream:
+        if self.unix_path:
+            return await trio.open_unix_socket(self.unix_path)
+        return await trio.open_tcp_stream(self.host, self.port)
+
+    async def _connection(self):
+        """
+        Drives a single connection, opening a new one whenever the server closes it
+        """
+
+        while True:
+            stream = await self._connect()
+            # Send times of the requests in flight, in the order they were sent
+            in_flight = collections.deque()
+            state = {"done": False}
+            # In open-loop mode, requests are sent no matter how many are in flight
+            slots = trio.Semaphore(self.pipeline) if self.rate is None else None
+            async with stream:
+                async with trio.open_nursery() as nursery:
+                    nursery.start_soon(self._write, stream, in_flight, slots, state, nursery.cancel_scope)
+                    await self._read(stream, in_flight, slots, state)
+                    nursery.cancel_scope.cancel()
+            self._unanswered += len(in_flight)
+            if state["done"] or self._over():
+                return
+            self._reconnects += 1
+
+    async def _write(self, stream, in_flight, slots, state, cancel_scope):
+        """
+        Sends requests on a connection until the test is over
+        """
+
+        frames = self.frames
+        while True:
+            if slots is not None:
+                await slots.acquire()
+            sequence = self._next_request()
+            if sequence is None:
+                break
+            frame = frames[sequence % len(frames)]
+            if self.rate is not None:
+                # Request n is due at start + n / rate, on whichever connection claimed it
+                scheduled = self._start + sequence / self.rate
+                await trio.sleep_until(scheduled)
+            else:
+                scheduled = trio.current_time()
+            in_flight.append(scheduled)
+            self._sent += 1
+            try:
+                if self.fragments == 1:
+                    await stream.send_all(frame)
+                else:
+                    size = math.ceil(len(frame) / self.fragments)
+                    for offset in range(0, len(frame), size):
+                        await stream.send_all(frame[offset:offset + size])
+                        # Gives the kernel a chance to send the fragment on its own
+                        await trio.sleep(0)
+            except (trio.BrokenResourceError, trio.ClosedResourceError):
+                # The server closed the connection, the reader will notice
+                return
+        state["done"] = True
+        if not in_flight:
+            cancel_scope.cancel()
+
+    async def _read(self, stream, in_flight, slots, state):
+        """
+        Receives responses on a connection and records their latency
+        """
+
+        header_size = self.header_size
+        byteorder = self.byteorder
+        buffer = b""
+        drain_deadline = None
+        while True:
+            if state["done"] and not in_flight:
+                return
+            if state["done"] and drain_deadline is None:
+                drain_deadline = trio.current_time() + self.response_timeout
+            with trio.move_on_after(
+                drain_deadline - trio.current_time() if drain_deadline is not None else math.inf
+            ):
+                try:
+                    chunk = await stream.receive_some(65536)
+                except (trio.BrokenResourceError, trio.ClosedResourceError):
+                    chunk = b""
+                if not chunk:
+                    return
+                buffer += chunk
+                now = trio.current_time()
+                while len(buffer) >= header_size:
+                    length = int.from_bytes(buffer[:header_size], byteorder)
+                    end = header_size + length
+                    if len(buffer) < end:
+                        break
+                    frame, buffer = buffer[header_size:end], buffer[end:]
+                    if not in_flight:
+                        # A response nobody asked for, e.g. ERR_TIMED_OUT
+                        error = _error_code(frame[2:], frame[1] if len(frame) > 1 else 0)
+                        self._errors[error or "unexpected"] += 1
+                        continue
+                    self._latencies.append(now - in_flight.popleft())
+                    error = _error_code(frame[2:], frame[1] if len(frame) > 1 else 0)
+                    if error is not None:
+                        self._errors[error] += 1
+                        if error in CLOSING_ERRORS:
+                            return
+                    if slots is not None:
+                        slots.release()
+                continue
+            # The drain deadline expired
+            return
@@ -0,0 +1,367 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Micro-benchmarks for the primitives every request goes through. Results can be saved
+as a JSON baseline, and later runs compared against it, failing when a primitive got
+slower than the baseline by more than a tolerance.
+Usage: python -m asyncapy.bench.micro [names] [--save PATH] [--baseline PATH] [--tolerance 0.25]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import timeit
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+import ziproto
+from ..cache import ResponseCache
+from ..core import Client, Handler, Packet
+from ..filters import Filters
+from ..server import Server
+from ..util import APIKeyFactory, SQLiteAPIKeyFactory
+
+
+# Name -> function doing the setup and returning the callable to time
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """
+    Registers a benchmark. The decorated function performs the setup
+    and returns the callable that is actually timed
+    """
+
+    def wrapper(setup: Callable[[], Callable[[], object]]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return wrapper
+
+
+def _run_sync(coroutine):
+    """
+    Runs a coroutine that never actually suspends (e.g. one writing to a ``_NullStream``)
+    to completion without an event loop, so that loop overhead isn't measured
+    """
+
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError("The benchmarked coroutine suspended!")
+
+
+class _NullStream:
+    """
+    A stream that discards everything that is sent to it
+    """
+
+    async def send_all(self, data: bytes):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+def _server() -> Server:
+    return Server(logging_level=logging.WARNING)
+
+
+def _client(server: Server, encoding: str = "json") -> Client:
+    return Client("127.0.0.1", server, _NullStream(), str(uuid.uuid4()), encoding)
+
+
+PAYLOAD = {"request_type": "get_user", "user_id": "1234", "fields": ["name", "email"], "verbose": False}
+
+
+@benchmark("packet_from_dict")
+def _packet_from_dict():
+    return lambda: Packet(PAYLOAD, encoding="json")
+
+
+@benchmark("packet_from_bytes")
+def _packet_from_bytes():
+    raw = json.dumps(PAYLOAD).encode("utf-8")
+    return lambda: Packet(raw, encoding="json")
+
+
+@benchmark("fields_check")
+def _fields_check():
+    fields = Filters.Fields(request_type=r"^get_user$", user_id=r"^\d+$", fields=None, verbose=None)
+    packet = Packet(PAYLOAD, encoding="json")
+    return lambda: fields.check(None, packet)
+
+
+@benchmark("handler_check")
+def _handler_check():
+    server = _server()
+    client = _client(server)
+    packet = Packet(PAYLOAD, encoding="json", sender=client)
+
+    async def handler(client, packet):
+        pass
+
+    handler = Handler(
+        handler,
+        [Filters.Ip("127.0.0.1"), Filters.Fields(request_type=r"^get_user$", user_id=None, fields=None, verbose=None)],
+    )
+    return lambda: handler.check(client, packet)
+
+
+def _dispatch(handlers: int):
+    server = _server()
+    client = _client(server)
+
+    for index in range(handlers):
+
+        async def handler(client, packet):
+            pass
+
+        handler.__name__ = f"handler_{index}"
+        server.register_handler(
+            handler, Filters.Fields(request_type=f"^type_{index}$", user_id=None, fields=None, verbose=None)
+        )
+    # The request matches the last handler, so dispatching it checks all of them
+    packet = Packet(dict(PAYLOAD, request_type=f"type_{handlers - 1}"), encoding="json", sender=client)
+    session_id = uuid.uuid4()
+    return lambda: _run_sync(server._dispatch(session_id, client, packet))
+
+
+for _handlers in (1, 10, 100):
+    benchmark(f"dispatch_{_handlers}_handlers")(lambda handlers=_handlers: _dispatch(handlers))
+
+
+@benchmark("rate_limit_check")
+def _rate_limit_check():
+    server = _server()
+    client = _client(server)
+    packet = Packet(PAYLOAD, encoding="json", sender=client)
+    # A limit that is never hit, tracking as many keys as it can hold
+    rate_limit = Filters.RateLimit(1e9, key=lambda c, p: c, max_keys=10000)
+    for _ in range(10000):
+        rate_limit.check(_client(server), packet)
+    return lambda: rate_limit.check(client, packet)
+
+
+@benchmark("apikey_quota_check")
+def _apikey_quota_check():
+    # Usage is counted in memory and flushed to the sink by a background thread
+    factory = APIKeyFactory(usage_sink=lambda period, counts: None, default_quota=10 ** 12)
+    key = factory.issue()
+    api_filter = Filters.APIFactory(factory, "api_key")
+    packet = Packet({"api_key": key}, encoding="json")
+    return lambda: api_filter.check(None, packet)
+
+
+@benchmark("apikey_lookup_sqlite")
+def _apikey_lookup_sqlite():
+    path = os.path.join(tempfile.mkdtemp(), "keys.db")
+    factory = SQLiteAPIKeyFactory(path)
+    factory.issue_many(10000)
+    key = factory.issue({"user_id": 1234})
+    api_filter = Filters.APIFactory(factory, "api_key")
+    packet = Packet({"api_key": key}, encoding="json")
+    # Served from the in-memory cache after the first lookup, like a hot key would be
+    api_filter.check(None, packet)
+    return lambda: api_filter.check(None, packet)
+
+
+@benchmark("response_cache_lookup")
+def _response_cache_lookup():
+    cache = ResponseCache()
+    key = cache.key(PAYLOAD, "json")
+    cache.put(key, b"\x00" * 64, 3600)
+    # Hashing the decoded request and finding its frames, all a cache hit does before sending them
+    return lambda: cache.get(cache.key(PAYLOAD, "json"))
+
+
+@benchmark("parse_packet")
+def _parse_packet():
+    server = _server()
+    # The frame without its Content-Length header, as _parse_packet receives it
+    raw = bytes((22, 0)) + json.dumps(PAYLOAD).encode("utf-8")
+    session_id = uuid.uuid4()
+    stream = _NullStream()
+    return lambda: _run_sync(server._parse_packet(session_id, raw, stream))
+
+
+@benchmark("parse_header")
+def _parse_header():
+    server = _server()
+    frame = (100).to_bytes(server.header_size, server.byteorder) + bytes((22, 0)) + b"{}"
+    header_size, byteorder = server.header_size, server.byteorder
+    # The same slicing and conversion _handle_client performs on every frame
+    return lambda: int.from_bytes(frame[:header_size], byteorder)
+
+
+def _decode_payload(encoding: int):
+    server = _server()
+    content = json.dumps(PAYLOAD).encode("utf-8") if not encoding else ziproto.encode(PAYLOAD)
+    session_id = uuid.uuid4()
+    stream = _NullStream()
+    return lambda: _run_sync(server._decode_payload(content, session_id, stream, encoding=encoding))
+
+
+benchmark("decode_payload_json")(lambda: _decode_payload(0))
+benchmark("decode_payload_ziproto")(lambda: _decode_payload(1))
+
+
+def _send(encoding: str):
+    server = _server()
+    client = _client(server, encoding)
+    packet = Packet(PAYLOAD, encoding=encoding)
+    # Building the response headers and payload, then handing them to Server._send()
+    return lambda: _run_sync(client.send(packet))
+
+
+benchmark("send_json")(lambda: _send("json"))
+benchmark("send_ziproto")(lambda: _send("ziproto"))
+
+
+@benchmark("apikey_issue")
+def _apikey_issue():
+    factory = APIKeyFactory()
+    return factory.issue
+
+
+@benchmark("apikey_lookup")
+def _apikey_lookup():
+    factory = APIKeyFactory()
+    for _ in range(10000):
+        factory.issue()
+    key = factory.issue({"user_id": 1234})
+    api_filter = Filters.APIFactory(factory, "api_key")
+    packet = Packet({"api_key": key}, encoding="json")
+    return lambda: api_filter.check(None, packet)
+
+
+def measure(function: Callable[[], object], repeat: int = 5, min_time: float = 0.2) -> float:
+    """
+    Times a callable and returns the best time per call, in nanoseconds. Every one of the ``repeat``
+    rounds runs the callable enough times to last at least ``min_time`` seconds
+
+    :param function: The callable to time
+    :type function: Callable
+    :param repeat: How many rounds are run, defaults to 5
+    :type repeat: int, optional
+    :param min_time: The minimum duration of a round, in seconds, defaults to 0.2
+    :type min_time: float, optional
+    :returns: The time per call of the fastest round, in nanoseconds
+    :rtype: float
+    """
+
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(int(number * min_time / elapsed), 1)
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def run(names: Optional[Iterable[str]] = None, repeat: int = 5, min_time: float = 0.2) -> Dict[str, float]:
+    """
+    Runs the given benchmarks (all of them by default) and returns the time per
+    call of each of them, in nanoseconds
+
+    :raises KeyError: If there is no benchmark with one of the given names
+    """
+
+    results = {}
+    for name in names or BENCHMARKS:
+        results[name] = measure(BENCHMARKS[name](), repeat, min_time)
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float = 0.25) -> List[str]:
+    """
+    Compares results with a baseline and returns the names of the benchmarks that got slower
+    by more than ``tolerance`` (e.g. 0.25 for 25%). Benchmarks missing from either side are ignored
+    """
+
+    return [
+        name
+        for name, elapsed in results.items()
+        if name in baseline and elapsed > baseline[name] * (1 + tolerance)
+    ]
+
+
+def save(results: Dict[str, float], path: str):
+    """
+    Saves results as a JSON baseline, along with the interpreter and machine they were measured on
+    """
+
+    with open(path, "w") as baseline:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "machine": platform.machine(),
+                "results": {name: round(elapsed, 2) for name, elapsed in results.items()},
+            },
+            baseline,
+            indent=2,
+        )
+        baseline.write("\n")
+
+
+def load(path: str) -> Dict[str, float]:
+    """
+    Loads the results saved in a JSON baseline
+    """
+
+    with open(path) as baseline:
+        return json.load(baseline)["results"]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m asyncapy.bench.micro", description=__doc__.strip().split("\n")[0])
+    parser.add_argument("names", nargs="*", help=f"The benchmarks to run, defaults to all: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--save", metavar="PATH", help="Save the results as a JSON baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare the results with a JSON baseline")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="Allowed slowdown over the baseline (default: 0.25, i.e. 25%%)"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Rounds per benchmark, the fastest is kept (default: 5)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum duration of a round (default: 0.2s)")
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name!r}")
+    baseline = load(args.baseline) if args.baseline else {}
+    results = {}
+    for name in args.names or BENCHMARKS:
+        results[name] = elapsed = run([name], args.repeat, args.min_time)[name]
+        line = f"{name:<28}{elapsed:>12.1f}ns"
+        if name in baseline:
+            line += f"  {(elapsed / baseline[name] - 1) * 100:+7.1f}% vs baseline"
+        print(line)
+    if args.save:
+        save(results, args.save)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Replays a traffic capture (see ``Server(capture=...)``) against a server, either
+at the original timing (optionally sped up) or as fast as possible.
+Usage: python -m asyncapy.bench.replay CAPTURE [--port PORT] [--speed FACTOR | --max-speed]
+"""
+
+import argparse
+import collections
+import json
+import math
+from typing import Optional
+import trio
+from ..capture import CaptureReader, REQUEST, CLOSE
+from .loadgen import Result, _error_code
+
+
+class Replayer:
+    """
+    Replays the requests of a capture. Every captured connection is replayed on its own connection,
+    and its requests are sent in the order they were captured. At the original timing, each request
+    is sent at the same offset from the start as in the capture (divided by ``speed``) and its latency
+    is measured from that moment, so that a slow server can't delay the schedule. At maximum speed,
+    requests are sent as soon as possible and pipelined on their connection
+
+    :param path: The path of the capture file
+    :type path: str
+    :param host: The address of the server, defaults to ``'127.0.0.1'``
+    :type host: str, optional
+    :param port: The port of the server, defaults to 1500
+    :type port: int, optional
+    :param unix_path: If set, connects to this unix socket instead of ``host:port``, defaults to ``None``
+    :type unix_path: str, optional
+    :param speed: How much faster than the original the capture is replayed, or ``None`` to replay it
+    as fast as possible, defaults to 1 (the original timing)
+    :type speed: float, optional
+    :param header_size: The size in bytes of the ``Content-Length`` header, defaults to 4
+    :type header_size: int, optional
+    :param byteorder: The byte order of the ``Content-Length`` header, defaults to ``'big'``
+    :type byteorder: str, optional
+    :param response_timeout: How long to wait for outstanding responses before closing a connection,
+    defaults to 5
+    :type response_timeout: float, optional
+    """
+
+    def __init__(
+        self,
+        path: str,
+        host: str = "127.0.0.1",
+        port: int = 1500,
+        unix_path: Optional[str] = None,
+        speed: Optional[float] = 1,
+        header_size: int = 4,
+        byteorder: str = "big",
+        response_timeout: float = 5,
+    ):
+        """
+        Object constructor
+        """
+
+        if speed is not None and speed <= 0:
+            raise ValueError("speed must be positive!")
+        self.path = path
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.speed = speed
+        self.header_size = header_size
+        self.byteorder = byteorder
+        self.response_timeout = response_timeout
+
+    def run(self) -> Result:
+        """
+        Replays the capture and returns the result
+        """
+
+        return trio.run(self.run_async)
+
+    async def run_async(self) -> Result:
+        """
+        Replays the capture from an existing trio event loop
+        """
+
+        self._latencies = []
+        self._errors = collections.Counter()
+        self._sent = 0
+        self._unanswered = 0
+        self._reconnects = 0
+        start = trio.current_time()
+        with CaptureReader(self.path) as capture:
+            async with trio.open_nursery() as nursery:
+                # Connection ID -> the channel its requests are sent through
+                connections = {}
+                # The replay starts with the first request, skipping the time the captured server was idle
+                first = None
+                for record in capture:
+                    if record.kind == REQUEST:
+                        if first is None:
+                            first = record.offset
+                        if self.speed is None:
+                            scheduled = None
+                        else:
+                            scheduled = start + (record.offset - first) / 1e9 / self.speed
+                            await trio.sleep_until(scheduled)
+                        if record.connection not in connections:
+                            send_channel, receive_channel = trio.open_memory_channel(math.inf)
+                            connections[record.connection] = send_channel
+                            nursery.start_soon(self._connection, receive_channel)
+                        connections[record.connection].send_nowait((scheduled, record.frame))
+                    elif record.kind == CLOSE and record.connection in connections:
+                        # Captured connection IDs are never reused, but a capture may contain
+                        # several workers' connections if captures were concatenated
+                        await connections.pop(record.connection).aclose()
+                for send_channel in connections.values():
+                    await send_channel.aclose()
+        return Result(
+            self._latencies,
+            self._sent,
+            self._errors,
+            self._unanswered,
+            self._reconnects,
+            trio.current_time() - start,
+        )
+
+    async def _connect(self) -> trio.abc.Stream:
+        if self.unix_path:
+            return await trio.open_unix_socket(self.unix_path)
+        return await trio.open_tcp_stream(self.host, self.port)
+
+    async def _connection(self, requests: trio.MemoryReceiveChannel):
+        """
+        Replays a single captured connection, opening a new one whenever the server closes it
+        """
+
+        async with requests:
+            pending = None
+            while True:
+                connection = _Connection(await self._connect())
+                async with connection.stream:
+                    async with trio.open_nursery() as nursery:
+                        nursery.start_soon(self._read, connection)
+                        try:
+                            while True:
+                                if pending is None:
+                                    try:
+                                        pending = await requests.receive()
+                                    except trio.EndOfChannel:
+                                        break
+                                if connection.closed.is_set():
+                                    break
+                                scheduled, frame = pending
+                                connection.in_flight.append(
+                                    trio.current_time() if scheduled is None else scheduled
+                                )
+                                self._sent += 1
+                                pending = None
+                                await connection.stream.send_all(frame)
+                        except (trio.BrokenResourceError, trio.ClosedResourceError):
+                            pass
+                        with trio.move_on_after(self.response_timeout):
+                            await connection.wait_answered()
+                        nursery.cancel_scope.cancel()
+                self._unanswered += len(connection.in_flight)
+                if pending is None and not connection.closed.is_set():
+                    return
+                if pending is None:
+                    # The server closed the connection: reopen it only if there are more requests
+                    try:
+                        pending = await requests.receive()
+                    except trio.EndOfChannel:
+                        return
+                self._reconnects += 1
+
+    async def _read(self, connection: "_Connection"):
+        """
+        Receives responses and records their latency
+        """
+
+        stream = connection.stream
+        in_flight = connection.in_flight
+        header_size = self.header_size
+        byteorder = self.byteorder
+        buffer = b""
+        try:
+            while True:
+                chunk = await stream.receive_some(65536)
+                if not chunk:
+                    break
+                buffer += chunk
+                now = trio.current_time()
+                while len(buffer) >= header_size:
+                    end = header_size + int.from_bytes(buffer[:header_size], byteorder)
+                    if len(buffer) < end:
+                        break
+                    frame, buffer = buffer[header_size:end], buffer[end:]
+                    error = _error_code(frame[2:], frame[1] if len(frame) > 1 else 0)
+                    if error is not None:
+                        self._errors[error] += 1
+                    if in_flight:
+                        self._latencies.append(now - in_flight.popleft())
+                if not in_flight:
+                    connection.answered.set()
+        except (trio.BrokenResourceError, trio.ClosedResourceError):
+            pass
+        connection.closed.set()
+        connection.answered.set()
+
+
+class _Connection:
+    """
+    The state of a connection being replayed
+    """
+
+    def __init__(self, stream: trio.abc.Stream):
+        self.stream = stream
+        # The times the requests waiting for a response were due, in the order they were sent
+        self.in_flight = collections.deque()
+        # Set once the server closes the connection
+        self.closed = trio.Event()
+        # Set whenever no request is waiting for a response
+        self.answered = trio.Event()
+
+    async def wait_answered(self):
+        """
+        Waits until every request got a response, or the server closed the connection
+        """
+
+        while self.in_flight and not self.closed.is_set():
+            # Events can't be cleared in trio, so a fresh one is created for every wait
+            self.answered = trio.Event()
+            await self.answered.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m asyncapy.bench.replay", description=__doc__.strip().split("\n")[0])
+    parser.add_argument("capture", help="The capture file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1500)
+    parser.add_argument("--unix", metavar="PATH", help="Connect to this unix socket instead")
+    speed = parser.add_mutually_exclusive_group()
+    speed.add_argument("--speed", type=float, default=1, help="Replay this many times faster (default: 1)")
+    speed.add_argument("--max-speed", action="store_true", help="Replay as fast as possible")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args()
+    result = Replayer(
+        args.capture,
+        host=args.host,
+        port=args.port,
+        unix_path=args.unix,
+        speed=None if args.max_speed else args.speed,
+    ).run()
+    print(json.dumps(result.to_dict(), indent=2) if args.json else result)
+
+
+if __name__ == "__main__":
+    main()
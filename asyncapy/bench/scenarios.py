@@ -0,0 +1,217 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import multiprocessing
+import socket
+import time
+from typing import Callable, List, Optional
+from ..filters import Filters
+from ..server import Server
+from .loadgen import LoadGenerator, Result, encode_frame
+
+
+class Scenario:
+    """
+    A reproducible benchmark: the handlers a server is set up with, and the
+    requests that are sent to it
+
+    :param name: The name of the scenario
+    :type name: str
+    :param description: What the scenario measures
+    :type description: str
+    :param setup: A function that registers the scenario's handlers on a ``Server``
+    :type setup: Callable
+    :param payloads: A function returning the payloads to send, each either a dictionary
+    or a complete pre-encoded frame (``bytes``). It's called with the chosen encoding
+    :type payloads: Callable
+    :param server_options: Keyword arguments for ``Server``, defaults to ``None``
+    :type server_options: dict, optional
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        setup: Callable,
+        payloads: Callable,
+        server_options: Optional[dict] = None,
+    ):
+        """
+        Object constructor
+        """
+
+        self.name = name
+        self.description = description
+        self.setup = setup
+        self.payloads = payloads
+        self.server_options = server_options or {}
+
+    def frames(self, encoding: str = "json") -> List[bytes]:
+        """
+        Returns the scenario's requests as encoded frames
+        """
+
+        return [
+            payload if isinstance(payload, bytes) else encode_frame(payload, encoding)
+            for payload in self.payloads(encoding)
+        ]
+
+    def __repr__(self):
+        return f"Scenario({self.name!r})"
+
+
+def _echo_setup(server: Server):
+    @server.add_handler()
+    async def echo(client, packet):
+        await client.send(packet)
+
+
+def _echo_payloads(_):
+    return [{"request_type": "echo", "foo": "bar"}]
+
+
+# How many handlers the filtered dispatch scenario registers
+FILTERED_HANDLERS = 32
+
+
+def _filtered_setup(server: Server):
+    for index in range(FILTERED_HANDLERS):
+
+        async def handler(client, packet):
+            await client.send(packet)
+
+        handler.__name__ = f"handler_{index}"
+        server.register_handler(handler, Filters.Fields(request_type=f"^type_{index}$", user_id=r"^\d+$"))
+
+
+def _filtered_payloads(_):
+    # Requests are spread evenly across handlers, so dispatch checks half of the filters on average
+    return [
+        {"request_type": f"type_{index}", "user_id": str(1000 + index)}
+        for index in range(FILTERED_HANDLERS)
+    ]
+
+
+# The size in bytes of the payloads of the large payloads scenario
+LARGE_PAYLOAD_SIZE = 256 * 1024
+
+
+def _large_payloads(_):
+    return [{"request_type": "echo", "data": "x" * LARGE_PAYLOAD_SIZE}]
+
+
+def _error_payloads(encoding):
+    # The server answers each of these with an error and closes the connection, so this
+    # also measures how fast connections are set up and torn down
+    return [
+        encode_frame(b"{not json", "json"),
+        encode_frame(b"\xc1", "ziproto"),
+        encode_frame({"request_type": "echo"}, encoding, protocol_version=11),
+    ]
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario("echo", "A single handler echoing a small payload", _echo_setup, _echo_payloads),
+        Scenario(
+            "filtered",
+            f"{FILTERED_HANDLERS} handlers guarded by Fields filters, requests spread across all of them",
+            _filtered_setup,
+            _filtered_payloads,
+        ),
+        Scenario(
+            "large",
+            f"A single handler echoing {LARGE_PAYLOAD_SIZE // 1024} KiB payloads",
+            _echo_setup,
+            _large_payloads,
+        ),
+        Scenario(
+            "errors",
+            "Malformed payloads and invalid headers, each answered with an error",
+            _echo_setup,
+            _error_payloads,
+            # Every error is logged, which would flood the output
+            {"logging_level": logging.CRITICAL},
+        ),
+    )
+}
+
+
+def _serve(scenario: str, port: int, backend: Optional[str], server_options: dict):
+    options = {"port": port, "keep_alive": True, "logging_level": logging.WARNING}
+    options.update(SCENARIOS[scenario].server_options)
+    options.update(server_options)
+    server = Server(**options)
+    SCENARIOS[scenario].setup(server)
+    server.start(backend=backend)
+
+
+def _wait_for_port(addr: str, port: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((addr, port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def run_scenario(
+    name: str,
+    encoding: str = "json",
+    port: int = 1520,
+    backend: Optional[str] = None,
+    server_options: Optional[dict] = None,
+    **options,
+) -> Result:
+    """
+    Starts a local server in a separate process, set up for the given scenario,
+    and runs a load test against it
+
+    :param name: The name of the scenario, one of ``SCENARIOS``
+    :type name: str
+    :param encoding: The encoding of the requests, ``'json'`` or ``'ziproto'``, defaults to ``'json'``
+    :type encoding: str, optional
+    :param port: The port the server listens on, defaults to 1520
+    :type port: int, optional
+    :param backend: The I/O backend of the server, defaults to ``None`` (the server's default)
+    :type backend: str, optional
+    :param server_options: Extra keyword arguments for ``Server``, defaults to ``None``
+    :type server_options: dict, optional
+    :param options: Keyword arguments for ``LoadGenerator`` (e.g. ``connections``, ``pipeline``, ``rate``)
+    :returns: The result of the load test
+    :rtype: class: ``Result``
+    :raises KeyError: If there is no scenario with the given name
+    """
+
+    scenario = SCENARIOS[name]
+    frames = scenario.frames(encoding)
+    server = multiprocessing.Process(
+        target=_serve, args=(name, port, backend, server_options or {}), daemon=True
+    )
+    server.start()
+    try:
+        _wait_for_port("127.0.0.1", port)
+        return LoadGenerator(frames, host="127.0.0.1", port=port, **options).run()
+    finally:
+        server.terminate()
+        server.join()
@@ -0,0 +1,241 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import hashlib
+import json
+import time
+from typing import Optional, Tuple
+
+
+class Cache:
+    """
+    The caching policy of a handler, see ``Server.add_handler(cache=...)``. Only handlers whose responses
+    are a pure function of the request's fields (and of the client's IP, with ``by_ip``) should be cached
+
+    :param ttl: How long (in seconds) a response is served from the cache
+    :type ttl: float
+    :param by_ip: If ``True``, responses are cached separately for every client IP, defaults to ``False``
+    :type by_ip: bool, optional
+    """
+
+    def __init__(self, ttl: float, by_ip: bool = False):
+        """
+        Object constructor
+        """
+
+        if not isinstance(ttl, (int, float)) or ttl <= 0:
+            raise ValueError("ttl must be a positive number!")
+        self.ttl = ttl
+        self.by_ip = by_ip
+
+    def __repr__(self):
+        return f"Cache(ttl={self.ttl}, by_ip={self.by_ip})"
+
+
+def _canonical(value):
+    """
+    Makes values JSON can't serialize (e.g. bytes decoded from ZiProto) part of the cache key
+    """
+
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": value.hex()}
+    return {"__repr__": repr(value)}
+
+
+# Created once, json.dumps() would build a new encoder on every call with these options
+_key_encoder = json.JSONEncoder(sort_keys=True, separators=(",", ":"), default=_canonical)
+
+
+def request_key(payload: dict) -> bytes:
+    """
+    Returns a hash of the fields of a request. Field order doesn't matter, so requests
+    with the same fields have the same key however the client encoded them
+
+    :param payload: The decoded payload of the request
+    :type payload: dict
+    """
+
+    return hashlib.blake2b(_key_encoder.encode(payload).encode("utf-8"), digest_size=16).digest()
+
+
+class ResponseCache:
+    """
+    Complete response frames, header included, keyed on a hash of the request's fields, its
+    encoding and the handler that produced them (and optionally the client's IP). Entries expire after their TTL and the least
+    recently used ones are evicted to keep the total size of the frames under ``max_bytes``
+
+    :param max_bytes: The maximum total size of the cached frames, defaults to 64 MiB
+    :type max_bytes: int, optional
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Object constructor
+        """
+
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evicted = 0
+        # Key -> (expiry, frames), least recently used first
+        self._entries = collections.OrderedDict()
+
+    @staticmethod
+    def key(payload: dict, encoding: str) -> Tuple[bytes, str]:
+        """
+        Returns the cache key of a request, see ``request_key()``
+
+        :param payload: The decoded payload of the request
+        :type payload: dict
+        :param encoding: The encoding of the request, ``'json'`` or ``'ziproto'``
+        :type encoding: str
+        """
+
+        return request_key(payload), encoding
+
+    def get(self, key: Tuple, address: Optional[str] = None) -> Optional[bytes]:
+        """
+        Returns the cached frames for a request, or ``None``
+
+        :param key: The key of the request, see ``key()``
+        :type key: tuple
+        :param address: If set, the entry cached for this IP is looked up, defaults to ``None``
+        :type address: str, optional
+        """
+
+        if address is not None:
+            key += (address,)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expiry, frames = entry
+        if expiry < time.monotonic():
+            del self._entries[key]
+            self.size -= len(frames)
+            return None
+        self._entries.move_to_end(key)
+        return frames
+
+    def put(self, key: Tuple, frames: bytes, ttl: float, address: Optional[str] = None):
+        """
+        Caches the frames sent in response to a request, evicting the least recently
+        used entries if needed. Frames larger than the whole cache are not cached
+
+        :param key: The key of the request, see ``key()``
+        :type key: tuple
+        :param frames: The complete frames, as they were sent
+        :type frames: bytes
+        :param ttl: How long (in seconds) the entry is valid
+        :type ttl: float
+        :param address: If set, the entry is only served to this IP, defaults to ``None``
+        :type address: str, optional
+        """
+
+        if len(frames) > self.max_bytes:
+            return
+        if address is not None:
+            key += (address,)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old[1])
+        while self._entries and self.size + len(frames) > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evicted += 1
+        self._entries[key] = (time.monotonic() + ttl, frames)
+        self.size += len(frames)
+
+    def clear(self):
+        """
+        Empties the cache
+        """
+
+        self._entries.clear()
+        self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseRecorder:
+    """
+    Collects the frames sent in response to a single request, so that the ones sent
+    by a cached or singleflight handler can be replayed
+    """
+
+    __slots__ = ("frames", "closed")
+
+    def __init__(self):
+        self.frames = []
+        # Whether a handler asked to close the connection after a frame
+        self.closed = False
+
+    def add(self, frame: bytes, close: bool):
+        """
+        Records a frame that was sent. If the handler asked to close the connection
+        afterwards, the response can't be replayed from the cache
+        """
+
+        if close:
+            self.closed = True
+        self.frames.append(frame)
+
+
+class Flight:
+    """
+    A handler execution shared by identical concurrent requests, see ``Server.add_handler(singleflight=True)``.
+    The first request runs the handler, the others wait for ``done`` and get the frames it sent, encoded
+    once for each encoding they need
+
+    :param done: An event of the server's backend, set once the execution is over
+    :param encoding: The encoding of the request running the handler
+    :type encoding: str
+    """
+
+    __slots__ = ("done", "encoding", "frames", "close", "error", "abandoned", "_encoded")
+
+    def __init__(self, done, encoding: str):
+        self.done = done
+        self.encoding = encoding
+        self.frames = []
+        self.close = False
+        # The exception the handler raised, which waiting requests raise too
+        self.error = None
+        # Set if the request running the handler was cancelled, one of the waiting ones then takes over
+        self.abandoned = False
+        self._encoded = {}
+
+    def frames_for(self, encoding: str, transcode) -> bytes:
+        """
+        Returns the frames the handler sent, in the given encoding
+
+        :param encoding: ``'json'`` or ``'ziproto'``
+        :type encoding: str
+        :param transcode: Converts a frame to ``encoding``, called with the frame and the encoding
+        :type transcode: Callable
+        """
+
+        try:
+            return self._encoded[encoding]
+        except KeyError:
+            if encoding == self.encoding:
+                frames = b"".join(self.frames)
+            else:
+                frames = b"".join(transcode(frame, encoding) for frame in self.frames)
+            self._encoded[encoding] = frames
+            return frames
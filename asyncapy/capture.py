@@ -0,0 +1,241 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Traffic capture files. A capture starts with a small header (``MAGIC`` and the wall clock
+time the capture started at), followed by records, each made of a fixed size header
+(``RECORD``: kind, connection ID, nanoseconds since the capture started and frame size)
+and the complete AsyncAProto frame, length header included, exactly as it went over the wire
+"""
+
+import collections
+import contextvars
+import logging
+import mmap
+import struct
+import threading
+import time
+from typing import Iterator, NamedTuple
+
+
+MAGIC = b"AAPYCAP\x01"
+HEADER = struct.Struct("<8sd")
+RECORD = struct.Struct("<BIQI")
+
+# Record kinds
+REQUEST = 0
+RESPONSE = 1
+# The connection was closed, by either side. The record carries no frame
+CLOSE = 2
+
+# The ID of the connection handled by the current task, when capturing
+current_connection = contextvars.ContextVar("current_connection", default=0)
+
+
+class CaptureRecord(NamedTuple):
+    """
+    A record read from a capture. ``frame`` is a ``memoryview`` of the mapped file, so
+    it's only valid as long as the ``CaptureReader`` it came from is open
+    """
+
+    kind: int
+    connection: int
+    offset: int
+    frame: memoryview
+
+
+class CaptureWriter:
+    """
+    Appends frames to a capture file. Frames are queued in a bounded buffer that a background
+    thread writes out every ``flush_interval`` seconds, so that the event loop never waits for
+    the disk. Frames that don't fit in the buffer, or that would make the capture larger than
+    ``max_bytes``, are dropped and counted in ``self.dropped``
+
+    :param path: The path of the capture file. If it already exists, it's overwritten
+    :type path: str
+    :param max_bytes: The maximum size of the capture, defaults to 1 GiB. If 0, the size isn't limited
+    :type max_bytes: int, optional
+    :param flush_interval: How often (in seconds) buffered frames are written, defaults to 0.5
+    :type flush_interval: float, optional
+    :param queue_size: The maximum number of frames waiting to be written, defaults to 65536
+    :type queue_size: int, optional
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 1024 * 1024 * 1024,
+        flush_interval: float = 0.5,
+        queue_size: int = 65536,
+    ):
+        """
+        Object constructor
+        """
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._records = collections.deque()
+        self._size = 0
+        self._start = None
+        self._stopping = threading.Event()
+        self._thread = None
+        self._file = None
+
+    def start(self):
+        """
+        Creates the capture file and starts the writer thread
+        """
+
+        self._file = open(self.path, "wb")
+        self._start = time.perf_counter_ns()
+        self._file.write(HEADER.pack(MAGIC, time.time()))
+        self._size = HEADER.size
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="asyncapy-capture", daemon=True)
+        self._thread.start()
+
+    def write(self, kind: int, connection: int, frame: bytes = b"", prefix: bytes = b""):
+        """
+        Queues a frame to be written. This never blocks
+
+        :param kind: The kind of record, one of ``REQUEST``, ``RESPONSE`` and ``CLOSE``
+        :type kind: int
+        :param connection: The ID of the connection the frame was sent on
+        :type connection: int
+        :param frame: The frame, defaults to ``b""``
+        :type frame: bytes, optional
+        :param prefix: Written right before ``frame``, so that callers holding the length header
+        apart from the rest of the frame don't have to concatenate them, defaults to ``b""``
+        :type prefix: bytes, optional
+        """
+
+        if len(self._records) >= self.queue_size:
+            self.dropped += 1
+        else:
+            self._records.append((kind, connection, time.perf_counter_ns() - self._start, prefix, frame))
+
+    def stop(self):
+        """
+        Writes the frames that are still queued, stops the writer thread and closes the file
+        """
+
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+
+    def _flush(self):
+        """
+        Writes all the buffered frames
+        """
+
+        chunks = []
+        while self._records:
+            kind, connection, offset, prefix, frame = self._records.popleft()
+            size = len(prefix) + len(frame)
+            if self.max_bytes and self._size + RECORD.size + size > self.max_bytes:
+                self.dropped += 1
+                continue
+            chunks.append(RECORD.pack(kind, connection, offset, size))
+            chunks.append(prefix)
+            chunks.append(frame)
+            self._size += RECORD.size + size
+        if not chunks:
+            return
+        try:
+            self._file.write(b"".join(chunks))
+            self._file.flush()
+        except (OSError, ValueError) as error:
+            logging.error("{Capture} Could not write to %s -> %s", self.path, error)
+
+    def _run(self):
+        """
+        The writer thread's main loop
+        """
+
+        while not self._stopping.wait(self.flush_interval):
+            self._flush()
+        self._flush()
+
+
+class CaptureReader:
+    """
+    Reads a capture file through ``mmap``, so that frames are never copied
+    until they're sent. Use it as a context manager
+
+    :param path: The path of the capture file
+    :type path: str
+    :raises ValueError: If the file isn't a capture
+    """
+
+    def __init__(self, path: str):
+        """
+        Object constructor
+        """
+
+        self.path = path
+        with open(path, "rb") as capture:
+            self._map = mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a capture file!")
+        magic, self.started = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a capture file!")
+
+    def __iter__(self) -> Iterator[CaptureRecord]:
+        """
+        Yields the records of the capture in the order they were written. A truncated
+        last record (e.g. if the server was killed while writing it) is ignored
+        """
+
+        view = self._view
+        position = HEADER.size
+        end = len(view)
+        while position + RECORD.size <= end:
+            kind, connection, offset, size = RECORD.unpack_from(view, position)
+            position += RECORD.size
+            if position + size > end:
+                return
+            yield CaptureRecord(kind, connection, offset, view[position:position + size])
+            position += size
+
+    def close(self):
+        """
+        Unmaps the file. Frames read from the capture can't be used afterwards
+        """
+
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # Some frames are still referenced, the file is unmapped once they're garbage collected
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -18,8 +18,10 @@
 import ssl
 import json
 import socket
+import itertools
 import ziproto
-from typing import Union, Dict, Any, Optional, Tuple
+from typing import Union, Dict, Any, Optional, Tuple, Iterable, Iterator
+from .util import configure_socket
 
 
 class Client:
@@ -38,6 +40,28 @@ class Client:
     not human-readable, recommended for when the information is not meant to be seen by the general public)
     :param timeout: The max. duration in seconds to read the socket before timing out, defaults to 60
     :type timeout: int, optional
+    :param ssl_context: The ``ssl.SSLContext`` used when ``tls`` is ``True``, defaults to ``None``
+    (``ssl.create_default_context()``, created once per client). TLS sessions are resumed across reconnections
+    to the same server, which makes reconnecting much cheaper
+    :type ssl_context: class: ``ssl.SSLContext``, optional
+    :param verify: If ``False``, the default SSL context won't verify the server's certificate and hostname. Only
+    meant for testing against servers with self-signed certificates, defaults to ``True``
+    :type verify: bool, optional
+    :param tcp_nodelay: If ``True``, Nagle's algorithm is disabled so that small packets are sent right away,
+    defaults to ``True``
+    :type tcp_nodelay: bool, optional
+    :param rcvbuf: The size (in bytes) of the kernel's receive buffer, defaults to ``None`` (the operating
+    system's default)
+    :type rcvbuf: int, optional
+    :param sndbuf: The size (in bytes) of the kernel's send buffer, defaults to ``None`` (the operating
+    system's default)
+    :type sndbuf: int, optional
+    :param tcp_keepalive: If set, TCP keepalive probes are sent after the connection has been idle for this
+    many seconds, defaults to ``None`` (disabled)
+    :type tcp_keepalive: int, optional
+    :param buffer_size: The size (in bytes) of the buffer responses are read into. It grows to fit larger
+    responses, and shrinks back once they've been read, defaults to 65536
+    :type buffer_size: int, optional
     """
 
     def __init__(
@@ -47,6 +71,13 @@ class Client:
         tls: Optional[bool] = True,
         encoding: Optional[str] = "json",
         timeout: Optional[int] = 60,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        verify: Optional[bool] = True,
+        tcp_nodelay: Optional[bool] = True,
+        rcvbuf: Optional[int] = None,
+        sndbuf: Optional[int] = None,
+        tcp_keepalive: Optional[int] = None,
+        buffer_size: Optional[int] = 65536,
     ):
         """
         Object constructor
@@ -62,6 +93,63 @@ class Client:
         self.tls: bool = tls
         self.encoding: str = encoding
         self.timeout: int = timeout
+        self.ssl_context: Optional[ssl.SSLContext] = ssl_context
+        self.verify: bool = verify
+        self.tcp_nodelay: bool = tcp_nodelay
+        self.rcvbuf: Optional[int] = rcvbuf
+        self.sndbuf: Optional[int] = sndbuf
+        self.tcp_keepalive: Optional[int] = tcp_keepalive
+        # TLS sessions to resume, by server address
+        self._tls_sessions: Dict[Any, ssl.SSLSession] = {}
+        self._peer = None
+        # Responses are read into this buffer with recv_into(), bytes between _start
+        # and _end were received but not returned yet (e.g. pipelined responses)
+        self.buffer_size: int = max(buffer_size, header_size + 2)
+        self._buffer = bytearray(self.buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+    def _get_ssl_context(self) -> ssl.SSLContext:
+        """
+        Returns the client's SSL context, creating it on first use
+        """
+
+        if self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+            if not self.verify:
+                self.ssl_context.check_hostname = False
+                self.ssl_context.verify_mode = ssl.CERT_NONE
+        return self.ssl_context
+
+    def _make_socket(self, family: int = socket.AF_INET, server_hostname: Optional[str] = None) -> socket.socket:
+        """
+        Creates the underlying socket, wrapping it with TLS if ``self.tls`` is ``True`` (except for Unix domain
+        sockets, on which the server never uses TLS). If a TLS session for the server we're connecting to was
+        saved, it will be resumed
+
+        :param family: The address family of the socket, defaults to ``socket.AF_INET``
+        :type family: int, optional
+        :param server_hostname: The hostname to verify the server's certificate against, defaults to ``None``
+        :type server_hostname: str, optional
+        """
+
+        sock = socket.socket(family)
+        configure_socket(
+            sock,
+            nodelay=self.tcp_nodelay,
+            rcvbuf=self.rcvbuf,
+            sndbuf=self.sndbuf,
+            keepalive=self.tcp_keepalive,
+        )
+        if self.tls and family != socket.AF_UNIX:
+            sock = self._get_ssl_context().wrap_socket(
+                sock,
+                server_hostname=server_hostname,
+                session=self._tls_sessions.get(self._peer),
+            )
+        sock.settimeout(self.timeout)
+        return sock
 
     def connect(self, hostname: str, port: int):
         """
@@ -77,12 +165,38 @@ class Client:
             raise ValueError("address must be string!")
         if not isinstance(port, int):
             raise ValueError("port must be an integer!")
-        self.sock = (
-            socket.socket() if not self.tls else ssl.wrap_socket(socket.socket())
-        )
-        self.sock.settimeout(self.timeout)
+        self._peer = (hostname, port)
+        self._start = self._end = 0
+        self.sock = self._make_socket(server_hostname=hostname)
         self.sock.connect((hostname, port))
 
+    def connect_unix(self, path: str, server_hostname: Optional[str] = None):
+        """
+        Connects to a server listening on the Unix domain socket at the given path. This is
+        only supported on platforms implementing Unix domain sockets. The server never uses
+        TLS on Unix domain sockets, so the connection is not encrypted, whatever ``self.tls`` is
+
+        :param path: The path of the server's socket
+        :type path: str
+        :param server_hostname: Unused, since the connection is not encrypted, defaults to ``None``
+        :type server_hostname: str, optional
+        """
+
+        if not isinstance(path, str):
+            raise ValueError("path must be string!")
+        self._peer = path
+        self._start = self._end = 0
+        self.sock = self._make_socket(socket.AF_UNIX, server_hostname)
+        self.sock.connect(path)
+
+    @property
+    def session_reused(self) -> bool:
+        """
+        ``True`` if the current TLS connection resumed a previous session
+        """
+
+        return isinstance(self.sock, ssl.SSLSocket) and self.sock.session_reused
+
     def disconnect(self):
         """
         Closes the underlying TCP socket. No further
@@ -91,15 +205,19 @@ class Client:
         it notices that the client is gone
         """
 
+        if isinstance(self.sock, ssl.SSLSocket) and self.sock.session is not None:
+            # Saved here and not right after connecting because, with TLS 1.3,
+            # session tickets are only received after the handshake
+            self._tls_sessions[self._peer] = self.sock.session
         self.sock.close()
 
-    def send(self, payload: Union[str, Dict[Any, Any]]):
+    def encode(self, payload: Union[str, Dict[Any, Any]]) -> bytes:
         """
-        Sends the given payload across the underlying
-        TCP connection as a proper AsyncAproto packet
+        Returns the given payload as a complete
+        AsyncAproto packet, headers included
 
-        :param payload: The payload to send to the server. Pass either a dictionary object or a valid JSON string
-        :type payload: dict or str, optional
+        :param payload: The payload to encode. Pass either a dictionary object or a valid JSON string
+        :type payload: dict or str
         """
 
         if isinstance(payload, dict) and self.encoding == "json":
@@ -108,6 +226,8 @@ class Client:
             payload: bytes = ziproto.encode(json.loads(payload))
         elif self.encoding == "ziproto":
             payload: bytes = ziproto.encode(payload)
+        elif isinstance(payload, str):
+            payload: bytes = payload.encode()
         content_length = (len(payload) + 2).to_bytes(self.header_size, self.byteorder)
         content_encoding = (
             (0).to_bytes(1, "big")
@@ -116,25 +236,126 @@ class Client:
         )
         protocol_version = (22).to_bytes(1, "big")
         headers = content_length + protocol_version + content_encoding
-        packet = headers + payload
-        self.sock.sendall(packet)
+        return headers + payload
+
+    def send(self, payload: Union[str, Dict[Any, Any]]):
+        """
+        Sends the given payload across the underlying
+        TCP connection as a proper AsyncAproto packet
+
+        :param payload: The payload to send to the server. Pass either a dictionary object or a valid JSON string
+        :type payload: dict or str, optional
+        """
 
-    def _rebuild_stream(self, size: int) -> bytes:
+        self.sock.sendall(self.encode(payload))
+
+    def send_many(self, payloads: Iterable[Union[str, Dict[Any, Any]]]) -> int:
+        """
+        Sends several payloads at once, writing
+        all of their packets with a single call
+        to ``sendall()``. Returns the number of
+        packets that were sent
+
+        :param payloads: The payloads to send to the server, see ``send()``
+        :type payloads: Iterable
         """
-        Internal method to rebuild a fragmented
-        packet stream up to a given size
 
-        :param size: The amount of bytes to be returned
+        packets = [self.encode(payload) for payload in payloads]
+        if packets:
+            self.sock.sendall(b"".join(packets))
+        return len(packets)
+
+    def request_many(
+        self, payloads: Iterable[Union[str, Dict[Any, Any]]], window: int = 100
+    ) -> Iterator[Dict[Any, Any]]:
+        """
+        Sends many requests over the connection without
+        waiting for each response before sending the next
+        request, and yields the decoded responses in the
+        order the requests were sent.
+
+        At most ``window`` requests are waiting for their
+        response at any time: whenever half of them were
+        answered, the next ones are sent in a single write.
+        AsyncAproto has no request IDs, so responses are
+        matched with requests by their order: the server
+        must keep the connection alive and every request
+        must get exactly one response. Since the server
+        stops reading while it's sending a response, the
+        requests and responses of a window should fit in
+        the sockets' buffers, or both sides may block.
+        If the caller stops iterating early, the responses
+        that are still in flight are read and discarded
+
+        :param payloads: The payloads to send, consumed lazily so that it can be a generator
+        :type payloads: Iterable
+        :param window: The maximum number of requests waiting for their response, defaults to 100
+        :type window: int, optional
+        :raises ConnectionError: If the server closes the connection before answering every request
+        """
+
+        if not isinstance(window, int) or window < 1:
+            raise ValueError("window must be a positive integer!")
+        payloads = iter(payloads)
+        in_flight = 0
+        exhausted = False
+        try:
+            while True:
+                if not exhausted and in_flight <= window // 2:
+                    wanted = window - in_flight
+                    sent = self.send_many(itertools.islice(payloads, wanted))
+                    in_flight += sent
+                    exhausted = sent < wanted
+                if not in_flight:
+                    return
+                data = self.receive_raw()
+                if not data:
+                    unanswered, in_flight = in_flight, 0
+                    raise ConnectionError(
+                        f"The server closed the connection with {unanswered} request(s) unanswered"
+                    )
+                in_flight -= 1
+                yield self._decode(self._split_packet(data)[-1])
+        finally:
+            if in_flight:
+                # The caller stopped early (or something failed): the responses still
+                # in flight must not be mistaken for the ones of the next requests
+                try:
+                    while in_flight and self.receive_raw():
+                        in_flight -= 1
+                except OSError:
+                    self.sock.close()
+
+    def _fill(self, size: int) -> bool:
+        """
+        Internal method to read the socket until at least ``size``
+        bytes are buffered, making room in the buffer (or growing it)
+        if needed. Returns ``False`` if the socket gets closed first
+
+        :param size: The amount of bytes needed
         :type size: int
-        :returns: The required amount of data, as bytes
-        :rtype: bytes
         """
 
-        data = b""
-        while len(data) < size:
-            data += self.sock.recv(size)
-            size -= len(data)
-        return data
+        if self._start + size > len(self._buffer):
+            # Move what is left of the buffered data to the front
+            pending = self._end - self._start
+            if size > len(self._buffer):
+                buffer = bytearray(size)
+                buffer[:pending] = self._view[self._start:self._end]
+                self._view.release()
+                self._buffer = buffer
+                self._view = memoryview(buffer)
+            else:
+                self._view[:pending] = self._view[self._start:self._end]
+            self._start, self._end = 0, pending
+        view = self._view
+        end = self._start + size
+        while self._end < end:
+            received = self.sock.recv_into(view[self._end:])
+            if not received:
+                return False
+            self._end += received
+        return True
 
     # noinspection PyMethodMayBeStatic
     def _split_packet(self, packet: bytes) -> Tuple:
@@ -156,8 +377,14 @@ class Client:
         """
 
         data = self.receive_raw()
-        payload = self._split_packet(data)[-1]
-        print(self._split_packet(data))
+        return self._decode(self._split_packet(data)[-1])
+
+    def _decode(self, payload: bytes) -> Dict[Any, Any]:
+        """
+        Decodes a payload according to the
+        session's encoding
+        """
+
         if self.encoding == "json":
             return json.loads(payload.decode())
         else:
@@ -168,25 +395,27 @@ class Client:
         Reads the internal socket until an
         entire AsyncAproto packet is complete
         and returns the raw packet (including
-        headers). An empty byte string is returned
-        if the socket gets closed abruptly
-        """
-
-        data = b""
-        while len(data) < self.header_size:
-            # We receive at most up to our
-            # headers' size so we can know
-            # how to proceed later
-            raw = self.sock.recv(4)
-            if not raw:
-                # Socket has been closed
-                return b""
-            else:
-                data += raw
-        # Once we received our 4-byte content-length header, we
-        # just rebuild the packet up to said size and let the TCP
-        # buffer handle any truncated data that may come after the
-        # packet
-        content_length = int.from_bytes(data[0 : self.header_size], self.byteorder)
-        data += self._rebuild_stream(content_length)
-        return data
+        headers). Bytes received past the end
+        of the packet are kept for the next call.
+        An empty byte string is returned if the
+        socket gets closed abruptly
+        """
+
+        if not self._fill(self.header_size):
+            return b""
+        start = self._start
+        size = self.header_size + int.from_bytes(self._view[start:start + self.header_size], self.byteorder)
+        if not self._fill(size):
+            return b""
+        # _fill() may have moved the data
+        start = self._start
+        self._start += size
+        frame = self._view[start:start + size].tobytes()
+        if self._start == self._end:
+            self._start = self._end = 0
+            if len(self._buffer) > self.buffer_size:
+                # Don't hold on to the memory of a large response
+                self._view.release()
+                self._buffer = bytearray(self.buffer_size)
+                self._view = memoryview(self._buffer)
+        return frame
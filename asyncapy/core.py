@@ -20,7 +20,10 @@ from typing import List, Union, Optional
 from .filters import Filter
 from types import FunctionType
 from .errors import StopPropagation
+from .access import current_record
+from .cache import Cache
 import json
+import time
 import ziproto
 import uuid
 import trio
@@ -57,6 +60,8 @@ class Client:
         self._stream = stream
         self.session = session
         self.encoding = encoding
+        # Set by the server to a ResponseRecorder when the response may be cached or shared
+        self._responses = None
 
     async def send(self, packet, close: bool = False):
         """
@@ -69,6 +74,9 @@ class Client:
         :type close: bool, optional
         """
 
+        record = current_record.get()
+        if record is not None:
+            start = time.perf_counter()
         payload = packet.payload.encode("utf-8")
         length_header = (packet.length + 2).to_bytes(
             self._server.header_size, self._server.byteorder
@@ -84,6 +92,10 @@ class Client:
         protocol_version = (22).to_bytes(1, self._server.byteorder)
         headers = length_header + protocol_version + content_encoding
         data = headers + payload
+        if record is not None:
+            record.add("encode", time.perf_counter() - start)
+        if self._responses is not None:
+            self._responses.add(data, close)
         await self._server._send(
             self._stream, data, self.session, close, from_client=True
         )
@@ -185,10 +197,26 @@ class Handler:
     :type function: function
     :param filters: A list of ``AsyncAPY.filters.Filter`` objects, defaults to ``None``
     :type filters: List[Filter]
+    :param priority: The priority of the handler when the server is overloaded, 0 being the most important,
+    see ``Server(overload_target=...)``, defaults to 0
+    :type priority: int, optional
+    :param cache: The caching policy of the handler's responses, see ``Server.add_handler(cache=...)``,
+    defaults to ``None`` (not cached)
+    :type cache: class: ``AsyncAPY.cache.Cache``, optional
+    :param singleflight: If ``True``, identical concurrent requests share a single execution of the handler,
+    see ``Server.add_handler(singleflight=True)``, defaults to ``False``
+    :type singleflight: bool, optional
 
     """
 
-    def __init__(self, function: FunctionType, filters: Optional[List[Filter]] = None):
+    def __init__(
+        self,
+        function: FunctionType,
+        filters: Optional[List[Filter]] = None,
+        priority: int = 0,
+        cache: Optional[Cache] = None,
+        singleflight: bool = False,
+    ):
         """
         Object constructor
         """
@@ -197,6 +225,9 @@ class Handler:
             filters = []
         self.filters = filters
         self.function = function
+        self.priority = priority
+        self.cache = cache
+        self.singleflight = singleflight
 
     def __repr__(self):
         """
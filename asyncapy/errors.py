@@ -22,3 +22,17 @@ class StopPropagation(Exception):
     to prevent the dispatcher forwarding the packet to the next handler in the queue"""
 
     pass
+
+
+class RequestRejected(Exception):
+    """This exception can be raised by filters to reject a request before any handler runs. Instead of moving
+    on to the next handler, the server replies with an error response carrying ``error`` (e.g. ``ERR_RATE_LIMITED``)
+    and the request is not processed any further
+
+    :param error: The error code sent to the client
+    :type error: str
+    """
+
+    def __init__(self, error: str):
+        super().__init__(error)
+        self.error = error
@@ -17,8 +17,11 @@
 # along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
 
 import re
-from typing import Union, List
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Union, List, Optional
 from copy import deepcopy
+from .errors import RequestRejected
 from .util import APIKeyFactory
 
 
@@ -171,7 +174,9 @@ class Filters(Filter):
         def check(self, _, p):
             """
             Implements ``self.check``, returns ``True`` if ``self.field_name`` exist in the provided packet and
-            its value is a valid API key
+            its value is a valid API key. If the factory tracks usage, requests with a key over its quota are
+            rejected with ``ERR_QUOTA_EXCEEDED``. Requests are only counted once a handler is called for them
+            (see ``self.consume()``), so that those rejected by other filters, or shed, aren't
 
             :param _: A client object
             :type _: class: ``Client``, unused in this specific case
@@ -181,4 +186,141 @@ class Filters(Filter):
             :rtype: bool
             """
 
-            return p.dict_payload.get(self.field_name, None) in self.factory
+            key = p.dict_payload.get(self.field_name, None)
+            if key not in self.factory:
+                return False
+            if self.factory.tracks_usage and self.factory.over_quota(key):
+                raise RequestRejected("ERR_QUOTA_EXCEEDED")
+            return True
+
+        def consume(self, p) -> bool:
+            """
+            Counts a request that passed ``self.check``, returning ``False`` if its key is now over its quota
+            (see ``APIKeyFactory.consume()``). The server calls this once it chose a handler for the request
+
+            :param p: A packet object
+            :type p: class: ``Packet``
+            :returns: ``True`` if the request is within the quota
+            :rtype: bool
+            """
+
+            return self.factory.consume(p.dict_payload.get(self.field_name))
+
+    class RateLimit(Filter):
+
+        """
+        Limits how many requests each client can make, rejecting the ones over the limit with an ``ERR_RATE_LIMITED``
+        error before the handler runs (see ``AsyncAPY.errors.RequestRejected``). Clients can make ``rate`` requests
+        per second on average, and up to ``burst`` requests at once.
+
+        The limit is enforced with the Generic Cell Rate Algorithm, which is equivalent to a token bucket but only
+        needs to store a single number per key (the time at which the bucket will be full again), so every check
+        is O(1). Keys are kept in LRU order and, once there are ``max_keys`` of them, the least recently seen is
+        forgotten, which keeps memory bounded no matter how many distinct clients there are: keys that have been
+        idle for longer than ``burst / rate`` seconds carry no state worth keeping anyway.
+
+        Filters of a handler are checked in order, so this filter should come last, to only count requests that
+        would otherwise reach the handler. The limit is per worker process
+
+        :param rate: How many requests per second each key is allowed to make, on average
+        :type rate: float
+        :param burst: How many requests a key can make at once, defaults to ``rate`` (at least 1)
+        :type burst: int, optional
+        :param key: What requests are grouped by: ``'ip'`` (the client's address), ``'api_key'`` (the value of the
+        ``field_name`` field, falling back to the address when it's missing or isn't a string) or a callable receiving
+        the client and the packet and returning a hashable key, defaults to ``'ip'``
+        :type key: Union[str, Callable]
+        :param field_name: The field holding the API key, when ``key`` is ``'api_key'``, defaults to ``'api_key'``
+        :type field_name: str, optional
+        :param max_keys: The maximum number of keys that are tracked at once, defaults to 100000
+        :type max_keys: int, optional
+        :raises ValueError: If ``rate``, ``burst`` or ``max_keys`` aren't positive, or ``key`` is invalid
+        """
+
+        def __init__(
+            self,
+            rate: float,
+            burst: Optional[int] = None,
+            key: Union[str, Callable[..., Hashable]] = "ip",
+            field_name: str = "api_key",
+            max_keys: int = 100000,
+        ):
+            """
+            Object constructor
+            """
+
+            if burst is None:
+                burst = max(int(rate), 1)
+            if rate <= 0 or burst < 1 or max_keys < 1:
+                raise ValueError("rate, burst and max_keys must be positive!")
+            if key == "ip":
+                self._key = lambda c, _: c.address
+            elif key == "api_key":
+
+                def api_key(c, p):
+                    value = p.dict_payload.get(field_name)
+                    # Clients can send anything, and lists or dictionaries aren't even hashable
+                    return value if value and isinstance(value, str) else c.address
+
+                self._key = api_key
+            elif callable(key):
+                self._key = key
+            else:
+                raise ValueError("key must be 'ip', 'api_key' or a callable!")
+            self.rate = rate
+            self.burst = burst
+            self.key = key
+            self.field_name = field_name
+            self.max_keys = max_keys
+            # The time between two requests at the sustained rate
+            self._interval = 1 / rate
+            # How far in the future a key's theoretical arrival time can be
+            self._tolerance = self._interval * burst
+            # Key -> theoretical arrival time, in time.monotonic() seconds
+            self._buckets = OrderedDict()
+
+        def __repr__(self):
+            """
+            Returns ``repr(self)``
+
+            :returns repr: A string representation of ``self``
+            :rtype: str
+            """
+
+            return f"Filters.RateLimit(rate={self.rate}, burst={self.burst}, key={self.key!r})"
+
+        def __len__(self):
+            """
+            Returns the number of keys currently tracked
+            """
+
+            return len(self._buckets)
+
+        def check(self, c, p):
+            """
+            Implements ``self.check``, returns ``True`` if the request is within the limit
+
+            :param c: A client object
+            :type c: class: ``Client``
+            :param p: A packet object
+            :type p: class: ``Packet``
+            :returns shall_pass: ``True`` if the request is within the limit
+            :rtype: bool
+            :raises RequestRejected: If the request is over the limit
+            """
+
+            key = self._key(c, p)
+            now = time.monotonic()
+            buckets = self._buckets
+            arrival = buckets.get(key)
+            if arrival is None or arrival < now:
+                arrival = now
+            # Compared before adding the interval, so that rounding never rejects a key with an empty bucket
+            if arrival - now > self._tolerance - self._interval:
+                buckets.move_to_end(key)
+                raise RequestRejected("ERR_RATE_LIMITED")
+            buckets[key] = arrival + self._interval
+            buckets.move_to_end(key)
+            if len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+            return True
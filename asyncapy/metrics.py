@@ -0,0 +1,378 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import http.server
+import logging
+import math
+import threading
+from typing import Callable, Iterable, Optional, Sequence, Tuple
+
+
+# Latency buckets, in seconds, from 100µs to 10s
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """
+    Base class for metrics. A metric with labels is a family of children, one for each combination
+    of label values, which are created the first time they're requested with ``labels()``
+    """
+
+    type = None
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        """
+        Object constructor
+        """
+
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children = {}
+        if not self.label_names:
+            self._children[()] = self
+
+    def labels(self, *values):
+        """
+        Returns the child of a labelled metric for the given label values
+        """
+
+        try:
+            return self._children[values]
+        except KeyError:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects {len(self.label_names)} label value(s)!") from None
+            child = self._children[values] = self._new_child()
+            return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterable[Tuple[str, str, float]]:
+        """
+        Yields ``(suffix, labels, value)`` tuples for all the children of the metric
+        """
+
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        Returns the metric in the Prometheus text exposition format
+        """
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up. Incrementing a counter is a plain attribute update:
+    the event loop is single threaded, so no lock is needed
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        """
+        Object constructor
+        """
+
+        self.value = 0
+        super().__init__(name, documentation, labels)
+
+    def _new_child(self):
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1):
+        """
+        Increments the counter by ``amount``
+        """
+
+        self.value += amount
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield "_total", _format_labels(self.label_names, values), child.value
+
+
+class Gauge(_Metric):
+    """
+    A value that can go up and down. If ``function`` is given, the value is read by calling it
+    every time the metric is collected
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        function: Optional[Callable[[], float]] = None,
+    ):
+        """
+        Object constructor
+        """
+
+        self.value = 0
+        self.function = function
+        super().__init__(name, documentation, labels)
+
+    def _new_child(self):
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            value = child.function() if child.function else child.value
+            yield "", _format_labels(self.label_names, values), value
+
+
+class Histogram(_Metric):
+    """
+    Counts observations in fixed buckets, which makes recording a value O(log(buckets))
+    and allocation free, while still allowing quantiles to be estimated
+
+    :param buckets: The upper bounds of the buckets, defaults to ``DEFAULT_BUCKETS``
+    :type buckets: Sequence[float], optional
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        """
+        Object constructor
+        """
+
+        self.buckets = tuple(sorted(buckets))
+        # The last bucket is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        super().__init__(name, documentation, labels)
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float):
+        """
+        Records a value
+        """
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the ``q``-th quantile (between 0 and 1) of the observed values, by returning the
+        upper bound of the bucket it falls in. Returns ``math.inf`` if it falls in the last bucket
+        and ``math.nan`` if nothing was observed
+        """
+
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            labels = _format_labels(self.label_names, values)
+            cumulative = 0
+            for bound, count in zip(child.buckets + (math.inf,), list(child.counts)):
+                cumulative += count
+                bucket_labels = _format_labels(
+                    self.label_names + ("le",), values + (_format_value(float(bound)),)
+                )
+                yield "_bucket", bucket_labels, cumulative
+            yield "_sum", labels, child.sum
+            yield "_count", labels, child.count
+
+
+class Registry:
+    """
+    A collection of metrics, rendered together in the Prometheus text exposition format
+    """
+
+    def __init__(self):
+        """
+        Object constructor
+        """
+
+        self._metrics = {}
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"A metric named {metric.name} already exists!")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        """
+        Creates and registers a new counter
+        """
+
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        function: Optional[Callable[[], float]] = None,
+    ) -> Gauge:
+        """
+        Creates and registers a new gauge
+        """
+
+        return self._register(Gauge(name, documentation, labels, function))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """
+        Creates and registers a new histogram
+        """
+
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        """
+        Returns the metric with the given name, or ``None``
+        """
+
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format
+        """
+
+        return "".join(metric.render() for metric in list(self._metrics.values()))
+
+
+class AdminServer:
+    """
+    A tiny HTTP server exposing a registry at ``/metrics``, in the Prometheus text format. It runs
+    in its own thread, so that scrapes never compete with requests for the event loop
+
+    :param registry: The metrics to expose
+    :type registry: class: ``Registry``
+    :param addr: The address to bind to
+    :type addr: str
+    :param port: The port to bind to
+    :type port: int
+    """
+
+    def __init__(self, registry: Registry, addr: str, port: int):
+        """
+        Object constructor
+        """
+
+        self.registry = registry
+        self.addr = addr
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """
+        Binds the admin listener and starts serving it in a background thread
+        """
+
+        registry = self.registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug("{Admin} " + format, *args)
+
+        self._server = http.server.ThreadingHTTPServer((self.addr, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="asyncapy-admin", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the admin listener
+        """
+
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = self._thread = None
@@ -0,0 +1,129 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import time
+from typing import Sequence
+
+
+class OverloadController:
+    """
+    An adaptive limit on the number of requests processed at once. Requests over the limit are
+    rejected right away, which is much cheaper than letting them queue up: under overload the server
+    keeps serving as many requests as it can, at a normal latency, instead of serving all of them late.
+
+    The limit is adjusted with additive increase/multiplicative decrease, driven by the time requests
+    spend in the server (their sojourn time). Like CoDel, it looks at the *minimum* sojourn time over
+    each ``interval``: a burst makes some requests slow, but only a standing queue makes all of them
+    slow. If the minimum is over ``target``, the limit is multiplied by ``backoff``, otherwise it grows
+    by one request per interval during which it was reached.
+
+    Handlers have a priority (0 being the most important) and each priority can only use a share of the
+    limit, given by ``shares``, so that less important requests are shed first
+
+    :param target: The acceptable sojourn time of requests, in seconds
+    :type target: float
+    :param interval: How often (in seconds) the limit is adjusted, defaults to 0.1
+    :type interval: float, optional
+    :param initial_limit: The limit the controller starts with, defaults to 100
+    :type initial_limit: int, optional
+    :param min_limit: The lowest the limit can go, defaults to 1
+    :type min_limit: int, optional
+    :param max_limit: The highest the limit can go, defaults to 1000
+    :type max_limit: int, optional
+    :param backoff: What the limit is multiplied by when there is a standing queue, defaults to 0.9
+    :type backoff: float, optional
+    :param shares: The fraction of the limit each priority can use, indexed by priority. Priorities past the
+    end use the last share, defaults to ``(1.0, 0.8, 0.6)``
+    :type shares: Sequence[float], optional
+    """
+
+    def __init__(
+        self,
+        target: float,
+        interval: float = 0.1,
+        initial_limit: int = 100,
+        min_limit: int = 1,
+        max_limit: int = 1000,
+        backoff: float = 0.9,
+        shares: Sequence[float] = (1.0, 0.8, 0.6),
+    ):
+        """
+        Object constructor
+        """
+
+        if not shares or not all(0 < share <= 1 for share in shares):
+            raise ValueError("shares must be a non-empty sequence of fractions between 0 and 1!")
+        self.target = target
+        self.interval = interval
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.shares = tuple(shares)
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        # Requests that were admitted and haven't completed yet
+        self.in_flight = 0
+        self._interval_end = time.perf_counter() + interval
+        self._min_sojourn = math.inf
+        self._saturated = False
+
+    def try_acquire(self) -> bool:
+        """
+        Admits a new request, unless the limit is reached. Admitted requests must be
+        released with ``release()`` once they complete
+        """
+
+        if self.in_flight >= self.limit:
+            self._saturated = True
+            return False
+        self.in_flight += 1
+        return True
+
+    def admits(self, priority: int) -> bool:
+        """
+        Returns whether an admitted request may be processed by a handler of the given priority,
+        that is, whether requests in flight are within that priority's share of the limit
+        """
+
+        share = self.shares[priority] if priority < len(self.shares) else self.shares[-1]
+        # Not counting the request itself, like try_acquire() did
+        return self.in_flight - 1 < self.limit * share
+
+    def release(self, sojourn: float):
+        """
+        Marks an admitted request as completed
+
+        :param sojourn: How long (in seconds) the request spent in the server
+        :type sojourn: float
+        """
+
+        self.in_flight -= 1
+        if sojourn < self._min_sojourn:
+            self._min_sojourn = sojourn
+        if self.in_flight + 1 >= self.limit:
+            self._saturated = True
+        now = time.perf_counter()
+        if now < self._interval_end:
+            return
+        if self._min_sojourn > self.target:
+            self.limit = max(self.limit * self.backoff, self.min_limit)
+        elif self._saturated:
+            self.limit = min(self.limit + 1, self.max_limit)
+        self._interval_end = now + self.interval
+        self._min_sojourn = math.inf
+        self._saturated = False
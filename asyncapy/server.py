@@ -18,16 +18,36 @@
 
 import trio
 import logging
+import logging.handlers
+import os
+import signal
 import sys
 import uuid
 import json
-from typing import Optional
+from typing import Callable, Optional, List, Sequence, Union
 from .core import Handler, Client, Packet, Session
-from .errors import StopPropagation
+from .errors import StopPropagation, RequestRejected
+from .timers import TimerWheel
+from .backends import TrioBackend, get_backend
+from .util import configure_socket, DroppingQueueHandler
+from .access import AccessLog, AccessRecord, current_record, worker_path
+from .metrics import Registry, AdminServer
+from .watchdog import Watchdog
+from .capture import CaptureWriter, REQUEST, RESPONSE, CLOSE, current_connection
+from .overload import OverloadController
+from .cache import Cache, ResponseCache, ResponseRecorder, Flight, request_key
+from .filters import Filters
 import ziproto
 import configparser
 import time
+import queue
+import random
+import cProfile
+import copy
+import itertools
 import socket
+import ssl
+import stat
 from collections import defaultdict
 from types import FunctionType
 
@@ -35,13 +55,16 @@ from types import FunctionType
 class Server:
     """AsyncAPY server class
 
+    Sending ``SIGHUP`` to the server reloads the configuration file and applies the options
+    listed in ``Server.RELOADABLE`` to the running server
+
     :param addr: The address to which the server will bind to, defaults to ``'127.0.0.1'``
     :type addr: str, optional
     :param port: The port to which the server will bind to, defaults to 8081
     :type port: int, optional
     :param buf: The size of the TCP buffer, defaults to 1024
     :type buf: int, optional
-    :param logging_level: The logging level for the ``logging`` module, defaults to 10 (`DEBUG`)
+    :param logging_level: The logging level for the ``logging`` module, defaults to 20 (`INFO`)
     :type logging_level: int, optional
     :param console_format: The output formatting string for the ``logging`` module,
     defaults to ``'[%(levelname)s] %(asctime)s %(message)s'``
@@ -50,8 +73,143 @@ class Server:
     defaults to ``'%d/%m/%Y %H:%M:%S %p'``
     :type datefmt: str, optional
     :param timeout: The timeout (in seconds) that the server will wait before considering a connection as dead and
-    close it, defaults to 60
+    close it, defaults to 60. This is also the fallback for ``idle_timeout``, ``read_timeout`` and ``handler_timeout``
     :type timeout: int, optional
+    :param idle_timeout: How long (in seconds) a connection may stay silent while waiting for a new packet,
+    defaults to ``None`` (use ``timeout``)
+    :type idle_timeout: int, optional
+    :param read_timeout: How long (in seconds) the server waits for a packet to be complete once its first byte
+    has arrived, defaults to ``None`` (use ``timeout``)
+    :type read_timeout: int, optional
+    :param handler_timeout: How long (in seconds) handlers may take to process a single packet, defaults to ``None``
+    (use ``timeout``)
+    :type handler_timeout: int, optional
+    :param keep_alive: If ``True``, connections are kept open after a packet has been dispatched so that clients
+    can send more packets on the same connection, defaults to ``False``
+    :type keep_alive: bool, optional
+    :param timer_resolution: The granularity (in seconds) of the timer wheel tracking all the deadlines above,
+    defaults to 0.1
+    :type timer_resolution: float, optional
+    :param reuse_port: When running multiple workers (see ``Server.start()``), make each worker bind its own socket
+    with ``SO_REUSEPORT`` so that the kernel balances connections across them. If ``False``, or if the platform lacks
+    ``SO_REUSEPORT``, workers share a single listening socket bound by the master process, defaults to ``True``
+    :type reuse_port: bool, optional
+    :param unix_path: If set, the server also listens on a Unix domain socket at this path, which is faster than
+    TCP for clients running on the same host, defaults to ``None``
+    :type unix_path: str, optional
+    :param fds: A list of file descriptors of already bound and listening sockets, inherited from the parent
+    process (e.g. when using socket activation), that the server should also accept connections from,
+    defaults to ``None``
+    :type fds: List[int], optional
+    :param tcp: If ``False``, the server won't listen on ``addr:port``, which is useful to serve only on
+    ``unix_path`` or ``fds``, defaults to ``True``
+    :type tcp: bool, optional
+    :param certfile: The path to a PEM file with the server's certificate chain. If set, TCP connections are
+    encrypted with TLS (Unix domain socket connections never are), defaults to ``None``
+    :type certfile: str, optional
+    :param keyfile: The path to the private key of ``certfile``, defaults to ``None`` (the key is in ``certfile``)
+    :type keyfile: str, optional
+    :param ssl_context: A custom ``ssl.SSLContext`` to use instead of the one built from ``certfile`` and
+    ``keyfile``, defaults to ``None``
+    :type ssl_context: class: ``ssl.SSLContext``, optional
+    :param drain_timeout: When the server receives ``SIGTERM``, it stops accepting connections and waits up to this
+    many seconds for the packets that are being processed before shutting down, defaults to 30
+    :type drain_timeout: int, optional
+    :param backlog: The maximum number of pending connections on listening sockets, defaults to ``None``
+    (the operating system's maximum)
+    :type backlog: int, optional
+    :param tcp_nodelay: If ``True``, Nagle's algorithm is disabled on TCP connections so that small responses
+    are sent right away, defaults to ``True``
+    :type tcp_nodelay: bool, optional
+    :param rcvbuf: The size (in bytes) of the kernel's receive buffer for each connection, defaults to ``None``
+    (the operating system's default)
+    :type rcvbuf: int, optional
+    :param sndbuf: The size (in bytes) of the kernel's send buffer for each connection, defaults to ``None``
+    (the operating system's default)
+    :type sndbuf: int, optional
+    :param tcp_keepalive: If set, TCP keepalive probes are sent on connections that have been idle for this many
+    seconds, to detect dead peers, defaults to ``None`` (disabled)
+    :type tcp_keepalive: int, optional
+    :param max_connections: The maximum number of concurrent connections: when the limit is reached, the server
+    stops accepting until a connection is closed and new clients wait in the listen backlog, defaults to 0
+    (unlimited). When running multiple workers, the limit applies to each of them
+    :type max_connections: int, optional
+    :param log_queue_size: Log records are handed to a background thread through a queue of this size, so that
+    writing them never blocks the event loop. Records that don't fit in the queue are dropped and counted in
+    ``Server.dropped_log_records``. If 0, records are written synchronously, defaults to 10000
+    :type log_queue_size: int, optional
+    :param access_log: If set, one JSON line per request (with its session, peer, encoding, sizes, handler, group,
+    status and the time spent in each stage) is written to this file by a background thread. An ``AccessLog`` object
+    can be passed instead of a path to customize the writer. When running multiple workers, each of them writes
+    to its own file (``access.log`` becomes ``access.worker0.log`` and so on), defaults to ``None`` (disabled)
+    :type access_log: Union[str, AccessLog], optional
+    :param access_log_max_bytes: The size (in bytes) at which the access log is rotated, defaults to 64 MiB
+    :type access_log_max_bytes: int, optional
+    :param access_log_backups: How many rotated access logs are kept, defaults to 5
+    :type access_log_backups: int, optional
+    :param metrics_port: If set, the metrics in ``Server.metrics`` are served in the Prometheus text format at
+    ``http://metrics_addr:metrics_port/metrics``. When running multiple workers, each of them serves its own
+    metrics on ``metrics_port + worker_id``, defaults to ``None`` (disabled)
+    :type metrics_port: int, optional
+    :param metrics_addr: The address the metrics listener binds to, defaults to ``'127.0.0.1'``
+    :type metrics_addr: str, optional
+    :param trace_sample_rate: The fraction of requests (between 0 and 1) whose pipeline is traced: the time spent
+    reading the frame (``read``), decoding it (``decode``), setting up the session (``prepare``), evaluating filters
+    (``filters``), in the handler (``handler``), encoding responses (``encode``) and sending them (``send``) is
+    measured and handed to ``trace_sink``, defaults to 0 (disabled)
+    :type trace_sample_rate: float, optional
+    :param trace_sink: A callable receiving the ``AccessRecord`` of each traced request, called from the event
+    loop so it must be fast, defaults to ``None`` (stage durations go to the ``asyncapy_stage_duration_seconds``
+    histogram of ``Server.metrics``)
+    :type trace_sink: Callable, optional
+    :param profile_threshold: If set, traced requests are also profiled with ``cProfile`` (one at a time), and the
+    profile of those taking longer than this many seconds is saved in ``profile_dir``, defaults to ``None``
+    (disabled)
+    :type profile_threshold: float, optional
+    :param profile_dir: Where profiles of slow requests are saved, defaults to ``'.'``
+    :type profile_dir: str, optional
+    :param watchdog_budget: If set, a watchdog measures the event loop's scheduler lag (exported through
+    ``Server.metrics``) and logs the stack of the loop, and the name of the running handler, whenever the loop
+    is blocked for longer than this many seconds, e.g. by a handler doing blocking I/O, defaults to ``None``
+    (disabled)
+    :type watchdog_budget: float, optional
+    :param capture: If set, every complete frame received is recorded, along with the time it arrived at and the
+    connection it came from, in this capture file, which can be replayed with ``python -m asyncapy.bench.replay``.
+    When running multiple workers, each of them writes to its own file, defaults to ``None`` (disabled)
+    :type capture: str, optional
+    :param capture_responses: If ``True``, responses are recorded in the capture too, defaults to ``False``
+    :type capture_responses: bool, optional
+    :param capture_max_bytes: Frames that would make the capture larger than this are dropped, defaults to 1 GiB
+    :type capture_max_bytes: int, optional
+    :param overload_target: If set, the server sheds load when it can't keep up: the number of requests processed
+    at once is limited, and the limit adapts so that requests don't spend much longer than this many seconds in the
+    server. New requests over the limit are answered with ``ERR_OVERLOADED`` before their payload is even decoded,
+    defaults to ``None`` (disabled)
+    :type overload_target: float, optional
+    :param overload_max_limit: The highest the limit on requests processed at once can go, defaults to 1000
+    :type overload_max_limit: int, optional
+    :param overload_shares: The fraction of the limit that handlers of each priority (see ``add_handler()``) can use,
+    indexed by priority, so that less important requests are shed first, defaults to ``(1.0, 0.8, 0.6)``
+    :type overload_shares: Sequence[float], optional
+    :param max_frame_size: The largest ``Content-Length`` a client may announce, checked as soon as the header is read
+    and before any memory is set aside for the frame. Larger frames are answered with ``ERR_FRAME_TOO_LARGE`` and the
+    connection is closed. If 0, the size isn't limited, defaults to 16 MiB
+    :type max_frame_size: int, optional
+    :param min_read_rate: If set, clients must send every frame at this many bytes per second at least, counted from
+    its first byte (after a ``read_grace_period``), otherwise they're answered with ``ERR_READ_TOO_SLOW`` and
+    disconnected. This stops clients trickling bytes in from holding connections for the whole ``read_timeout``,
+    defaults to 0 (disabled)
+    :type min_read_rate: int, optional
+    :param read_grace_period: How many seconds every frame is given on top of the time ``min_read_rate`` allows,
+    to absorb connection hiccups and small frames, defaults to 1
+    :type read_grace_period: float, optional
+    :param frame_memory_budget: If set, the total size (in bytes) of the frames being received at once across all
+    connections. A frame that would exceed it is answered with ``ERR_MEMORY_BUDGET_EXCEEDED`` and its connection
+    is closed, defaults to 0 (disabled)
+    :type frame_memory_budget: int, optional
+    :param response_cache_size: The maximum total size (in bytes) of the responses cached for handlers registered
+    with ``cache=...`` (see ``add_handler()``), defaults to 64 MiB
+    :type response_cache_size: int, optional
     :param header_size: The size of the ``Content-Length`` header can be customized.
     In an environment with small payloads a 2-byte header may be used to reduce overhead, defaults to 4
     :type header_size: int, optional
@@ -68,6 +226,23 @@ class Server:
 
     _handlers = {}
     _sessions = defaultdict(list)
+    # Options that can be changed at runtime by reloading the configuration file
+    RELOADABLE = (
+        "timeout",
+        "idle_timeout",
+        "read_timeout",
+        "handler_timeout",
+        "keep_alive",
+        "buf",
+        "session_limit",
+        "logging_level",
+        "drain_timeout",
+        "trace_sample_rate",
+        "max_frame_size",
+        "min_read_rate",
+        "read_grace_period",
+        "frame_memory_budget",
+    )
 
     def __init__(
         self,
@@ -83,6 +258,47 @@ class Server:
         config: str or None = None,
         cfg_parser=None,
         session_limit: int = 0,
+        idle_timeout: Optional[int] = None,
+        read_timeout: Optional[int] = None,
+        handler_timeout: Optional[int] = None,
+        keep_alive: bool = False,
+        timer_resolution: float = 0.1,
+        reuse_port: bool = True,
+        unix_path: Optional[str] = None,
+        fds: Optional[List[int]] = None,
+        tcp: bool = True,
+        certfile: Optional[str] = None,
+        keyfile: Optional[str] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        drain_timeout: int = 30,
+        backlog: Optional[int] = None,
+        tcp_nodelay: bool = True,
+        rcvbuf: Optional[int] = None,
+        sndbuf: Optional[int] = None,
+        tcp_keepalive: Optional[int] = None,
+        max_connections: int = 0,
+        log_queue_size: int = 10000,
+        access_log: Optional[Union[str, AccessLog]] = None,
+        access_log_max_bytes: int = 64 * 1024 * 1024,
+        access_log_backups: int = 5,
+        metrics_port: Optional[int] = None,
+        metrics_addr: str = "127.0.0.1",
+        trace_sample_rate: float = 0.0,
+        trace_sink: Optional[Callable[[AccessRecord], None]] = None,
+        profile_threshold: Optional[float] = None,
+        profile_dir: str = ".",
+        watchdog_budget: Optional[float] = None,
+        capture: Optional[str] = None,
+        capture_responses: bool = False,
+        capture_max_bytes: int = 1024 * 1024 * 1024,
+        overload_target: Optional[float] = None,
+        overload_max_limit: int = 1000,
+        overload_shares: Sequence[float] = (1.0, 0.8, 0.6),
+        max_frame_size: int = 16 * 1024 * 1024,
+        min_read_rate: int = 0,
+        read_grace_period: float = 1,
+        frame_memory_budget: int = 0,
+        response_cache_size: int = 64 * 1024 * 1024,
     ):
         """Object constructor"""
 
@@ -104,6 +320,69 @@ class Server:
             raise TypeError("console_format must be a string!")
         if not isinstance(session_limit, int):
             raise TypeError("session_limit must be int!")
+        for name, value in (
+            ("idle_timeout", idle_timeout),
+            ("read_timeout", read_timeout),
+            ("handler_timeout", handler_timeout),
+        ):
+            if value is not None and not isinstance(value, int):
+                raise TypeError(f"{name} must be an integer or None!")
+        if not isinstance(timer_resolution, (int, float)):
+            raise TypeError("timer_resolution must be a number!")
+        if unix_path is not None and not isinstance(unix_path, str):
+            raise TypeError("unix_path must be a string!")
+        if fds is not None and not all(isinstance(fd, int) for fd in fds):
+            raise TypeError("fds must be a list of integers!")
+        if ssl_context is not None and not isinstance(ssl_context, ssl.SSLContext):
+            raise TypeError("ssl_context must be an ssl.SSLContext object!")
+        if not isinstance(drain_timeout, int):
+            raise TypeError("drain_timeout must be an integer!")
+        for name, value in (
+            ("backlog", backlog),
+            ("rcvbuf", rcvbuf),
+            ("sndbuf", sndbuf),
+            ("tcp_keepalive", tcp_keepalive),
+        ):
+            if value is not None and not isinstance(value, int):
+                raise TypeError(f"{name} must be an integer or None!")
+        if not isinstance(max_connections, int):
+            raise TypeError("max_connections must be an integer!")
+        if not isinstance(log_queue_size, int):
+            raise TypeError("log_queue_size must be an integer!")
+        if access_log is not None and not isinstance(access_log, (str, AccessLog)):
+            raise TypeError("access_log must be a string or an AccessLog object!")
+        if not isinstance(access_log_max_bytes, int) or not isinstance(access_log_backups, int):
+            raise TypeError("access_log_max_bytes and access_log_backups must be integers!")
+        if metrics_port is not None and not isinstance(metrics_port, int):
+            raise TypeError("metrics_port must be an integer or None!")
+        if not isinstance(metrics_addr, str):
+            raise TypeError("metrics_addr must be a string!")
+        if not isinstance(trace_sample_rate, (int, float)) or not 0 <= trace_sample_rate <= 1:
+            raise TypeError("trace_sample_rate must be a number between 0 and 1!")
+        if trace_sink is not None and not callable(trace_sink):
+            raise TypeError("trace_sink must be callable!")
+        if profile_threshold is not None and not isinstance(profile_threshold, (int, float)):
+            raise TypeError("profile_threshold must be a number or None!")
+        if watchdog_budget is not None and not isinstance(watchdog_budget, (int, float)):
+            raise TypeError("watchdog_budget must be a number or None!")
+        if capture is not None and not isinstance(capture, str):
+            raise TypeError("capture must be a string or None!")
+        if not isinstance(capture_max_bytes, int):
+            raise TypeError("capture_max_bytes must be an integer!")
+        if overload_target is not None and not isinstance(overload_target, (int, float)):
+            raise TypeError("overload_target must be a number or None!")
+        if not isinstance(overload_max_limit, int):
+            raise TypeError("overload_max_limit must be an integer!")
+        if not isinstance(max_frame_size, int):
+            raise TypeError("max_frame_size must be an integer!")
+        if not isinstance(min_read_rate, int):
+            raise TypeError("min_read_rate must be an integer!")
+        if not isinstance(read_grace_period, (int, float)):
+            raise TypeError("read_grace_period must be a number!")
+        if not isinstance(frame_memory_budget, int):
+            raise TypeError("frame_memory_budget must be an integer!")
+        if not isinstance(response_cache_size, int):
+            raise TypeError("response_cache_size must be an integer!")
         self.addr = addr
         self.port = port
         self.buf = buf
@@ -111,33 +390,106 @@ class Server:
         self.console_format = console_format
         self.datefmt = datefmt
         self.timeout = timeout
-        socket.setdefaulttimeout(
-            self.timeout
-        )  # Just to make sure the socket doesn't die
         self.header_size = header_size
         self.byteorder = byteorder
         self.config = None
         self.session_limit = session_limit
+        self.idle_timeout = idle_timeout
+        self.read_timeout = read_timeout
+        self.handler_timeout = handler_timeout
+        self.keep_alive = keep_alive
+        self.timer_resolution = timer_resolution
+        self.reuse_port = reuse_port
+        # The ID of the current worker process, None when running in a single process
+        self.worker_id = None
+        self.unix_path = unix_path
+        self.fds = fds or []
+        self.tcp = tcp
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.ssl_context = ssl_context
+        self.drain_timeout = drain_timeout
+        self.backlog = backlog
+        self.tcp_nodelay = tcp_nodelay
+        self.rcvbuf = rcvbuf
+        self.sndbuf = sndbuf
+        self.tcp_keepalive = tcp_keepalive
+        self.max_connections = max_connections
+        self.log_queue_size = log_queue_size
+        self._log_handler = None
+        self._log_listener = None
+        self.access_log = access_log
+        self.access_log_max_bytes = access_log_max_bytes
+        self.access_log_backups = access_log_backups
+        self._access_log = None
+        self.metrics_addr = metrics_addr
+        self.metrics_port = metrics_port
+        self.metrics = Registry()
+        self._admin = None
+        self.trace_sample_rate = trace_sample_rate
+        self.trace_sink = trace_sink
+        self.profile_threshold = profile_threshold
+        self.profile_dir = profile_dir
+        self._profiler = None
+        self.watchdog_budget = watchdog_budget
+        self._watchdog = None
+        self.capture = capture
+        self.capture_responses = capture_responses
+        self.capture_max_bytes = capture_max_bytes
+        self._capture = None
+        # Connections are numbered in captures, see _handle_client
+        self._connection_ids = itertools.count()
+        # (error, encoding) -> pre-encoded error response, see _error_frame
+        self._error_frames = {}
+        self.overload_target = overload_target
+        self.overload_max_limit = overload_max_limit
+        self.overload_shares = overload_shares
+        self._overload = None
+        self.max_frame_size = max_frame_size
+        self.min_read_rate = min_read_rate
+        self.read_grace_period = read_grace_period
+        self.frame_memory_budget = frame_memory_budget
+        # The total size of the frames being received, see frame_memory_budget
+        self._frame_memory = 0
+        self.response_cache_size = response_cache_size
+        # Created when the first cached handler is registered
+        self._response_cache = None
+        # (handler, request key) -> Flight, for handlers registered with singleflight=True
+        self._flights = {}
+        self._register_metrics()
+        self.backend = "trio"
+        self._backend = TrioBackend()
+        # The timers of all open connections, see _handle_client
+        self._connections = set()
+        self._draining = False
+        # Sockets bound by the supervisor and shared by its workers
+        self._listen_sockets = None
         if config:
             self.config, self.parser = config, cfg_parser
             self.load_config()
+        self._timers = TimerWheel(resolution=self.timer_resolution)
 
     # noinspection PyMethodMayBeStatic
     async def run_sync_task(self, sync_fn, *args, cancellable=False, limiter=None):
         """
         Convert a blocking operation into an async operation using a thread.
 
-        This is just a shorthand for ``trio.to_thread.run_sync()``,  check `trio's documentation <https://trio.readthedocs.io/en/stable/reference-core.html#trio.to_thread.run_sync>`_
-        to know more
+        With the default backend, this is just a shorthand for ``trio.to_thread.run_sync()``,  check `trio's documentation <https://trio.readthedocs.io/en/stable/reference-core.html#trio.to_thread.run_sync>`_
+        to know more. With the asyncio backend, the function runs in the event loop's default executor
+        and ``cancellable`` and ``limiter`` are ignored
         """
 
-        return await trio.to_thread.run_sync(
+        return await self._backend.run_sync_in_thread(
             sync_fn, *args, cancellable=cancellable, limiter=limiter
         )
 
-    def load_config(self):
+    def _read_config(self) -> dict:
         """
-        Loads the configuration file and applies changes. This method is meant for internal use
+        Reads the configuration file and returns the options it contains, already
+        converted to the appropriate types
+
+        :returns: A dictionary mapping option names to their values
+        :rtype: dict
         """
 
         parser = self.parser if self.parser else configparser.ConfigParser()
@@ -155,15 +507,93 @@ class Server:
             "buf",
             "logging_level",
             "session_limit",
+            "idle_timeout",
+            "read_timeout",
+            "handler_timeout",
+            "keep_alive",
+            "timer_resolution",
+            "reuse_port",
+            "unix_path",
+            "fds",
+            "tcp",
+            "certfile",
+            "keyfile",
+            "drain_timeout",
+            "backlog",
+            "tcp_nodelay",
+            "rcvbuf",
+            "sndbuf",
+            "tcp_keepalive",
+            "max_connections",
+            "backend",
+            "log_queue_size",
+            "access_log",
+            "access_log_max_bytes",
+            "access_log_backups",
+            "metrics_port",
+            "metrics_addr",
+            "trace_sample_rate",
+            "profile_threshold",
+            "profile_dir",
+            "watchdog_budget",
+            "capture",
+            "capture_responses",
+            "capture_max_bytes",
+            "overload_target",
+            "overload_max_limit",
+            "max_frame_size",
+            "min_read_rate",
+            "read_grace_period",
+            "frame_memory_budget",
         )
         options = {}
         for config in configs:
-            options[config] = parser.get("AsyncAPY", config, fallback=None)
-        for option_name, option_value in options.items():
+            option_value = parser.get("AsyncAPY", config, fallback=None)
             if option_value:
                 if option_value.isdigit():
                     option_value = int(option_value)
-                setattr(self, option_name, option_value)
+                elif option_value.lower() in ("true", "yes", "on"):
+                    option_value = True
+                elif option_value.lower() in ("false", "no", "off"):
+                    option_value = False
+                else:
+                    try:
+                        option_value = float(option_value)
+                    except ValueError:
+                        pass
+                options[config] = option_value
+        return options
+
+    def load_config(self):
+        """
+        Loads the configuration file and applies changes. This method is meant for internal use
+        """
+
+        for option_name, option_value in self._read_config().items():
+            setattr(self, option_name, option_value)
+
+    def reload_config(self):
+        """
+        Reloads the configuration file and applies the options in ``Server.RELOADABLE`` (the other ones,
+        like the address or the header size, can't change while the server is running). This is called
+        when the server receives ``SIGHUP``, but can also be called manually
+        """
+
+        if not self.config:
+            logging.warning("{API main} No configuration file to reload")
+            return
+        try:
+            options = self._read_config()
+        except (OSError, configparser.Error) as config_error:
+            logging.error(
+                "{API main} Could not reload the configuration file -> %s", config_error
+            )
+            return
+        for option_name in self.RELOADABLE:
+            if option_name in options:
+                setattr(self, option_name, options[option_name])
+        logging.getLogger().setLevel(self.logging_level)
+        logging.info("{API main} Configuration reloaded")
 
     # DEFAULT API RESPONSE HANDLERS #
 
@@ -264,6 +694,85 @@ class Server:
             stream, response_data, session_id, from_client=False, encoding=encoding
         )
 
+    def _error_frame(self, error: str, encoding: str) -> bytes:
+        """
+        Returns the complete frame of an error response, which is only encoded
+        the first time it's needed
+
+        :param error: The error code, e.g. ``'ERR_RATE_LIMITED'``
+        :type error: str
+        :param encoding: The encoding of the frame, ``'json'`` or ``'ziproto'``
+        :type encoding: str
+        """
+
+        try:
+            return self._error_frames[error, encoding]
+        except KeyError:
+            payload = {"status": "failure", "error": error}
+            if encoding == "json":
+                payload = json.dumps(payload).encode("utf-8")
+            else:
+                payload = ziproto.encode(payload)
+            frame = self._error_frames[error, encoding] = (
+                (len(payload) + 2).to_bytes(self.header_size, self.byteorder)
+                + (22).to_bytes(1, self.byteorder)
+                + (0 if encoding == "json" else 1).to_bytes(1, self.byteorder)
+                + payload
+            )
+            return frame
+
+    async def _rejected(
+        self, session_id: uuid.uuid4, stream: trio.SocketStream, error: str, encoding: str
+    ):
+        """
+        This is an internal method used to reply to a request that was rejected by a filter (see
+        ``AsyncAPY.errors.RequestRejected``) or shed because the server is overloaded. Unlike other errors,
+        the connection is left open, since the request itself was valid
+
+        :param session_id: A unique UUID, used to identify the current session
+        :type session_id: class: ``uuid.uuid4``
+        :param stream: The trio asynchronous socket associated to a client, can be found in ``Client._stream``
+        :type stream: class: ``trio.SocketStream``
+        :param error: The error code
+        :type error: str
+        :param encoding: The encoding of the request, ``'json'`` or ``'ziproto'``
+        :type encoding: str
+        """
+
+        self._metric_errors.labels(error).inc()
+        record = current_record.get()
+        if record is not None:
+            record.status = error
+        await self._send(
+            stream, self._error_frame(error, encoding), session_id, close=False
+        )
+
+    async def _frame_rejected(
+        self, session_id: uuid.uuid4, stream: trio.SocketStream, error: str, reason: str
+    ):
+        """
+        This is an internal method used to reply to a client whose frame was refused by the framing layer, before
+        it was complete (see ``max_frame_size``, ``min_read_rate`` and ``frame_memory_budget``). The rest of the
+        frame is never read, so the connection is closed
+
+        :param session_id: A unique UUID, used to identify the current session
+        :type session_id: class: ``uuid.uuid4``
+        :param stream: The trio asynchronous socket associated to a client, can be found in ``Client._stream``
+        :type stream: class: ``trio.SocketStream``
+        :param error: The error code
+        :type error: str
+        :param reason: The label of the ``asyncapy_rejected_frames`` metric
+        :type reason: str
+        """
+
+        self._metric_errors.labels(error).inc()
+        self._metric_rejected_frames.labels(reason).inc()
+        record = current_record.get()
+        if record is not None:
+            record.status = error
+        # The encoding of the frame is unknown, or at least untrusted
+        await self._send(stream, self._error_frame(error, "json"), session_id)
+
     # END OF RESPONSE HANDLERS SECTION #
 
     def register_handler(self, handler, *filters, **kwargs):
@@ -276,14 +785,46 @@ class Server:
         :type filters: Filter, optional
         :param group: The group id, default to 0
         :type group: int, optional
+        :param priority: The priority of the handler when the server is overloaded, 0 being the most important:
+        handlers with a higher number are shed first, see ``overload_target``, defaults to 0
+        :type priority: int, optional
+        :param cache: If set, the handler's responses are cached, either for this many seconds or according to
+        a ``Cache`` object. Once the handler's filters pass (so rate limits and API key quotas still apply), a
+        request with the same fields (in any order) and encoding is answered with the cached frames instead of
+        calling the handler, so this is only suitable for handlers whose response depends on nothing but the
+        request's fields (or the client's IP, with ``Cache(ttl, by_ip=True)``). Responses are only cached if the
+        handler returned normally without closing the connection, defaults to ``None``
+        :type cache: Union[float, Cache], optional
+        :param singleflight: If ``True``, concurrent requests with the same fields (in any order) reaching the
+        handler share a single execution of it: the first one runs the handler and the others wait for it, then
+        get the same response, encoded once for each encoding. Their filters still run, but the handler only
+        sees the first request, so its response must depend on nothing but the request's fields. If the handler
+        raises an exception (``StopPropagation`` included), the waiting requests raise a copy of it, chained to
+        it. If the request running the handler is cancelled (e.g. it timed out), or its response can't be
+        converted to the encoding of a waiting request, the handler runs again, defaults to ``False``
+        :type singleflight: bool, optional
         """
 
         group = kwargs.get("group", 0)
+        priority = kwargs.get("priority", 0)
+        cache = kwargs.get("cache")
+        singleflight = kwargs.get("singleflight", False)
+        if not isinstance(singleflight, bool):
+            raise TypeError("singleflight must be a boolean!")
+        if not isinstance(priority, int) or priority < 0:
+            raise TypeError("priority must be a non-negative integer!")
+        if cache is not None:
+            if isinstance(cache, (int, float)):
+                cache = Cache(cache)
+            elif not isinstance(cache, Cache):
+                raise TypeError("cache must be a number, a Cache object or None!")
+            if self._response_cache is None:
+                self._response_cache = ResponseCache(self.response_cache_size)
         if group in self._handlers:
-            self._handlers[group].append(Handler(handler, list(filters)))
+            self._handlers[group].append(Handler(handler, list(filters), priority, cache, singleflight))
         else:
             self._handlers[group] = [
-                Handler(handler, list(filters)),
+                Handler(handler, list(filters), priority, cache, singleflight),
             ]
         # This keeps our handlers sorted
         self._handlers = dict(sorted(self._handlers.items()))
@@ -300,6 +841,14 @@ class Server:
         :type filters: Filter, optional
         :param group: The group id, default to 0
         :type group: int, optional
+        :param priority: The priority of the handler when the server is overloaded, defaults to 0 (the highest)
+        :type priority: int, optional
+        :param cache: Caches the handler's responses for this many seconds, see ``register_handler()``,
+        defaults to ``None``
+        :type cache: Union[float, Cache], optional
+        :param singleflight: Coalesces identical concurrent requests into a single execution of the handler,
+        see ``register_handler()``, defaults to ``False``
+        :type singleflight: bool, optional
         """
 
         def wrapper(func):
@@ -340,9 +889,14 @@ class Server:
 
         """
 
+        record = current_record.get()
         if not from_client:
+            payload = json.loads(response_data[self.header_size:])
+            self._metric_errors.labels(payload.get("error")).inc()
+            if record is not None:
+                record.status = payload.get("error")
             if encoding == 1:
-                payload = ziproto.encode(json.loads(response_data[self.header_size:]))
+                payload = ziproto.encode(payload)
                 header = (
                     (len(payload) + 2).to_bytes(self.header_size, self.byteorder)
                     + (22).to_bytes(1, self.byteorder)
@@ -355,34 +909,44 @@ class Server:
                     + (22).to_bytes(1, self.byteorder)
                     + (0).to_bytes(1, self.byteorder)
                 )
-                payload = json.loads(response_data[self.header_size:])
                 response_data = header + json.dumps(payload).encode("utf-8")
         try:
             logging.debug(
-                f"({session_id}) {{Response Handler}} Sending response to client"
+                "(%s) {Response Handler} Sending response to client", session_id
             )
-            await stream.send_all(response_data)
+            if record is None:
+                await stream.send_all(response_data)
+            else:
+                start = time.perf_counter()
+                await stream.send_all(response_data)
+                record.add("send", time.perf_counter() - start)
+                record.response_bytes += len(response_data)
         except trio.BrokenResourceError:
             logging.info(
-                f"({session_id}) {{Response Handler}} The connection was closed abruptly"
+                "(%s) {Response Handler} The connection was closed abruptly", session_id
             )
             await stream.aclose()
             return False
         except trio.ClosedResourceError:
             logging.info(
-                f"({session_id}) {{Response Handler}} The connection was closed"
+                "(%s) {Response Handler} The connection was closed", session_id
             )
             await stream.aclose()
             return False
         except trio.BusyResourceError as busy:
             logging.error(
-                f"({session_id}) {{Response Handler}} Client is sending too fast! Or is the server overloaded? -> "
-                f"{busy}"
+                "(%s) {Response Handler} Client is sending too fast! Or is the server overloaded? -> %s",
+                session_id,
+                busy,
             )
             await stream.aclose()
             return False
         else:
-            logging.debug(f"({session_id}) {{Response Handler}} Response sent")
+            logging.debug("(%s) {Response Handler} Response sent", session_id)
+            if self._capture is not None and self.capture_responses:
+                self._capture.write(RESPONSE, current_connection.get(), response_data)
+            self._metric_frames_sent.inc()
+            self._metric_bytes_sent.inc(len(response_data))
             if close:
                 await stream.aclose()
             return True
@@ -392,7 +956,8 @@ class Server:
     ):
         """
         This function gets called when a stream's length is smaller than ``self.header_size`` bytes, which
-        is the minimum amount of data needed to parse an API call (The length header)
+        is the minimum amount of data needed to parse an API call (The length header). Reads are not limited
+        to the missing bytes, so the returned data may go past the header
 
         :param session_id: A unique UUID, used to identify the current session
         :type session_id: class: ``uuid.uuid4``
@@ -400,42 +965,53 @@ class Server:
         :type stream: class : ``trio.SocketStream``
         :param raw_data: If some data was received already, it has to be passed here as paramater
         :type raw_data: bytes
-        :returns: The rebuilt length header or None if the connection dies
+        :returns: The data received so far, starting with the rebuilt length header, or None if the connection dies
         :rtype: Union[bytes, None]
         """
 
         while len(raw_data) < self.header_size:
             try:
                 logging.debug(
-                    f"({session_id}) {{Stream rebuilder}} Requesting 1 more byte"
+                    "(%s) {Stream rebuilder} Requesting %s more byte(s)",
+                    session_id,
+                    self.header_size - len(raw_data),
                 )
-                raw_data += await stream.receive_some(1)
+                chunk = await stream.receive_some(max_bytes=self.buf)
             except trio.BrokenResourceError:
                 logging.info(
-                    f"({session_id}) {{Stream rebuilder}} The connection was closed abruptly"
+                    "(%s) {Stream rebuilder} The connection was closed abruptly",
+                    session_id,
                 )
                 await stream.aclose()
-                break
+                return
             except trio.ClosedResourceError:
                 logging.info(
-                    f"({session_id}) {{Stream rebuilder}} The connection was closed"
+                    "(%s) {Stream rebuilder} The connection was closed", session_id
                 )
                 await stream.aclose()
-                break
+                return
             except trio.BusyResourceError as busy:
                 logging.error(
-                    f"({session_id}) {{Response Handler}} Client is sending too fast! Or is the server overloaded? -> "
-                    f"{busy}"
+                    "(%s) {Response Handler} Client is sending too fast! Or is the server overloaded? -> %s",
+                    session_id,
+                    busy,
                 )
                 await stream.aclose()
                 return
+            if not chunk:
+                logging.info("(%s) {Stream rebuilder} Stream has ended", session_id)
+                await stream.aclose()
+                return
+            raw_data += chunk
         logging.debug(
-            f"({session_id}) {{Stream rebuilder}} Stream is now {self.header_size} byte(s) long"
+            "(%s) {Stream rebuilder} Stream is now %s byte(s) long",
+            session_id,
+            len(raw_data),
         )
         return raw_data
 
     async def _complete_stream(
-        self, header, stream: trio.SocketStream, session_id: uuid.uuid4
+        self, header, stream: trio.SocketStream, session_id: uuid.uuid4, stream_data: bytes = b""
     ):
         """
         This functions completes the stream until the specified length is reached
@@ -446,38 +1022,53 @@ class Server:
         :type stream: class : ``trio.SocketStream``
         :param session_id: A unique UUID, used to identify the current session
         :type session_id: class: ``uuid.uuid4``
-        :returns: The complete packet, or ``None`` if the connection dies
+        :param stream_data: The part of the packet that was already received, if any, defaults to ``b""``
+        :type stream_data: bytes, optional
+        :returns: The complete packet (which may be followed by the beginning of the next one),
+        or ``None`` if the connection dies
         :rtype: Union[bytes, None]
         """
 
-        stream_data = b""
         logging.debug(
-            f"({session_id}) {{Rebuilder}} Requesting {self.buf} more bytes until length {header}"
+            "(%s) {Rebuilder} Requesting %s more bytes until length %s",
+            session_id,
+            header - len(stream_data),
+            header,
         )
-        while len(stream_data) < header:
+        # Chunks are joined once at the end, rather than copying the whole frame on every read
+        chunks = [stream_data]
+        received = len(stream_data)
+        while received < header:
             try:
-                stream_data += await stream.receive_some(max_bytes=self.buf)
+                # Large frames are read in larger chunks, but never more than 64 KiB are allocated at once
+                chunk = await stream.receive_some(
+                    max_bytes=max(self.buf, min(header - received, 65536))
+                )
             except trio.BusyResourceError as busy:
                 logging.error(
-                    f"({session_id}) {{Rebuilder}} Client is sending too fast! Or is the server overloaded? -> {busy}"
+                    "(%s) {Rebuilder} Client is sending too fast! Or is the server overloaded? -> %s",
+                    session_id,
+                    busy,
                 )
                 await stream.aclose()
                 return
             except trio.BrokenResourceError:
                 logging.info(
-                    f"({session_id}) {{Rebuilder}} The connection was closed abruptly"
+                    "(%s) {Rebuilder} The connection was closed abruptly", session_id
                 )
                 await stream.aclose()
-                break
+                return
             except trio.ClosedResourceError:
-                logging.info(f"({session_id}) {{Rebuilder}} The connection was closed")
+                logging.info("(%s) {Rebuilder} The connection was closed", session_id)
                 await stream.aclose()
-                break
-            if not stream:
-                logging.info(f"({session_id}) {{Rebuilder}} Stream has ended")
+                return
+            if not chunk:
+                logging.info("(%s) {Rebuilder} Stream has ended", session_id)
                 await stream.aclose()
-                break
-        return stream_data
+                return
+            chunks.append(chunk)
+            received += len(chunk)
+        return b"".join(chunks)
 
     async def _decode_payload(
         self, content, session_id: str, stream: trio.SocketStream, encoding=None
@@ -502,21 +1093,29 @@ class Server:
                 data = json.loads(content)
             except json.decoder.JSONDecodeError as json_error:
                 logging.error(
-                    f"({session_id}) {{Request Decoder}} Invalid JSON data, full exception -> {json_error}"
+                    "(%s) {Request Decoder} Invalid JSON data, full exception -> %s",
+                    session_id,
+                    json_error,
                 )
+                self._metric_decode_errors.labels("json").inc()
                 await self._malformed_request(session_id, stream, encoding=0)
         else:
             try:
                 data = ziproto.decode(content)
                 if not isinstance(data, dict):
                     logging.error(
-                        f"({session_id}) {{Request Decoder}} Invalid ziproto encoded payload!"
+                        "(%s) {Request Decoder} Invalid ziproto encoded payload!",
+                        session_id,
                     )
+                    self._metric_decode_errors.labels("ziproto").inc()
                     await self._malformed_request(session_id, stream, encoding=1)
             except Exception as e:
                 logging.error(
-                    f"({session_id}) {{Request Decoder}} Something went wrong while deserializing ZiProto -> {e}"
+                    "(%s) {Request Decoder} Something went wrong while deserializing ZiProto -> %s",
+                    session_id,
+                    e,
                 )
+                self._metric_decode_errors.labels("ziproto").inc()
                 await self._malformed_request(session_id, stream, encoding=1)
         return data
 
@@ -530,8 +1129,8 @@ class Server:
         if self.session_limit:
             if len(client.get_sessions()) > self.session_limit:
                 logging.warning(
-                    f"({session_id}) {{Session Handler}} Maximum number of concurrent sessions reached! "
-                    f"Closing the current one"
+                    "(%s) {Session Handler} Maximum number of concurrent sessions reached! Closing the current one",
+                    session_id,
                 )
                 self._sessions[client.address].remove(client.session)
                 await self._session_limit_reached(session_id, client._stream)
@@ -549,26 +1148,29 @@ class Server:
 
         if len(raw) < 5:
             logging.error(
-                f"({session_id}) {{Packet Parser}} Stream is too short, ignoring!"
+                "(%s) {Packet Parser} Stream is too short, ignoring!", session_id
             )
             await self._malformed_request(session_id, stream)
             return None, None, None
         protocol_version, content_encoding = raw[0], raw[1]
         if protocol_version != 22:
             logging.error(
-                f"({session_id}) {{Packet Parser}} Invalid Protocol-Version header in packet!"
+                "(%s) {Packet Parser} Invalid Protocol-Version header in packet!",
+                session_id,
             )
             await self._invalid_header(session_id, stream)
             return None, None, None
         if content_encoding not in (0, 1):
             logging.error(
-                f"({session_id}) {{Packet Parser}} Invalid Content-Encoding header in packet!"
+                "(%s) {Packet Parser} Invalid Content-Encoding header in packet!",
+                session_id,
             )
             await self._invalid_header(session_id, stream)
             return None, None, None
         logging.debug(
-            f"({session_id}) {{Packet Parser}} Protocol-Version is V2, Content-Encoding is "
-            f"{'json' if not content_encoding else 'ziproto'}"
+            "(%s) {Packet Parser} Protocol-Version is V2, Content-Encoding is %s",
+            session_id,
+            'json' if not content_encoding else 'ziproto',
         )
         return (
             await self._decode_payload(
@@ -583,24 +1185,232 @@ class Server:
         Dispatches packets and clients to handlers
         """
 
+        record = current_record.get()
+        if record is not None:
+            record.lap("prepare")
+        # API key factories already counted this request, as handlers in several groups may be called
+        charged = set()
         for group, handlers in self._handlers.items():
-            logging.debug(f"({session_id}) {{Dispatcher}} Checking group {group}")
+            logging.debug("(%s) {Dispatcher} Checking group %s", session_id, group)
             for handler in handlers:
-                if handler.check(client, packet):
+                try:
+                    matched = handler.check(client, packet)
+                except RequestRejected as rejected:
+                    logging.debug(
+                        "(%s) {Dispatcher} Request rejected by a filter of '%s' -> %s",
+                        session_id,
+                        handler.function.__name__,
+                        rejected.error,
+                    )
+                    if record is not None:
+                        record.lap("filters")
+                    await self._rejected(session_id, client._stream, rejected.error, packet.encoding)
+                    return
+                if matched:
+                    if (
+                        handler.priority
+                        and self._overload is not None
+                        and not self._overload.admits(handler.priority)
+                    ):
+                        logging.debug(
+                            "(%s) {Dispatcher} The server is overloaded, shedding request for '%s' (priority %s)",
+                            session_id,
+                            handler.function.__name__,
+                            handler.priority,
+                        )
+                        self._metric_shed.labels(str(handler.priority)).inc()
+                        if record is not None:
+                            record.lap("filters")
+                        await self._rejected(session_id, client._stream, "ERR_OVERLOADED", packet.encoding)
+                        return
+                    if not self._consume_usage(handler, packet, charged):
+                        logging.debug(
+                            "(%s) {Dispatcher} Request for '%s' rejected -> ERR_QUOTA_EXCEEDED",
+                            session_id,
+                            handler.function.__name__,
+                        )
+                        if record is not None:
+                            record.lap("filters")
+                        await self._rejected(session_id, client._stream, "ERR_QUOTA_EXCEEDED", packet.encoding)
+                        return
                     logging.debug(
-                        f"({session_id}) {{Dispatcher}} Calling '{handler.function.__name__}' in group {group}"
+                        "(%s) {Dispatcher} Calling '%s' in group %s",
+                        session_id,
+                        handler.function.__name__,
+                        group,
                     )
-                    await handler.call(client, packet)
+                    if record is not None:
+                        record.lap("filters")
+                        record.handler = handler.function.__name__
+                        record.group = group
+                    start = time.perf_counter()
+                    try:
+                        if handler.cache is not None:
+                            await self._call_cached(session_id, handler, client, packet)
+                        elif handler.singleflight:
+                            await self._call_once(session_id, handler, client, packet)
+                        else:
+                            await handler.call(client, packet)
+                    finally:
+                        self._metric_handler_latency.labels(handler.function.__name__, group).observe(
+                            time.perf_counter() - start
+                        )
+                    if record is not None:
+                        # This includes the time spent sending responses, which is also reported on its own
+                        record.lap("handler")
                     break
+        if record is not None and record.handler is None:
+            record.lap("filters")
+            record.status = "unhandled"
+
+    @staticmethod
+    def _consume_usage(handler: Handler, packet: Packet, charged: set) -> bool:
+        """
+        Counts a request against the quotas of the ``Filters.APIFactory`` filters of the handler that is about
+        to be called, unless their factory already counted it (see ``_dispatch()``). Returns ``False`` if a key
+        is over its quota
+        """
+
+        for item in handler.filters:
+            if not isinstance(item, Filters.APIFactory) or not item.factory.tracks_usage:
+                continue
+            charge = (item.factory, packet.dict_payload.get(item.field_name))
+            if charge in charged:
+                continue
+            if not item.consume(packet):
+                return False
+            charged.add(charge)
+        return True
+
+    async def _call_cached(self, session_id: uuid.uuid4, handler: Handler, client: Client, packet: Packet):
+        """
+        Calls a cached handler, unless its response to an identical request is cached, in which case
+        that response is sent instead. The handler's filters already ran, so rate limits, quotas and
+        revoked keys apply to cache hits too. The response is only cached if the handler returned
+        normally without closing the connection
+        """
+
+        cache = self._response_cache
+        key = cache.key(packet.dict_payload, client.encoding) + (handler,)
+        address = client.address if handler.cache.by_ip else None
+        frames = cache.get(key, address)
+        if frames is not None:
+            logging.debug(
+                "(%s) {Dispatcher} Serving the response of '%s' from the cache",
+                session_id,
+                handler.function.__name__,
+            )
+            self._metric_cache_lookups.labels("hit").inc()
+            record = current_record.get()
+            if record is not None:
+                record.status = "cached"
+            await self._send(client._stream, frames, session_id, close=False, from_client=True)
+            return
+        self._metric_cache_lookups.labels("miss").inc()
+        recorder = client._responses
+        if recorder is None:
+            client._responses = recorder = ResponseRecorder()
+        start = len(recorder.frames)
+        if handler.singleflight:
+            await self._call_once(session_id, handler, client, packet)
+        else:
+            await handler.call(client, packet)
+        if len(recorder.frames) > start and not recorder.closed:
+            cache.put(key, b"".join(recorder.frames[start:]), handler.cache.ttl, address)
+
+    async def _call_once(self, session_id: uuid.uuid4, handler: Handler, client: Client, packet: Packet):
+        """
+        Calls a singleflight handler, unless an identical request is already running it,
+        in which case its response is sent to ``client`` once it's ready
+        """
+
+        key = handler, request_key(packet.dict_payload)
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                break
+            logging.debug(
+                "(%s) {Dispatcher} Waiting for an identical request to '%s' to complete",
+                session_id,
+                handler.function.__name__,
+            )
+            await flight.done.wait()
+            if flight.abandoned:
+                # The request running the handler was cancelled, the first one to get here takes over
+                continue
+            if flight.error is not None:
+                self._metric_coalesced.labels(handler.function.__name__).inc()
+                # Raising the same exception object in several tasks would mix up their tracebacks
+                try:
+                    error = copy.copy(flight.error)
+                except Exception:
+                    error = RuntimeError(f"The shared execution of '{handler.function.__name__}' failed")
+                raise error from flight.error
+            try:
+                frames = flight.frames_for(client.encoding, self._transcode)
+            except (TypeError, ValueError) as error:
+                # E.g. ZiProto bytes have no JSON equivalent, so this request gets its own execution
+                logging.debug(
+                    "(%s) {Dispatcher} Could not convert the response of '%s' to %s, calling it again -> %s",
+                    session_id,
+                    handler.function.__name__,
+                    client.encoding,
+                    error,
+                )
+                await handler.call(client, packet)
+                return
+            self._metric_coalesced.labels(handler.function.__name__).inc()
+            if client._responses is not None:
+                client._responses.add(frames, flight.close)
+            if frames:
+                await self._send(client._stream, frames, session_id, flight.close, from_client=True)
+            return
+        flight = self._flights[key] = Flight(self._backend.event(), client.encoding)
+        recorder = client._responses
+        if recorder is None:
+            client._responses = recorder = ResponseRecorder()
+        start = len(recorder.frames)
+        try:
+            await handler.call(client, packet)
+        except self._backend.Cancelled:
+            flight.abandoned = True
+            raise
+        except BaseException as error:
+            flight.error = error
+            raise
+        else:
+            flight.frames = recorder.frames[start:]
+            flight.close = recorder.closed
+        finally:
+            del self._flights[key]
+            flight.done.set()
+
+    def _transcode(self, frame: bytes, encoding: str) -> bytes:
+        """
+        Converts a complete frame to the given encoding, ``'json'`` or ``'ziproto'``
+        """
+
+        payload = frame[self.header_size + 2:]
+        if encoding == "json":
+            payload = json.dumps(ziproto.decode(payload)).encode("utf-8")
+        else:
+            payload = ziproto.encode(json.loads(payload))
+        return (
+            (len(payload) + 2).to_bytes(self.header_size, self.byteorder)
+            + bytes((22, 0 if encoding == "json" else 1))
+            + payload
+        )
 
     async def _close_session(self, client: Client):
         """
-        Deletes a client session and closes the underlying client connection
+        Deletes a client session and closes the underlying client connection, unless
+        ``self.keep_alive`` is ``True``
         """
 
         if client.session in self._sessions[client.address]:
             self._sessions[client.address].remove(client.session)
-        await client.close()
+        if not self.keep_alive:
+            await client.close()
 
     async def _parse_call(
         self, session_id: uuid.uuid4, request: bytes, stream: trio.SocketStream
@@ -619,18 +1429,23 @@ class Server:
         payload, encoding, protocol_version = await self._parse_packet(
             session_id, request, stream
         )
+        record = current_record.get()
+        if record is not None:
+            record.lap("decode")
         if payload:
             encoding = "json" if not encoding else "ziproto"
+            if record is not None:
+                record.encoding = encoding
             try:
                 client = Client(
-                    stream.socket.getsockname()[0],
+                    self._get_address(stream),
                     server=self,
                     session=session_id,
                     stream=stream,
                     encoding=encoding,
                 )
             except OSError:
-                logging.warning(f"({session_id}) {{API Parser}} The client died")
+                logging.warning("(%s) {API Parser} The client died", session_id)
             else:
                 packet = Packet(payload, sender=client, encoding=encoding)
                 if await self._set_session(session_id, client):
@@ -641,6 +1456,9 @@ class Server:
         """
         This method is called when the server is started and it has been thought to be overridden by a custom
         user defined class to perform pre-startup operations
+
+        When running multiple workers, this is called once inside every worker process, and ``self.worker_id``
+        tells which one
         """
 
         return
@@ -650,120 +1468,943 @@ class Server:
         This method is called when the server shuts down and it has been thought to be overridden by a custom user
         defined class to perform post-shutdown operations
 
-        Note that this method is called only after a proper ``KeyboardInterrupt`` exception is raised
+        Note that this method is called only after a proper ``KeyboardInterrupt`` exception is raised or
+        after a ``SIGTERM`` signal is received. When running multiple workers, this is called once inside every
+        worker process
         """
 
         return
 
     async def _handle_client(self, stream: trio.SocketStream):
         """
-        Handles a single client connection
+        Handles a single client connection.
+
+        Every connection owns a single timer in ``self._timers``, which is reset whenever the connection
+        changes phase: waiting for a packet (``idle_timeout``), reading it (``read_timeout``) and
+        dispatching it to handlers (``handler_timeout``). This way a busy connection is never killed
+        while it's active
 
         :param stream: The trio asynchronous socket associated with the client
         :type stream: class: ``trio.SocketStream``
         """
 
         session_id = uuid.uuid4()
+        cancel_scope = self._backend.cancel_scope()
+        timer = self._timers.schedule(
+            self.idle_timeout or self.timeout, cancel_scope.cancel, "idle"
+        )
+        self._connections.add(timer)
+        self._metric_connections.inc()
+        self._metric_open_connections.inc()
+        # The record of the request being processed, if the access log or tracing are enabled
+        record = None
+        recording = self._access_log is not None or self.trace_sample_rate
+        capture = self._capture
+        if capture is not None:
+            connection_id = next(self._connection_ids)
+            current_connection.set(connection_id)
         try:
-            logging.info(
-                f"{{Client handler}} New session started, UUID is {session_id}"
-            )
-            with trio.move_on_after(self.timeout) as cancel_scope:
+            logging.info("{Client handler} New session started, UUID is %s", session_id)
+            if recording:
+                try:
+                    peer = self._get_address(stream)
+                except OSError:
+                    peer = None
+                # Formatting the UUID once per connection, rather than once per record
+                session_label = str(session_id)
+            if self.tcp_keepalive or not self.tcp_nodelay:
+                # trio already disables Nagle's algorithm on TCP streams
+                configure_socket(
+                    self._get_socket(stream),
+                    nodelay=self.tcp_nodelay,
+                    keepalive=self.tcp_keepalive,
+                )
+            with cancel_scope:
+                # Bytes that were received past the end of the previous packet
+                buffer = b""
                 while True:
-                    try:
-                        raw_data = await stream.receive_some(max_bytes=self.buf)
-                    except trio.BrokenResourceError:
-                        logging.info(
-                            f"({session_id}) {{Client handler}} The connection was closed"
-                        )
-                        await stream.aclose()
-                        break
-                    except trio.ClosedResourceError:
-                        logging.info(
-                            f"({session_id}) {{Client handler}} The connection was closed"
-                        )
-                        await stream.aclose()
-                        break
-                    except trio.BusyResourceError as busy:
-                        logging.error(
-                            f"({session_id}) {{Client handler}} Client is sending too fast! Or is the server "
-                            f"overloaded? -> {busy} "
-                        )
-                        await stream.aclose()
-                        return
-                    if not raw_data:
-                        logging.info(
-                            f"({session_id}) {{Client handler}} Stream has ended"
-                        )
-                        await stream.aclose()
-                        break
-                    if len(raw_data) < self.header_size:
+                    if not buffer:
+                        if self._draining:
+                            logging.info(
+                                "(%s) {Client handler} The server is shutting down, closing",
+                                session_id,
+                            )
+                            await stream.aclose()
+                            break
+                        timer.reset(self.idle_timeout or self.timeout, "idle")
+                        try:
+                            buffer = await stream.receive_some(max_bytes=self.buf)
+                        except trio.BrokenResourceError:
+                            logging.info(
+                                "(%s) {Client handler} The connection was closed",
+                                session_id,
+                            )
+                            await stream.aclose()
+                            break
+                        except trio.ClosedResourceError:
+                            logging.info(
+                                "(%s) {Client handler} The connection was closed",
+                                session_id,
+                            )
+                            await stream.aclose()
+                            break
+                        except trio.BusyResourceError as busy:
+                            logging.error(
+                                "(%s) {Client handler} Client is sending too fast! Or is the server overloaded? -> %s ",
+                                session_id,
+                                busy,
+                            )
+                            await stream.aclose()
+                            return
+                        if not buffer:
+                            logging.info(
+                                "(%s) {Client handler} Stream has ended", session_id
+                            )
+                            await stream.aclose()
+                            break
+                    timer.reset(self.read_timeout or self.timeout, "read")
+                    # Read once per frame, as reloading the configuration may change it
+                    min_read_rate = self.min_read_rate
+                    if min_read_rate:
+                        frame_started = self._timers.clock()
+                    if recording:
+                        record = self._new_record(session_label, peer)
+                        current_record.set(record)
+                    if len(buffer) < self.header_size:
                         logging.debug(
-                            f"({session_id}) {{Client handler}} Stream is shorter than header size, rebuilding"
+                            "(%s) {Client handler} Stream is shorter than header size, rebuilding",
+                            session_id,
                         )
-                        header = await self._rebuild_header(
-                            session_id, stream, raw_data
+                        if min_read_rate:
+                            self._reset_read_timer(
+                                timer, frame_started, self.header_size, min_read_rate
+                            )
+                        buffer = await self._rebuild_header(
+                            session_id, stream, buffer
                         )
-                        if header:
-                            header = int.from_bytes(header, self.byteorder)
-                        else:
+                        if not buffer or len(buffer) < self.header_size:
                             logging.warning(
-                                f"({session_id}) {{Client handler}} The client did something nasty while attempting "
-                                f"to complete the header! "
+                                "(%s) {Client handler} The client did something nasty while attempting to "
+                                "complete the header! ",
+                                session_id,
                             )
-                    else:
-                        header = int.from_bytes(
-                            raw_data[: self.header_size], self.byteorder
-                        )
+                            break
+                    header = int.from_bytes(
+                        buffer[: self.header_size], self.byteorder
+                    )
                     logging.debug(
-                        f"({session_id}) {{Client handler}} Expected stream length is {header}"
+                        "(%s) {Client handler} Expected stream length is %s",
+                        session_id,
+                        header,
                     )
-                    if len(raw_data) - self.header_size == header:
-                        raw_data = raw_data[self.header_size:]
-                    else:
+                    if self.max_frame_size and header > self.max_frame_size:
+                        logging.warning(
+                            "(%s) {Client handler} The client announced a %s byte(s) frame, over the %s byte(s) limit",
+                            session_id,
+                            header,
+                            self.max_frame_size,
+                        )
+                        await self._frame_rejected(
+                            session_id, stream, "ERR_FRAME_TOO_LARGE", "too_large"
+                        )
+                        break
+                    raw_data = buffer[self.header_size:]
+                    if len(raw_data) < header:
                         logging.debug(
-                            f"({session_id}) {{Client handler}} Fragmented stream detected, rebuilding"
+                            "(%s) {Client handler} Fragmented stream detected, rebuilding",
+                            session_id,
                         )
-                        raw_data = await self._complete_stream(
-                            header, stream, session_id
+                        if (
+                            self.frame_memory_budget
+                            and self._frame_memory + header > self.frame_memory_budget
+                        ):
+                            logging.warning(
+                                "(%s) {Client handler} Receiving a %s byte(s) frame would exceed the frame memory budget",
+                                session_id,
+                                header,
+                            )
+                            await self._frame_rejected(
+                                session_id, stream, "ERR_MEMORY_BUDGET_EXCEEDED", "memory_budget"
+                            )
+                            break
+                        if min_read_rate:
+                            self._reset_read_timer(
+                                timer, frame_started, self.header_size + header, min_read_rate
+                            )
+                        self._frame_memory += header
+                        try:
+                            raw_data = await self._complete_stream(
+                                header, stream, session_id, raw_data
+                            )
+                        finally:
+                            self._frame_memory -= header
+                        if raw_data is None:
+                            break
+                    raw_data, buffer = raw_data[:header], raw_data[header:]
+                    if capture is not None:
+                        capture.write(
+                            REQUEST, connection_id, raw_data, header.to_bytes(self.header_size, self.byteorder)
                         )
+                    self._metric_frames_received.inc()
+                    self._metric_bytes_received.inc(self.header_size + header)
+                    if record is not None:
+                        record.lap("read")
+                        record.request_bytes = self.header_size + header
                     logging.debug(
-                        f"({session_id}) {{Client handler}} Stream complete, processing API call"
+                        "(%s) {Client handler} Stream complete, processing API call",
+                        session_id,
                     )
+                    timer.reset(self.handler_timeout or self.timeout, "handler")
+                    overload = self._overload
+                    if overload is not None:
+                        if not overload.try_acquire():
+                            logging.debug(
+                                "(%s) {Client handler} The server is overloaded, shedding request", session_id
+                            )
+                            self._metric_shed.labels("all").inc()
+                            # The payload is never decoded, only its Content-Encoding header is read
+                            await self._rejected(
+                                session_id,
+                                stream,
+                                "ERR_OVERLOADED",
+                                "ziproto" if raw_data[1:2] == b"\x01" else "json",
+                            )
+                            if record is not None:
+                                self._write_record(record, "ok")
+                                record = None
+                            if not self.keep_alive:
+                                # Shedding must free the connection right away, not at the idle timeout
+                                await stream.aclose()
+                                break
+                            continue
+                        admitted = time.perf_counter()
                     try:
                         await self._parse_call(session_id, raw_data, stream)
                     except StopPropagation:
                         await stream.aclose()
                         logging.debug(
-                            f"({session_id}) {{Client handler}} Uh oh! Propagation stopped, sorry next handlers"
+                            "(%s) {Client handler} Uh oh! Propagation stopped, sorry next handlers",
+                            session_id,
                         )
+                        if record is not None:
+                            self._write_record(record, "ok")
+                            record = None
                         break
+                    finally:
+                        if overload is not None:
+                            overload.release(time.perf_counter() - admitted)
+                    if record is not None:
+                        self._write_record(record, "ok")
+                        record = None
             if cancel_scope.cancelled_caught:
-                logging.error(
-                    f"({session_id}) {{Client handler}} The operation has timed out"
-                )
-                await self._timed_out(session_id, stream)
+                if timer.reason == "drain":
+                    logging.info(
+                        "(%s) {Client handler} The server is shutting down, closing",
+                        session_id,
+                    )
+                    await stream.aclose()
+                elif timer.reason == "slow":
+                    logging.warning(
+                        "(%s) {Client handler} The client is sending slower than %s byte(s) per second",
+                        session_id,
+                        self.min_read_rate,
+                    )
+                    await self._frame_rejected(
+                        session_id, stream, "ERR_READ_TOO_SLOW", "too_slow"
+                    )
+                else:
+                    logging.error(
+                        "(%s) {Client handler} The operation has timed out (%s deadline)",
+                        session_id,
+                        timer.reason,
+                    )
+                    await self._timed_out(session_id, stream)
+        except self._backend.Cancelled:
+            logging.info(
+                "(%s) {Client handler} The server is shutting down, the connection was cancelled",
+                session_id,
+            )
+            if record is not None:
+                self._write_record(record, "cancelled")
+                record = None
+            raise
         except BaseException as error:
+            if record is not None:
+                self._write_record(record, "exception")
+                record = None
             logging.error(
-                f"({session_id}) {{Client handler}} A fatal unhandled exception occurred -> "
-                f"{type(error).__name__}: {error} "
+                "(%s) {Client handler} A fatal unhandled exception occurred -> %s: %s ",
+                session_id,
+                type(error).__name__,
+                error,
             )
+        finally:
+            if record is not None:
+                self._write_record(record, "aborted")
+            if capture is not None:
+                capture.write(CLOSE, connection_id)
+            timer.cancel()
+            self._connections.discard(timer)
+            self._metric_open_connections.dec()
+
+    def _listen(self, sock: socket.socket):
+        """
+        Calls ``listen()`` on a bound socket, with ``self.backlog`` as backlog if it's set
+        """
 
-    async def _serve_forever(self):
+        if self.backlog is None:
+            sock.listen()
+        else:
+            sock.listen(self.backlog)
+
+    def _bind_socket(self, reuse_port: bool = False) -> socket.socket:
         """
-        The server's main loop: sets up logging, calls setup and
-        shutdown handlers and serves on the given address and port
+        Creates a listening TCP socket bound to ``self.addr:self.port``
+
+        :param reuse_port: If ``True``, ``SO_REUSEPORT`` is set on the socket, defaults to ``False``
+        :type reuse_port: bool, optional
+        :returns: The listening socket
+        :rtype: class: ``socket.socket``
+        """
+
+        family = socket.AF_INET6 if ":" in self.addr else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            # Buffer sizes must be set before listen() for the TCP window
+            # scale to be negotiated accordingly on accepted connections
+            configure_socket(sock, rcvbuf=self.rcvbuf, sndbuf=self.sndbuf)
+            sock.bind((self.addr, self.port))
+            self._listen(sock)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _bind_unix_socket(self) -> socket.socket:
+        """
+        Creates a listening Unix domain socket bound to ``self.unix_path``, replacing
+        any stale socket file left behind by a previous run
+
+        :returns: The listening socket
+        :rtype: class: ``socket.socket``
+        """
+
+        try:
+            if stat.S_ISSOCK(os.stat(self.unix_path).st_mode):
+                os.unlink(self.unix_path)
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            configure_socket(sock, rcvbuf=self.rcvbuf, sndbuf=self.sndbuf)
+            sock.bind(self.unix_path)
+            self._listen(sock)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _remove_unix_socket(self):
+        """
+        Deletes the socket file at ``self.unix_path``, if any
+        """
+
+        if self.unix_path:
+            try:
+                os.unlink(self.unix_path)
+            except FileNotFoundError:
+                pass
+
+    def _get_fds(self) -> List[int]:
+        """
+        Returns ``self.fds`` as a list of integers (it may be a comma separated string, if it comes
+        from the configuration file)
+        """
+
+        if isinstance(self.fds, int):
+            return [self.fds]
+        if isinstance(self.fds, str):
+            return [int(fd) for fd in self.fds.split(",") if fd.strip()]
+        return list(self.fds)
+
+    def _bind_shared_sockets(self) -> List[socket.socket]:
+        """
+        Returns the listening sockets that can only be bound once: the inherited file descriptors and
+        the Unix domain socket. When running multiple workers, these are bound by the supervisor and
+        shared with the workers
+
+        :returns: A list of listening sockets
+        :rtype: list
+        """
+
+        sockets = [socket.socket(fileno=fd) for fd in self._get_fds()]
+        if self.unix_path:
+            sockets.append(self._bind_unix_socket())
+        return sockets
+
+    def _describe_socket(self, sock: socket.socket) -> str:
+        """
+        Returns a human readable description of the address a listening socket is bound to
+        """
+
+        name = sock.getsockname()
+        if sock.family == socket.AF_UNIX:
+            return f"unix:{name}"
+        return f"{'tls://' if self._get_ssl_context() else ''}{name[0]}:{name[1]}"
+
+    def _get_ssl_context(self) -> Optional[ssl.SSLContext]:
+        """
+        Returns the ``ssl.SSLContext`` used to encrypt TCP connections, or ``None`` if TLS is disabled.
+        The context is built once from ``self.certfile`` and ``self.keyfile`` and then cached: reusing
+        the same context is what allows clients to resume their TLS sessions (through session tickets or
+        the context's session cache) instead of performing a full handshake on every connection.
+        Since the context is created before forking, workers also share the same ticket keys
+
+        :returns: The server-side SSL context
+        :rtype: Union[ssl.SSLContext, None]
+        """
+
+        if self.ssl_context is None and self.certfile:
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(self.certfile, self.keyfile)
+            context.options &= ~ssl.OP_NO_TICKET
+            self.ssl_context = context
+        return self.ssl_context
+
+    def _bind_sockets(self) -> List[socket.socket]:
+        """
+        Returns the list of listening sockets the server will accept connections from
+
+        :returns: A list of listening sockets
+        :rtype: list
+        """
+
+        if self._listen_sockets is None:
+            sockets = self._bind_shared_sockets()
+            if self.tcp:
+                sockets.append(self._bind_socket())
+            return sockets
+        # We're a worker: use the sockets bound by the supervisor and, if it didn't bind
+        # the TCP socket for us, bind our own with SO_REUSEPORT
+        sockets = list(self._listen_sockets)
+        if self.tcp and self._reuses_port():
+            sockets.append(self._bind_socket(reuse_port=True))
+        return sockets
+
+    def _reuses_port(self) -> bool:
+        """
+        Returns ``True`` if workers should bind their own TCP socket with ``SO_REUSEPORT``
+        """
+
+        return bool(self.reuse_port) and hasattr(socket, "SO_REUSEPORT")
+
+    # noinspection PyMethodMayBeStatic
+    def _get_address(self, stream: trio.SocketStream) -> str:
+        """
+        Returns the address of the remote end of a stream. Unix domain socket clients
+        have no address of their own, so the socket path is returned instead
+
+        :param stream: The trio asynchronous socket associated with the client
+        :type stream: class: ``trio.SocketStream``
+        :returns: The address of the client
+        :rtype: str
+        """
+
+        sock = self._get_socket(stream)
+        if sock.family == socket.AF_UNIX:
+            return f"unix:{sock.getsockname()}"
+        return sock.getpeername()[0]
+
+    def _get_socket(self, stream: trio.SocketStream) -> trio.socket.SocketType:
+        """
+        Returns the socket underlying a stream, unwrapping TLS streams
+        """
+
+        return self._backend.get_socket(stream)
+
+    def _start_drain(self):
+        """
+        Stops accepting new connections, closes idle ones and gives the packets that are being
+        processed ``self.drain_timeout`` seconds to complete, after which the remaining
+        connections are cancelled and the server shuts down
+        """
+
+        if self._draining:
+            # Asked twice, don't wait any longer
+            self._backend.stop()
+            return
+        logging.info(
+            "{API main} Draining %s connection(s), waiting up to %s seconds",
+            len(self._connections),
+            self.drain_timeout,
+        )
+        self._draining = True
+        self._backend.stop_accepting(self.drain_timeout)
+        for timer in list(self._connections):
+            if timer.reason == "idle":
+                timer.reason = "drain"
+                timer.callback()
+
+    # noinspection PyMethodMayBeStatic
+    def _get_signals(self) -> List[int]:
+        """
+        Returns the signals the server reacts to while it's running
+        """
+
+        signals = [signal.SIGTERM]
+        if hasattr(signal, "SIGHUP"):
+            signals.append(signal.SIGHUP)
+        return signals
+
+    def _handle_signal(self, signum: int):
+        """
+        Reacts to a signal: ``SIGTERM`` starts draining the server, ``SIGHUP`` reloads the configuration file
+        """
+
+        if signum == signal.SIGTERM:
+            logging.info("{API main} SIGTERM received, stopping")
+            self._start_drain()
+        else:
+            logging.info("{API main} SIGHUP received, reloading configuration")
+            self.reload_config()
+
+    def _register_metrics(self):
+        """
+        Creates the server's built-in metrics in ``self.metrics``
+        """
+
+        self._metric_connections = self.metrics.counter(
+            "asyncapy_connections", "Connections accepted"
+        )
+        self._metric_open_connections = self.metrics.gauge(
+            "asyncapy_open_connections", "Connections currently open"
+        )
+        self._metric_frames_received = self.metrics.counter(
+            "asyncapy_frames_received", "Complete frames received from clients"
+        )
+        self._metric_frames_sent = self.metrics.counter(
+            "asyncapy_frames_sent", "Frames sent to clients"
+        )
+        self._metric_bytes_received = self.metrics.counter(
+            "asyncapy_bytes_received", "Bytes received in complete frames, headers included"
+        )
+        self._metric_bytes_sent = self.metrics.counter(
+            "asyncapy_bytes_sent", "Bytes sent to clients, headers included"
+        )
+        self._metric_decode_errors = self.metrics.counter(
+            "asyncapy_decode_errors", "Payloads that could not be decoded", ("encoding",)
+        )
+        self._metric_errors = self.metrics.counter(
+            "asyncapy_error_responses", "Error responses sent by the server", ("error",)
+        )
+        self._metric_stages = self.metrics.histogram(
+            "asyncapy_stage_duration_seconds",
+            "Time spent in each stage of the request pipeline, for sampled requests",
+            ("stage",),
+        )
+        self._metric_handler_latency = self.metrics.histogram(
+            "asyncapy_handler_duration_seconds",
+            "Time spent in handlers, including sending their responses",
+            ("handler", "group"),
+        )
+        self.metrics.gauge(
+            "asyncapy_dropped_log_records",
+            "Log records dropped because the log queue was full",
+            function=lambda: self.dropped_log_records,
+        )
+        self.metrics.gauge(
+            "asyncapy_dropped_access_log_records",
+            "Access log records dropped because the access log buffer was full",
+            function=lambda: self._access_log.dropped if self._access_log else 0,
+        )
+        self.metrics.gauge(
+            "asyncapy_overload_limit",
+            "The current limit on requests processed at once, if load shedding is enabled",
+            function=lambda: self._overload.limit if self._overload else 0,
+        )
+        self.metrics.gauge(
+            "asyncapy_requests_in_flight",
+            "Requests being processed, if load shedding is enabled",
+            function=lambda: self._overload.in_flight if self._overload else 0,
+        )
+        self._metric_rejected_frames = self.metrics.counter(
+            "asyncapy_rejected_frames",
+            "Frames refused before they were complete, by reason (too_large, too_slow or memory_budget)",
+            ("reason",),
+        )
+        self.metrics.gauge(
+            "asyncapy_frame_memory_bytes",
+            "The total size of the frames being received, see frame_memory_budget",
+            function=lambda: self._frame_memory,
+        )
+        self._metric_cache_lookups = self.metrics.counter(
+            "asyncapy_response_cache_lookups",
+            "Requests looked up in the response cache, by result (hit or miss)",
+            ("result",),
+        )
+        self.metrics.gauge(
+            "asyncapy_response_cache_bytes",
+            "The total size of the cached responses",
+            function=lambda: self._response_cache.size if self._response_cache else 0,
+        )
+        self.metrics.gauge(
+            "asyncapy_response_cache_evictions",
+            "Cached responses evicted to make room for new ones",
+            function=lambda: self._response_cache.evicted if self._response_cache else 0,
+        )
+        self._metric_coalesced = self.metrics.counter(
+            "asyncapy_coalesced_requests",
+            "Requests to singleflight handlers that waited for an identical request instead of running the handler",
+            ("handler",),
+        )
+        self._metric_shed = self.metrics.counter(
+            "asyncapy_shed_requests",
+            "Requests rejected with ERR_OVERLOADED, by handler priority ('all' if they were shed before decoding)",
+            ("priority",),
+        )
+        self.metrics.gauge(
+            "asyncapy_dropped_capture_frames",
+            "Frames left out of the traffic capture because its buffer was full or it reached its maximum size",
+            function=lambda: self._capture.dropped if self._capture else 0,
+        )
+
+    def _background_tasks(self) -> List[Callable]:
+        """
+        Returns the async functions the backend must run alongside the server, until it stops.
+        Each of them is called with the backend's sleep function
+        """
+
+        tasks = [self._timers.run]
+        if self._watchdog is not None:
+            tasks.append(self._watchdog.run)
+        if self._usage_factories():
+            tasks.append(self._tick_usage)
+        return tasks
+
+    def _usage_factories(self) -> List:
+        """
+        Returns the API key factories counting usage, used by ``Filters.APIFactory`` filters of the handlers
+        """
+
+        factories = []
+        for handlers in self._handlers.values():
+            for handler in handlers:
+                for item in handler.filters:
+                    if (
+                        isinstance(item, Filters.APIFactory)
+                        and item.factory.tracks_usage
+                        and item.factory not in factories
+                    ):
+                        factories.append(item.factory)
+        return factories
+
+    async def _tick_usage(self, sleep: Callable):
+        """
+        Periodically hands the usage counts of API key factories to their sinks, even without traffic
+        """
+
+        factories = self._usage_factories()
+        interval = max(min(factory.flush_interval for factory in factories), 0.1)
+        while True:
+            await sleep(interval)
+            for factory in factories:
+                factory.tick()
+
+    def _flush_usage(self):
+        """
+        Flushes the usage counts of API key factories, so that the last requests served are accounted for
+        """
+
+        for factory in self._usage_factories():
+            try:
+                factory.flush()
+            except Exception as error:
+                logging.error("{API main} Could not flush the usage of API keys -> %s", error)
+
+    def _reset_read_timer(self, timer, started: float, size: int, min_read_rate: int):
+        """
+        Resets the timer of a connection receiving a frame of ``size`` bytes (header included), whose first
+        byte arrived at ``started``. The timer expires at the read timeout or, if that's earlier, once the
+        client has had enough time to send the frame at ``min_read_rate`` bytes per second
+        """
+
+        elapsed = self._timers.clock() - started
+        read_timeout = self.read_timeout or self.timeout
+        allowed = self.read_grace_period + size / min_read_rate
+        if allowed < read_timeout:
+            timer.reset(allowed - elapsed, "slow")
+        else:
+            timer.reset(read_timeout - elapsed, "read")
+
+    def _start_overload(self):
+        """
+        Creates the overload controller, if ``self.overload_target`` is set
+        """
+
+        if not self.overload_target:
+            self._overload = None
+            return
+        self._overload = OverloadController(
+            self.overload_target,
+            initial_limit=min(100, self.overload_max_limit),
+            max_limit=self.overload_max_limit,
+            shares=self.overload_shares,
+        )
+
+    def _start_watchdog(self):
+        """
+        Starts the event loop watchdog, if ``self.watchdog_budget`` is set
+        """
+
+        if not self.watchdog_budget:
+            return
+        if self._watchdog is None:
+            self._watchdog = Watchdog(
+                self.watchdog_budget,
+                self.metrics,
+                lambda: [handler.function for handlers in list(self._handlers.values()) for handler in list(handlers)],
+            )
+        self._watchdog.budget = self.watchdog_budget
+        self._watchdog.start()
+
+    def _stop_watchdog(self):
+        """
+        Stops the event loop watchdog
+        """
+
+        if self._watchdog is not None:
+            self._watchdog.stop()
+
+    def _start_admin(self):
+        """
+        Starts serving the metrics, if ``self.metrics_port`` is set
+        """
+
+        if self.metrics_port is None:
+            return
+        port = self.metrics_port + (self.worker_id or 0)
+        self._admin = AdminServer(self.metrics, self.metrics_addr, port)
+        self._admin.start()
+        logging.info("{API main} Serving metrics at http://%s:%s/metrics", self.metrics_addr, port)
+
+    def _stop_admin(self):
+        """
+        Stops serving the metrics
+        """
+
+        if self._admin is not None:
+            self._admin.stop()
+            self._admin = None
+
+    def _new_record(self, session_id: str, peer: str) -> Optional[AccessRecord]:
+        """
+        Returns the record of a new request, or ``None`` if the access log is disabled
+        and the request wasn't sampled for tracing
+        """
+
+        sampled = bool(self.trace_sample_rate) and random.random() < self.trace_sample_rate
+        if self._access_log is None and not sampled:
+            return None
+        record = AccessRecord(session_id, peer)
+        record.sampled = sampled
+        if sampled and self.profile_threshold is not None and self._profiler is None:
+            # Profiles are global to the thread, so only one request is profiled at a time
+            # (and they include whatever else the event loop did in the meantime)
+            self._profiler = record.profiler = cProfile.Profile()
+            self._profiler.enable()
+        return record
+
+    def _write_record(self, record: AccessRecord, status: str):
+        """
+        Hands a complete request record to the access log and, if the request
+        was sampled, to ``self.trace_sink``
+
+        :param record: The record
+        :type record: class: ``AccessRecord``
+        :param status: The status of the request, unless it was already set (e.g. to an ``ERR_*`` code)
+        :type status: str
+        """
+
+        record.finish(status)
+        if record.profiler is not None:
+            self._save_profile(record)
+        if self._access_log is not None:
+            self._access_log.write(record)
+        if record.sampled:
+            try:
+                (self.trace_sink or self._observe_stages)(record)
+            except Exception as error:
+                logging.error("{API main} The trace sink failed -> %s: %s", type(error).__name__, error)
+
+    def _observe_stages(self, record: AccessRecord):
+        """
+        The default trace sink: records the duration of each stage in the ``asyncapy_stage_duration_seconds``
+        histogram of ``self.metrics``
+        """
+
+        for stage, duration in record.stages.items():
+            self._metric_stages.labels(stage).observe(duration)
+
+    def _save_profile(self, record: AccessRecord):
+        """
+        Stops the profiler of a request and, if the request took longer than ``self.profile_threshold``,
+        saves its statistics in ``self.profile_dir``
+        """
+
+        record.profiler.disable()
+        self._profiler = None
+        if record.duration < self.profile_threshold:
+            return
+        path = os.path.join(
+            self.profile_dir, f"asyncapy-{int(record.time)}-{record.handler or 'unhandled'}-{record.session_id}.prof"
+        )
+        try:
+            record.profiler.dump_stats(path)
+        except OSError as error:
+            logging.error("{API main} Could not save the profile of a slow request -> %s", error)
+            return
+        logging.warning(
+            "(%s) {API main} Slow request (%.1fms in '%s'), profile saved to %s",
+            record.session_id,
+            record.duration * 1e3,
+            record.handler,
+            path,
+        )
+
+    def _start_access_log(self):
+        """
+        Starts the access log writer, if the access log is enabled
+        """
+
+        if not self.access_log:
+            return
+        if isinstance(self.access_log, AccessLog):
+            self._access_log = self.access_log
+        else:
+            self._access_log = AccessLog(
+                worker_path(self.access_log, self.worker_id),
+                max_bytes=self.access_log_max_bytes,
+                backup_count=self.access_log_backups,
+            )
+        self._access_log.start()
+
+    def _stop_access_log(self):
+        """
+        Writes the records that are still queued and stops the access log writer
+        """
+
+        if self._access_log is None:
+            return
+        self._access_log.stop()
+        if self._access_log.dropped:
+            logging.warning(
+                "{API main} %s access log record(s) were dropped because the queue was full",
+                self._access_log.dropped,
+            )
+        self._access_log = None
+
+    def _start_capture(self):
+        """
+        Starts recording traffic, if ``self.capture`` is set
+        """
+
+        if not self.capture:
+            return
+        self._capture = CaptureWriter(
+            worker_path(self.capture, self.worker_id), max_bytes=self.capture_max_bytes
+        )
+        self._capture.start()
+
+    def _stop_capture(self):
+        """
+        Writes the frames that are still queued and stops recording traffic
+        """
+
+        if self._capture is None:
+            return
+        self._capture.stop()
+        if self._capture.dropped:
+            logging.warning(
+                "{API main} %s frame(s) were left out of the traffic capture", self._capture.dropped
+            )
+        self._capture = None
+
+    def _start_logging(self):
+        """
+        Sets up logging and, unless ``self.log_queue_size`` is 0, moves the handlers of the root logger
+        behind a bounded queue drained by a background thread
         """
 
         logging.basicConfig(
             datefmt=self.datefmt, format=self.console_format, level=self.logging_level
         )
-        logging.info("{API main} AsyncAPY server is starting up")
+        if not self.log_queue_size:
+            return
+        root = logging.getLogger()
+        self._log_handler = DroppingQueueHandler(queue.Queue(self.log_queue_size))
+        self._log_listener = logging.handlers.QueueListener(
+            self._log_handler.queue, *root.handlers, respect_handler_level=True
+        )
+        root.handlers = [self._log_handler]
+        self._log_listener.start()
+
+    def _stop_logging(self):
+        """
+        Writes the log records that are still queued and gives the root logger its handlers back
+        """
+
+        if self._log_listener is None:
+            return
+        self._log_listener.stop()
+        logging.getLogger().handlers = list(self._log_listener.handlers)
+        self._log_listener = None
+        if self._log_handler.dropped:
+            logging.warning(
+                "{API main} %s log record(s) were dropped because the log queue was full",
+                self._log_handler.dropped,
+            )
+
+    @property
+    def dropped_log_records(self) -> int:
+        """
+        The number of log records that were dropped because the log queue was full
+        """
+
+        return self._log_handler.dropped if self._log_handler else 0
+
+    async def _serve_forever(self):
+        """
+        The server's main loop: sets up logging, calls setup and
+        shutdown handlers and serves on the given address and port
+        """
+
+        self._start_logging()
+        self._start_access_log()
+        self._start_capture()
+        if self.worker_id is None:
+            logging.info("{API main} AsyncAPY server is starting up")
+        else:
+            logging.info(
+                "{API main} AsyncAPY worker %s (PID %s) is starting up",
+                self.worker_id,
+                os.getpid(),
+            )
         logging.debug("{API main} Running setup function...")
         await self.setup()
         try:
-            logging.info(f"{{API main}} Now serving at {self.addr}:{self.port}")
-            await trio.serve_tcp(self._handle_client, host=self.addr, port=self.port)
+            sockets = self._bind_sockets()
+            self._start_admin()
+            self._start_watchdog()
+            self._start_overload()
+            logging.info(
+                "{API main} Now serving at %s%s",
+                ", ".join(map(self._describe_socket, sockets)),
+                "" if self._backend.name == "trio" else f" ({self._backend.name} backend)",
+            )
+            await self._backend.serve(self, sockets)
         except KeyboardInterrupt:
             logging.debug("{API main} Running shutdown function...")
             await self.shutdown()
@@ -771,13 +2412,186 @@ class Server:
             sys.exit(0)
         except (PermissionError, OSError) as perms_error:
             logging.error(
-                f"{{API main}} Could not bind to chosen port, full error: {perms_error}"
+                "{API main} Could not bind to chosen port, full error: %s", perms_error
+            )
+            sys.exit("PORT_UNAVAILABLE")
+        else:
+            # We only get here once the server has been drained
+            logging.debug("{API main} Running shutdown function...")
+            await self.shutdown()
+            logging.info("{API main} Exiting")
+        finally:
+            if self.worker_id is None:
+                self._remove_unix_socket()
+            self._flush_usage()
+            self._stop_watchdog()
+            self._stop_admin()
+            self._stop_capture()
+            self._stop_access_log()
+            self._stop_logging()
+
+    def _run_worker(self, worker_id: int):
+        """
+        Runs the server inside a freshly forked worker process. This method never returns
+
+        :param worker_id: The ID of the worker, from 0 to the number of workers - 1
+        :type worker_id: int
+        """
+
+        self.worker_id = worker_id
+        # The supervisor owns the lifecycle of its workers: a Ctrl + C from the
+        # terminal reaches the whole process group, but workers only stop
+        # when the supervisor tells them to (with SIGTERM)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        status = 0
+        try:
+            self._backend.run(self._serve_forever)
+        except SystemExit as exit_code:
+            if isinstance(exit_code.code, str):
+                status = 1
+            else:
+                status = exit_code.code or 0
+        except BaseException as error:
+            logging.error(
+                "{Worker %s} A fatal unhandled exception occurred -> %s: %s",
+                worker_id,
+                type(error).__name__,
+                error,
+            )
+            status = 1
+        finally:
+            logging.shutdown()
+            os._exit(status)
+
+    def _spawn_worker(self, worker_id: int) -> int:
+        """
+        Forks a new worker process and returns its PID
+
+        :param worker_id: The ID of the worker
+        :type worker_id: int
+        :returns: The PID of the worker
+        :rtype: int
+        """
+
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(worker_id)
+        return pid
+
+    def _supervise(self, workers: int):
+        """
+        Spawns ``workers`` worker processes and restarts them if they die, until
+        ``SIGINT`` or ``SIGTERM`` is received
+
+        :param workers: The number of worker processes
+        :type workers: int
+        """
+
+        logging.basicConfig(
+            datefmt=self.datefmt, format=self.console_format, level=self.logging_level
+        )
+        try:
+            self._listen_sockets = self._bind_shared_sockets()
+            if self.tcp and not self._reuses_port():
+                self._listen_sockets.append(self._bind_socket())
+        except (PermissionError, OSError) as perms_error:
+            logging.error(
+                "{Supervisor} Could not bind to chosen port, full error: %s",
+                perms_error,
             )
             sys.exit("PORT_UNAVAILABLE")
+        children = {}
+        started = {}
+        stopping = False
 
-    def start(self):
+        def stop(signum, _):
+            nonlocal stopping
+            if not stopping:
+                logging.info(
+                    "{Supervisor} Received signal %s, stopping workers", signum
+                )
+            stopping = True
+            for child in list(children):
+                try:
+                    os.kill(child, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+        def reload(*_):
+            # Respawned workers will inherit the new configuration
+            self.reload_config()
+            for child in list(children):
+                try:
+                    os.kill(child, signal.SIGHUP)
+                except ProcessLookupError:
+                    pass
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, reload)
+        logging.info("{Supervisor} Starting %s workers", workers)
+        for worker_id in range(workers):
+            children[self._spawn_worker(worker_id)] = worker_id
+            started[worker_id] = time.monotonic()
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            worker_id = children.pop(pid, None)
+            if worker_id is None or stopping:
+                continue
+            logging.warning(
+                "{Supervisor} Worker %s (PID %s) died with status %s, restarting it",
+                worker_id,
+                pid,
+                status,
+            )
+            if time.monotonic() - started[worker_id] < 1:
+                # Don't spin if the worker dies right after starting
+                time.sleep(1)
+            if stopping:
+                continue
+            children[self._spawn_worker(worker_id)] = worker_id
+            started[worker_id] = time.monotonic()
+        for sock in self._listen_sockets:
+            sock.close()
+        self._remove_unix_socket()
+        logging.info("{Supervisor} All workers exited")
+
+    def start(self, workers: int = 1, backend: Optional[str] = None):
         """
         Starts serving asynchronously on ``self.addr:self.port``
+
+        :param workers: The number of worker processes to serve with, defaults to 1. When bigger than 1, the
+        current process becomes a supervisor that forks the workers, restarts them if they die and stops
+        them on ``SIGINT`` or ``SIGTERM``. Each worker runs its own event loop, as well as its own ``setup()``
+        and ``shutdown()`` hooks. This is only supported on platforms implementing ``os.fork()``
+        :type workers: int, optional
+        :param backend: The I/O backend to run the server on, either ``'trio'`` or ``'asyncio'`` (which uses
+        uvloop if it's installed), defaults to ``None`` (``self.backend``, which is ``'trio'`` unless changed in
+        the configuration file). Handlers only use the backend through ``Client`` objects and
+        ``Server.run_sync_task()``, so they run unchanged on both, as long as they don't call trio directly
+        :type backend: str, optional
+        :raises RuntimeError: If ``workers`` is bigger than 1 and ``os.fork()`` is not available
+        :raises ValueError: If the backend is unknown
         """
 
-        trio.run(self._serve_forever)
+        if not isinstance(workers, int) or workers < 1:
+            raise ValueError("workers must be a positive integer!")
+        self._backend = get_backend(backend or self.backend)
+        if not (self.tcp or self.unix_path or self._get_fds()):
+            raise ValueError("The server has nothing to listen on!")
+        # Fail early if the certificate can't be loaded, and make sure
+        # workers inherit the same context
+        self._get_ssl_context()
+        if workers == 1:
+            self._backend.run(self._serve_forever)
+        elif not hasattr(os, "fork"):
+            raise RuntimeError("Multiple workers are not supported on this platform")
+        else:
+            self._supervise(workers)
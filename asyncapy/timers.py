@@ -0,0 +1,221 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import time
+from typing import Callable, Optional
+import trio
+
+
+class Timer:
+    """
+    A single deadline tracked by a ``TimerWheel``. Timers are created with ``TimerWheel.schedule()``
+    and are meant to be reset (not recreated) every time the owner enters a new phase
+
+    :param wheel: The wheel that owns the timer
+    :type wheel: class: ``TimerWheel``
+    :param deadline: The monotonic time at which the timer expires
+    :type deadline: float
+    :param callback: A synchronous callable, called with no arguments when the timer expires
+    :type callback: Callable
+    :param reason: A short label describing what the deadline is about (e.g. ``'idle'``), defaults to ``None``
+    :type reason: str, optional
+    """
+
+    __slots__ = ("wheel", "deadline", "callback", "reason", "active", "expired", "_tick")
+
+    def __init__(self, wheel, deadline: float, callback: Callable, reason: Optional[str] = None):
+        """
+        Object constructor
+        """
+
+        self.wheel = wheel
+        self.deadline = deadline
+        self.callback = callback
+        self.reason = reason
+        self.active = True
+        self.expired = False
+        self._tick = None
+
+    def reset(self, timeout: float, reason: Optional[str] = None):
+        """
+        Moves the deadline ``timeout`` seconds from now. Pushing a deadline further in the future
+        is O(1) and does not touch the wheel: the timer is lazily moved when its old slot comes up
+
+        :param timeout: The new timeout, in seconds
+        :type timeout: float
+        :param reason: The new label for the deadline, defaults to ``None`` (unchanged)
+        :type reason: str, optional
+        """
+
+        if not self.active:
+            return
+        if reason is not None:
+            self.reason = reason
+        self.deadline = self.wheel.clock() + timeout
+        if self.wheel._tick_of(self.deadline) < self._tick:
+            self.wheel._move(self)
+
+    def cancel(self):
+        """
+        Disarms the timer. This is O(1)
+        """
+
+        if self.active:
+            self.active = False
+            self.wheel._remove(self)
+
+    def __repr__(self):
+        return f"Timer({self.reason}, {self.deadline})"
+
+
+class TimerWheel:
+    """
+    A hashed timing wheel, used to track a large number of coarse deadlines (such as connection timeouts)
+    with a single background task instead of one cancel scope deadline (and one heap entry) for each of them.
+
+    Deadlines are rounded up to ``resolution`` seconds, so a timer never fires early but may fire up
+    to ``resolution`` seconds late
+
+    :param resolution: The duration of a tick, in seconds, defaults to 0.1
+    :type resolution: float, optional
+    :param slots: The number of slots in the wheel, defaults to 1024
+    :type slots: int, optional
+    :param clock: The monotonic clock used to compute deadlines, defaults to ``time.monotonic``
+    :type clock: Callable, optional
+    """
+
+    def __init__(self, resolution: float = 0.1, slots: int = 1024, clock: Callable = time.monotonic):
+        """
+        Object constructor
+        """
+
+        if resolution <= 0:
+            raise ValueError("resolution must be a positive number!")
+        if slots < 1:
+            raise ValueError("slots must be a positive integer!")
+        self.resolution = resolution
+        self.clock = clock
+        self._slots = [set() for _ in range(slots)]
+        self._current = self._tick_of(self.clock()) - 1
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _tick_of(self, deadline: float) -> int:
+        """
+        Returns the tick at which a deadline expires
+        """
+
+        return math.ceil(deadline / self.resolution)
+
+    def _insert(self, timer: Timer):
+        """
+        Internal method to place a timer in the slot of its deadline
+        """
+
+        # A timer is never placed in the past, or it would wait for a full turn of the wheel
+        timer._tick = max(self._tick_of(timer.deadline), self._current + 1)
+        self._slots[timer._tick % len(self._slots)].add(timer)
+
+    def _remove(self, timer: Timer):
+        """
+        Internal method to drop a timer from its slot
+        """
+
+        self._slots[timer._tick % len(self._slots)].discard(timer)
+        self._count -= 1
+
+    def _move(self, timer: Timer):
+        """
+        Internal method to move a timer whose deadline became earlier than its slot
+        """
+
+        self._slots[timer._tick % len(self._slots)].discard(timer)
+        self._insert(timer)
+
+    def schedule(self, timeout: float, callback: Callable, reason: Optional[str] = None) -> Timer:
+        """
+        Schedules ``callback`` to be called ``timeout`` seconds from now
+
+        :param timeout: The timeout, in seconds
+        :type timeout: float
+        :param callback: A synchronous callable, called with no arguments when the timer expires
+        :type callback: Callable
+        :param reason: A short label describing the deadline, defaults to ``None``
+        :type reason: str, optional
+        :returns: The armed timer
+        :rtype: class: ``Timer``
+        """
+
+        timer = Timer(self, self.clock() + timeout, callback, reason)
+        self._insert(timer)
+        self._count += 1
+        return timer
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """
+        Expires all the timers whose deadline is earlier than ``now``. This is called
+        periodically by ``self.run()``, but can also be called manually
+
+        :param now: The current time, defaults to ``None`` (``self.clock()``)
+        :type now: float, optional
+        :returns: The number of expired timers
+        :rtype: int
+        """
+
+        if now is None:
+            now = self.clock()
+        target = math.floor(now / self.resolution)
+        fired = 0
+        # If we fell behind by more than a full turn, each slot only needs to be visited once
+        start = max(self._current + 1, target - len(self._slots) + 1)
+        for tick in range(start, target + 1):
+            slot = self._slots[tick % len(self._slots)]
+            if not slot:
+                continue
+            for timer in list(slot):
+                if timer._tick > target:
+                    # Belongs to a later turn of the wheel
+                    continue
+                slot.discard(timer)
+                if timer.deadline <= now:
+                    timer.active = False
+                    timer.expired = True
+                    self._count -= 1
+                    fired += 1
+                    timer.callback()
+                else:
+                    # The deadline was pushed forward after the timer was placed
+                    self._current = tick
+                    self._insert(timer)
+        self._current = max(self._current, target)
+        return fired
+
+    async def run(self, sleep: Callable = trio.sleep):
+        """
+        Advances the wheel every ``self.resolution`` seconds, forever
+
+        :param sleep: The async sleep function of the event loop the wheel runs on, defaults to ``trio.sleep``
+        :type sleep: Callable, optional
+        """
+
+        while True:
+            await sleep(self.resolution)
+            self.advance()
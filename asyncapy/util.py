@@ -17,20 +17,103 @@
 # along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
 
 import string
-import random
+import secrets
+import socket
+import queue
+import logging.handlers
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+_ALPHABET = string.ascii_letters + string.digits
+# Maps random bytes to key characters. 256 isn't a multiple of 62, so the bytes
+# past the last multiple are dropped rather than making some characters likelier
+_KEY_TABLE = bytes(ord(_ALPHABET[byte % len(_ALPHABET)]) for byte in range(256))
+_KEY_REJECTED = bytes(range(256 - 256 % len(_ALPHABET), 256))
+
+
+def generate_keys(size: int, count: int = 1) -> List[str]:
+    """
+    Generates ``count`` random API keys of ``size`` letters and digits at once, using
+    the cryptographically secure random number generator of the ``secrets`` module
+
+    :param size: The length of the keys
+    :type size: int
+    :param count: How many keys are generated, defaults to 1
+    :type count: int, optional
+    :returns: The generated keys
+    :rtype: List[str]
+    """
+
+    needed = size * count
+    characters = bytearray()
+    while len(characters) < needed:
+        # About 3% of the bytes are rejected
+        missing = needed - len(characters)
+        characters += secrets.token_bytes(missing + missing // 16 + 16).translate(_KEY_TABLE, _KEY_REJECTED)
+    characters = characters[:needed].decode("ascii")
+    return [characters[start:start + size] for start in range(0, needed, size)]
 
 
 class APIKeyFactory(object):
 
     """Generic class to manage a basic in-memory storage of API subscriptions, represented as keys of variable size, implementing functionality to issue, revoke and reissue keys
 
+    The factory can also count the requests made with each key and enforce quotas on them, see ``consume()``. Counts
+    are kept in memory, per quota period (e.g. per day), and handed in batches to ``usage_sink`` by a background
+    thread, so that no request waits for storage. ``usage_sink`` is called with the start of the period (a UNIX
+    timestamp) and a dictionary mapping key IDs (see ``key_id()``) to the requests made since the last call, and may
+    return the total usage of those keys in the period across all the processes sharing the sink (see
+    ``SQLiteUsageSink``): quotas are then enforced globally, give or take one ``flush_interval``. Otherwise,
+    each process only knows about the requests it served
+
     :param size: The desired size of the API key. By default, it's just a random string, defaults to 32
     :type size: int, optional
+    :param usage_sink: A callable receiving usage counts, see above, defaults to ``None``
+    :type usage_sink: Callable, optional
+    :param default_quota: The number of requests keys can make per period, unless ``set_quota()`` was called for
+    them, defaults to ``None`` (unlimited)
+    :type default_quota: int, optional
+    :param quota_period: The length of quota periods, in seconds, defaults to 86400 (periods start at midnight UTC)
+    :type quota_period: int, optional
+    :param flush_interval: How often (in seconds) usage counts are handed to ``usage_sink``, defaults to 10
+    :type flush_interval: float, optional
     """
 
-    def __init__(self, size: int = 32):
+    def __init__(
+        self,
+        size: int = 32,
+        usage_sink: Optional[Callable[[float, Dict[str, int]], Optional[Dict[str, int]]]] = None,
+        default_quota: Optional[int] = None,
+        quota_period: int = 86400,
+        flush_interval: float = 10,
+    ):
         self.size = size
         self._keys = {}
+        self.usage_sink = usage_sink
+        self.default_quota = default_quota
+        self.quota_period = quota_period
+        self.flush_interval = flush_interval
+        # Whether consume() needs to be called, see Filters.APIFactory
+        self.tracks_usage = usage_sink is not None or default_quota is not None
+        # Key -> requests per period, overriding default_quota
+        self._quotas = {}
+        # Key -> requests made in the current period, as far as this process knows
+        self._usage = {}
+        # Key -> requests made since the counts were last handed to the flusher thread
+        self._pending = {}
+        self._period = None
+        self._next_flush = 0
+        # (period, counts) batches for the flusher thread, and the totals it got back from the sink
+        self._batches = queue.SimpleQueue()
+        self._totals = queue.SimpleQueue()
+        self._flusher = None
 
     def issue(self, metadata: dict = None):
         """Returns a new random API key of ``self.size`` length, saves it and attaches to it eventual metadata
@@ -41,10 +124,7 @@ class APIKeyFactory(object):
         :rtype: str
         """
 
-        key = "".join(
-            random.choice(string.ascii_letters + string.digits)
-            for _ in range(self.size)
-        )
+        key = generate_keys(self.size)[0]
         self._keys[key] = metadata
         return key
 
@@ -69,6 +149,7 @@ class APIKeyFactory(object):
         """
 
         self._keys.pop(key)
+        self._quotas.pop(key, None)
 
     def reissue(self, key):
         """Reissues an API key, replacing the old ``key`` with a new one, keeping the old metadata
@@ -97,3 +178,531 @@ class APIKeyFactory(object):
         """Implements item in self"""
 
         return self._keys.__contains__(item)
+
+    def key_id(self, key: str) -> str:
+        """Returns the identifier of a key given to ``usage_sink``, the key itself by default"""
+
+        return key
+
+    def set_quota(self, key: str, quota: Optional[int]):
+        """Sets the number of requests a key can make per period, overriding ``default_quota``
+
+        :param key: The API key
+        :type key: str
+        :param quota: The quota, or ``None`` for unlimited requests
+        :type quota: int
+        """
+
+        self._quotas[key] = quota
+        self.tracks_usage = True
+
+    def usage(self, key: str) -> int:
+        """Returns the number of requests made with a key in the current period, as far as this process knows"""
+
+        self._rollover(time.time())
+        return self._usage.get(key, 0)
+
+    def consume(self, key: str) -> bool:
+        """Counts a request made with the given key, unless the key is over its quota, in which case ``False``
+        is returned and the request isn't counted. This only touches memory
+
+        :param key: The API key, which must exist
+        :type key: str
+        :returns: ``True`` if the request is within the quota
+        :rtype: bool
+        """
+
+        if self.over_quota(key):
+            return False
+        self._usage[key] = self._usage.get(key, 0) + 1
+        self._pending[key] = self._pending.get(key, 0) + 1
+        return True
+
+    def over_quota(self, key: str) -> bool:
+        """Returns ``True`` if the given key used up its quota for the current period, without counting a request.
+        This only touches memory
+
+        :param key: The API key, which must exist
+        :type key: str
+        :rtype: bool
+        """
+
+        now = time.time()
+        if now >= self._next_flush:
+            self._rollover(now)
+        quota = self._quotas.get(key, self.default_quota)
+        return quota is not None and self._usage.get(key, 0) >= quota
+
+    def tick(self):
+        """Hands the pending usage counts to the flusher thread if ``flush_interval`` elapsed. Counts are otherwise
+        only handed over when a request is counted, so the server calls this periodically (see ``Server``) for the
+        last requests before a quiet period to reach ``usage_sink`` too
+        """
+
+        now = time.time()
+        if now >= self._next_flush:
+            self._rollover(now)
+
+    def _rollover(self, now: float):
+        """
+        Hands the pending counts to the flusher thread, applies the totals it got back from
+        the sink and starts a new quota period when needed. Only called from the event loop,
+        which is the only thread touching the counters
+        """
+
+        period = now - now % self.quota_period
+        while not self._totals.empty():
+            totals_period, totals = self._totals.get_nowait()
+            if totals_period == self._period:
+                for key, total in totals.items():
+                    # Requests counted since the batch was handed over aren't part of the total yet
+                    self._usage[key] = max(self._usage.get(key, 0), total + self._pending.get(key, 0))
+        if self._pending:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_usage, name="asyncapy-usage", daemon=True)
+                self._flusher.start()
+            self._batches.put((self._period, self._pending))
+            self._pending = {}
+        if period != self._period:
+            self._period = period
+            self._usage = {}
+        self._next_flush = min(now + self.flush_interval, period + self.quota_period)
+
+    def _flush_usage(self):
+        """
+        The flusher thread's main loop, calling ``usage_sink`` with the batches of counts
+        """
+
+        # Counts the sink failed to take, retried with the next batch of the same period
+        failed = {}
+        while True:
+            batch = self._batches.get()
+            if batch is None:
+                return
+            period, counts = batch
+            if self.usage_sink is None:
+                continue
+            if failed.get(period):
+                for key, count in failed.pop(period).items():
+                    counts[key] = counts.get(key, 0) + count
+            ids = {self.key_id(key): key for key in counts}
+            try:
+                totals = self.usage_sink(period, {key_id: counts[key] for key_id, key in ids.items()})
+            except Exception as error:
+                logging.error("{Usage} Could not flush the usage of %s key(s) -> %s", len(counts), error)
+                failed[period] = counts
+                continue
+            if totals:
+                self._totals.put((period, {ids[key_id]: total for key_id, total in totals.items() if key_id in ids}))
+
+    def flush(self):
+        """Hands the pending usage counts to ``usage_sink`` and waits until they're flushed. Call this before
+        the process exits, so that no request goes unaccounted. The server does it for the factories used by
+        ``Filters.APIFactory`` filters when it stops
+        """
+
+        if self._pending:
+            self._rollover(time.time())
+        if self._flusher is not None:
+            self._batches.put(None)
+            self._flusher.join()
+            self._flusher = None
+
+
+class SQLiteAPIKeyFactory(APIKeyFactory):
+
+    """A persistent ``APIKeyFactory``, backed by a SQLite database, meant for large amounts of keys. Keys are never
+    stored in plain text, only their SHA-256 hash is (keys are long random strings, so they don't need a slow, salted
+    hash), along with their metadata encoded as JSON: the keys themselves are only known when they're issued.
+
+    Nothing is loaded at startup, keys are looked up in the database when they're first seen and the result is
+    kept in an LRU cache of ``cache_size`` entries for ``cache_ttl`` seconds, so that lookups of hot keys, e.g. by
+    ``Filters.APIFactory``, don't touch the database. Keys that don't exist are remembered in a separate, smaller
+    LRU cache of ``negative_cache_size`` entries, so that clients sending random keys can't evict the valid ones.
+
+    Filters are synchronous, so lookups missing the cache run a blocking query on the event loop thread. That takes
+    microseconds when the database is in the page cache, but the database should be on a local disk.
+
+    The database can be shared by multiple processes (e.g. the workers of a server). Each process only sees changes
+    made by the others once the entries of its own cache expire, so ``cache_ttl`` is how long a revoked key may still
+    be accepted elsewhere
+
+    :param path: The path of the database file, created if it doesn't exist
+    :type path: str
+    :param size: The size of the API keys, defaults to 32
+    :type size: int, optional
+    :param cache_size: How many keys are cached in memory, defaults to 100000
+    :type cache_size: int, optional
+    :param cache_ttl: How long (in seconds) a lookup result is cached, defaults to 60
+    :type cache_ttl: float, optional
+    :param negative_cache_size: How many keys known not to exist are cached in memory, defaults to 10000
+    :type negative_cache_size: int, optional
+
+    The other keyword arguments (``usage_sink``, ``default_quota``, ``quota_period`` and ``flush_interval``)
+    configure usage accounting as in ``APIKeyFactory``. Key IDs are the hex SHA-256 hashes of the keys, so
+    sinks never see the keys themselves
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 32,
+        cache_size: int = 100000,
+        cache_ttl: float = 60,
+        negative_cache_size: int = 10000,
+        **usage,
+    ):
+        super().__init__(size, **usage)
+        self.path = path
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.negative_cache_size = negative_cache_size
+        # Hash -> (expiry, metadata), least recently used first
+        self._cache = collections.OrderedDict()
+        # Hash -> expiry of the keys known not to exist, least recently used first
+        self._misses = collections.OrderedDict()
+        self._connection = None
+        self._pid = None
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """
+        The connection to the database, opened on first use. Connections can't be shared
+        across ``fork()``, so each process (e.g. each worker of a server) opens its own
+        """
+
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS api_keys (hash BLOB PRIMARY KEY, metadata TEXT) WITHOUT ROWID"
+            )
+            self._pid = os.getpid()
+            self._cache.clear()
+            self._misses.clear()
+        return self._connection
+
+    @staticmethod
+    def _hash(key: str) -> bytes:
+        return hashlib.sha256(key.encode("utf-8")).digest()
+
+    def key_id(self, key: str) -> str:
+        """Returns the identifier of a key given to ``usage_sink``, the hex SHA-256 hash of the key"""
+
+        return self._hash(key).hex()
+
+    def _remember(self, key_hash: bytes, metadata):
+        expiry = time.monotonic() + self.cache_ttl
+        if metadata is _MISSING:
+            self._cache.pop(key_hash, None)
+            cache, entry, size = self._misses, expiry, self.negative_cache_size
+        else:
+            self._misses.pop(key_hash, None)
+            cache, entry, size = self._cache, (expiry, metadata), self.cache_size
+        cache[key_hash] = entry
+        cache.move_to_end(key_hash)
+        if len(cache) > size:
+            cache.popitem(last=False)
+
+    def _lookup(self, key) -> Tuple[bytes, object]:
+        """
+        Returns the hash of a key and its metadata, or ``_MISSING`` if the key doesn't exist
+        """
+
+        key_hash = self._hash(key)
+        now = time.monotonic()
+        entry = self._cache.get(key_hash)
+        if entry is not None and entry[0] > now:
+            self._cache.move_to_end(key_hash)
+            return key_hash, entry[1]
+        expiry = self._misses.get(key_hash)
+        if expiry is not None and expiry > now:
+            self._misses.move_to_end(key_hash)
+            return key_hash, _MISSING
+        row = self._db.execute("SELECT metadata FROM api_keys WHERE hash = ?", (key_hash,)).fetchone()
+        if row is None:
+            metadata = _MISSING
+        else:
+            metadata = None if row[0] is None else json.loads(row[0])
+        self._remember(key_hash, metadata)
+        return key_hash, metadata
+
+    def issue(self, metadata: dict = None):
+        """Returns a new random API key of ``self.size`` length, saves its hash and attaches to it eventual metadata
+
+        :param metadata: A JSON serializable dictionary containing meaningful information that is returned with the
+        ``self.get`` method. Defaults to ``None``
+        :type metadata: dict, optional
+        :returns key: The generated API key
+        :rtype: str
+        """
+
+        return self.issue_many(1, metadata)[0]
+
+    def issue_many(self, count: int, metadata: dict = None) -> List[str]:
+        """Issues ``count`` new API keys at once, in a single transaction, all with the same metadata
+
+        :param count: How many keys are issued
+        :type count: int
+        :param metadata: A JSON serializable dictionary attached to every key, defaults to ``None``
+        :type metadata: dict, optional
+        :returns: The generated API keys
+        :rtype: List[str]
+        """
+
+        encoded = None if metadata is None else json.dumps(metadata)
+        while True:
+            keys = generate_keys(self.size, count)
+            try:
+                self._insert([(self._hash(key), encoded) for key in keys])
+            except sqlite3.IntegrityError:
+                # Two keys collided, which is astronomically unlikely with 32 characters
+                continue
+            return keys
+
+    def import_keys(self, keys: Iterable[Tuple[str, Optional[dict]]]):
+        """Stores existing API keys (e.g. migrated from another storage), in a single transaction
+
+        :param keys: Pairs of API keys and their metadata
+        :type keys: Iterable[Tuple[str, dict]]
+        :raises sqlite3.IntegrityError: If one of the keys already exists, in which case none is stored
+        """
+
+        self._insert(
+            [(self._hash(key), None if metadata is None else json.dumps(metadata)) for key, metadata in keys]
+        )
+
+    def _insert(self, rows: List[Tuple[bytes, Optional[str]]]):
+        """
+        Inserts hashes and their encoded metadata in a single transaction
+        """
+
+        # Inserting in index order is much faster than in random order
+        rows.sort()
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            db.executemany("INSERT INTO api_keys (hash, metadata) VALUES (?, ?)", rows)
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        for key_hash, _ in rows:
+            # A miss may have been cached before the key existed
+            self._misses.pop(key_hash, None)
+
+    def get(self, key: str):
+        """Returns the associated metadata with the given key, raises ``KeyError`` if the key doesn't exist
+
+        :param key: The API key
+        :type key: str
+        :returns: The associated metadata with the given API key
+        :rtype: dict
+        :raises KeyError: If the given key does not exist
+        """
+
+        metadata = self._lookup(key)[1]
+        if metadata is _MISSING:
+            raise KeyError(key)
+        return metadata
+
+    def revoke(self, key: str):
+        """Revokes an API key, deleting it from the database
+
+        :param key: The API key to revoke
+        :type key: str
+        :raises KeyError: If the given key does not exist
+        """
+
+        key_hash = self._hash(key)
+        if not self._db.execute("DELETE FROM api_keys WHERE hash = ?", (key_hash,)).rowcount:
+            raise KeyError(key)
+        self._remember(key_hash, _MISSING)
+        self._quotas.pop(key, None)
+
+    def reissue(self, key):
+        """Reissues an API key, replacing the old ``key`` with a new one, keeping the old metadata. Unlike
+        ``APIKeyFactory.reissue``, the old key is revoked
+
+        :param key: The API key to reissue
+        :type key: str
+        :raises KeyError: If the given key does not exist
+        :returns: The new API key
+        """
+
+        new_key = self.issue(self.get(key))
+        self.revoke(key)
+        return new_key
+
+    def update(self, key: str, metadata: dict):
+        """Updates the associated metadata for the given key with the provided value
+
+        :param key: The API key to update data for
+        :type key: str
+        :param metadata: A JSON serializable dictionary returned with the ``self.get`` method
+        :type metadata: dict
+        :raises KeyError: If the given key does not exist
+        """
+
+        key_hash = self._hash(key)
+        cursor = self._db.execute(
+            "UPDATE api_keys SET metadata = ? WHERE hash = ?",
+            (None if metadata is None else json.dumps(metadata), key_hash),
+        )
+        if not cursor.rowcount:
+            raise KeyError(key)
+        self._remember(key_hash, metadata)
+
+    def close(self):
+        """Closes the connection to the database, which is reopened if the factory is used again"""
+
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+        self._pid = None
+
+    def __contains__(self, item):
+        """Implements item in self"""
+
+        if not isinstance(item, str):
+            return False
+        return self._lookup(item)[1] is not _MISSING
+
+    def __len__(self):
+        """Implements len(self), counting the keys in the database"""
+
+        return self._db.execute("SELECT COUNT(*) FROM api_keys").fetchone()[0]
+
+
+# Returned by SQLiteAPIKeyFactory._lookup() for keys that don't exist, as None is valid metadata
+_MISSING = object()
+
+
+class SQLiteUsageSink:
+
+    """A ``usage_sink`` for ``APIKeyFactory`` adding usage counts to a SQLite database, which may be shared by
+    multiple processes. It returns the total usage of the keys it was given, so that quotas are enforced across
+    all of them. It's called from the factory's flusher thread, never from the event loop
+
+    :param path: The path of the database file, created if it doesn't exist
+    :type path: str
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = self._local.db = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            self._local.pid = os.getpid()
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS api_usage (key_id TEXT, period INTEGER, requests INTEGER, "
+                "PRIMARY KEY (key_id, period)) WITHOUT ROWID"
+            )
+        return db
+
+    def __call__(self, period: float, counts: Dict[str, int]) -> Dict[str, int]:
+        """Adds ``counts`` to the usage of the given period and returns the resulting totals"""
+
+        db = self._db()
+        period = int(period)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            totals = {}
+            for key_id, count in counts.items():
+                # RETURNING would save the SELECT, but it needs SQLite 3.35
+                db.execute(
+                    "INSERT INTO api_usage (key_id, period, requests) VALUES (?, ?, ?) "
+                    "ON CONFLICT (key_id, period) DO UPDATE SET requests = requests + excluded.requests",
+                    (key_id, period, count),
+                )
+                totals[key_id] = db.execute(
+                    "SELECT requests FROM api_usage WHERE key_id = ? AND period = ?", (key_id, period)
+                ).fetchone()[0]
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        return totals
+
+    def usage(self, key_id: str, period: float) -> int:
+        """Returns the total usage of a key ID in the period starting at ``period``"""
+
+        row = self._db().execute(
+            "SELECT requests FROM api_usage WHERE key_id = ? AND period = ?", (key_id, int(period))
+        ).fetchone()
+        return row[0] if row else 0
+
+
+def configure_socket(
+    sock,
+    nodelay: Optional[bool] = None,
+    rcvbuf: Optional[int] = None,
+    sndbuf: Optional[int] = None,
+    keepalive: Optional[int] = None,
+):
+    """Applies the common tuning options to a socket. Options set to ``None`` are left untouched, and TCP-only
+    options are ignored on other kinds of sockets (e.g. Unix domain sockets)
+
+    :param sock: A ``socket.socket``, a trio socket or anything else implementing ``setsockopt()``
+    and exposing a ``family`` attribute
+    :param nodelay: Enables or disables ``TCP_NODELAY`` (that is, Nagle's algorithm), defaults to ``None``
+    :type nodelay: bool, optional
+    :param rcvbuf: The size of the kernel's receive buffer (``SO_RCVBUF``), in bytes, defaults to ``None``
+    :type rcvbuf: int, optional
+    :param sndbuf: The size of the kernel's send buffer (``SO_SNDBUF``), in bytes, defaults to ``None``
+    :type sndbuf: int, optional
+    :param keepalive: If set, TCP keepalive probes are sent after the connection has been idle for this many
+    seconds, and then every ``keepalive`` seconds, defaults to ``None``
+    :type keepalive: int, optional
+    """
+
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    if sndbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+    if sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+    if nodelay is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, bool(nodelay))
+    if keepalive:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # TCP_KEEPIDLE is TCP_KEEPALIVE on macOS, and neither is available everywhere
+        idle = getattr(socket, "TCP_KEEPIDLE", getattr(socket, "TCP_KEEPALIVE", None))
+        if idle is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, idle, keepalive)
+        if hasattr(socket, "TCP_KEEPINTVL"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, keepalive)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    A ``logging.handlers.QueueHandler`` that never blocks: records that don't fit in its (bounded)
+    queue are dropped and counted in ``self.dropped``
+
+    :param record_queue: The queue records are put into
+    :type record_queue: class: ``queue.Queue``
+    """
+
+    def __init__(self, record_queue: queue.Queue):
+        """
+        Object constructor
+        """
+
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Records are consumed by a thread in the same process, so they don't
+        # need to be made picklable: formatting them is left to that thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
@@ -0,0 +1,173 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Iterable, Optional
+from .metrics import Registry
+
+
+class Watchdog:
+    """
+    Detects code that blocks the event loop. A task running on the loop wakes up every ``interval``
+    seconds and measures how late it was woken up (the scheduler lag), while a separate thread checks
+    that the task keeps waking up: when the loop has been stuck for longer than ``budget`` seconds,
+    the thread takes a snapshot of the loop's stack and logs it, along with the name of the handler
+    that was running, if any
+
+    :param budget: How long (in seconds) the event loop may run without yielding before it's reported
+    :type budget: float
+    :param registry: Where the lag histogram, lag quantiles and stall counter are registered
+    :type registry: class: ``Registry``
+    :param handlers: A callable returning the functions of all registered handlers, used to tell
+    which handler blocked the loop
+    :type handlers: Callable
+    :param interval: How often (in seconds) the lag is measured, defaults to 0.05
+    :type interval: float, optional
+    :param window: How many recent lag samples the exported quantiles are computed on, defaults to 1200
+    :type window: int, optional
+    """
+
+    QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+    def __init__(
+        self,
+        budget: float,
+        registry: Registry,
+        handlers: Callable[[], Iterable[Callable]],
+        interval: float = 0.05,
+        window: int = 1200,
+    ):
+        """
+        Object constructor
+        """
+
+        self.budget = budget
+        self.interval = interval
+        self.handlers = handlers
+        self._samples = collections.deque(maxlen=window)
+        self._heartbeat = None
+        self._loop_thread = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lag = registry.histogram(
+            "asyncapy_event_loop_lag_seconds",
+            "How late the event loop woke up a sleeping task",
+            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+        )
+        quantiles = registry.gauge(
+            "asyncapy_event_loop_lag_quantile_seconds",
+            f"Quantiles of the event loop lag over the last {window} samples",
+            ("quantile",),
+        )
+        for quantile in self.QUANTILES:
+            quantiles.labels(str(quantile)).function = lambda q=quantile: self.lag_quantile(q)
+        self._stalls = registry.counter(
+            "asyncapy_event_loop_stalls",
+            "Times the event loop was blocked for longer than the watchdog budget",
+            ("handler",),
+        )
+
+    def lag_quantile(self, quantile: float) -> float:
+        """
+        Returns the given quantile (between 0 and 1) of the recent lag samples, in seconds
+        """
+
+        samples = sorted(self._samples)
+        if not samples:
+            return 0
+        return samples[min(int(len(samples) * quantile), len(samples) - 1)]
+
+    async def run(self, sleep: Callable):
+        """
+        Measures the scheduler lag forever. This must run on the event loop that is being watched
+
+        :param sleep: The async sleep function of the event loop
+        :type sleep: Callable
+        """
+
+        self._loop_thread = threading.get_ident()
+        while True:
+            start = self._heartbeat = time.perf_counter()
+            await sleep(self.interval)
+            lag = max(time.perf_counter() - start - self.interval, 0)
+            self._samples.append(lag)
+            self._lag.observe(lag)
+
+    def start(self):
+        """
+        Starts the watchdog thread
+        """
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._watch, name="asyncapy-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the watchdog thread
+        """
+
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+        self._heartbeat = None
+
+    def _find_handler(self, frame) -> Optional[str]:
+        """
+        Returns the name of the innermost handler in a stack, if any
+        """
+
+        codes = {function.__code__: function.__name__ for function in self.handlers()}
+        while frame is not None:
+            if frame.f_code in codes:
+                return codes[frame.f_code]
+            frame = frame.f_back
+        return None
+
+    def _watch(self):
+        """
+        The watchdog thread's main loop
+        """
+
+        reported = None
+        while not self._stopping.wait(self.budget / 2):
+            heartbeat = self._heartbeat
+            if heartbeat is None or heartbeat == reported:
+                continue
+            blocked = time.perf_counter() - heartbeat - self.interval
+            if blocked <= self.budget:
+                continue
+            # Only report each stall once
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            handler = self._find_handler(frame)
+            self._stalls.labels(handler or "unknown").inc()
+            logging.warning(
+                "{Watchdog} The event loop has been blocked for more than %.0fms%s, stack:\n%s",
+                blocked * 1e3,
+                f" by handler '{handler}'" if handler else "",
+                "".join(traceback.format_stack(frame)).rstrip(),
+            )
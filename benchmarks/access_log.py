@@ -0,0 +1,118 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the cost of the access log: first the time the event loop spends on each
+record (creating it, timing the stages and queueing it), then the throughput of an
+echo handler with and without the access log.
+Usage: python benchmarks/access_log.py [clients] [requests per client]
+"""
+
+import os
+import sys
+import time
+import uuid
+import logging
+import tempfile
+import multiprocessing
+from asyncapy import Server
+from asyncapy.access import AccessLog, AccessRecord
+from asyncapy.client import Client
+
+
+PORT = 1512
+
+
+def record_cost(records: int = 200000) -> float:
+    path = os.path.join(tempfile.gettempdir(), "asyncapy-bench-access.log")
+    access_log = AccessLog(path, queue_size=records)
+    access_log.start()
+    session_id = str(uuid.uuid4())
+    start = time.perf_counter()
+    for _ in range(records):
+        record = AccessRecord(session_id, "127.0.0.1")
+        record.lap("read")
+        record.lap("decode")
+        record.lap("dispatch")
+        record.add("send", 0.0)
+        record.lap("handler")
+        record.finish("ok")
+        access_log.write(record)
+    elapsed = time.perf_counter() - start
+    access_log.stop()
+    os.remove(path)
+    return elapsed / records
+
+
+def serve(access_log):
+    server = Server(port=PORT, keep_alive=True, logging_level=logging.WARNING, access_log=access_log)
+
+    @server.add_handler()
+    async def echo(client, packet):
+        await client.send(packet)
+
+    server.start()
+
+
+def run_client(requests: int, results: multiprocessing.Queue):
+    client = Client(tls=False)
+    client.connect("127.0.0.1", PORT)
+    for _ in range(requests):
+        client.send({"foo": "bar"})
+        client.receive_raw()
+    client.disconnect()
+    results.put(requests)
+
+
+def throughput(access_log, clients: int, requests: int) -> float:
+    server = multiprocessing.Process(target=serve, args=(access_log,))
+    server.start()
+    try:
+        time.sleep(1)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=run_client, args=(requests, results))
+            for _ in range(clients)
+        ]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        total = sum(results.get() for _ in processes)
+        elapsed = time.perf_counter() - start
+        for process in processes:
+            process.join()
+    finally:
+        server.terminate()
+        server.join()
+    return total / elapsed
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    print(f"Cost per record on the event loop: {record_cost() * 1e6:.2f}us")
+    path = os.path.join(tempfile.gettempdir(), "asyncapy-bench-access-server.log")
+    for name, access_log in (("disabled", None), ("enabled", path)):
+        result = throughput(access_log, clients, requests)
+        print(f"Access log {name}: {clients} clients x {requests} requests, {result:.0f} req/s")
+    if os.path.exists(path):
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compares the throughput and the latency of an echo handler on the trio and asyncio
+backends (the latter uses uvloop if it's installed), with several concurrent
+keep-alive clients. Usage: python benchmarks/backends.py [clients] [requests per client]
+"""
+
+import sys
+import time
+import logging
+import multiprocessing
+from asyncapy import Server
+from asyncapy.client import Client
+
+
+PORT = 1511
+
+
+def serve(backend: str):
+    server = Server(port=PORT, keep_alive=True, logging_level=logging.WARNING)
+
+    @server.add_handler()
+    async def echo(client, packet):
+        await client.send(packet)
+
+    server.start(backend=backend)
+
+
+def run_client(requests: int, results: multiprocessing.Queue):
+    client = Client(tls=False)
+    client.connect("127.0.0.1", PORT)
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.send({"foo": "bar"})
+        client.receive_raw()
+        samples.append(time.perf_counter() - start)
+    client.disconnect()
+    results.put(samples)
+
+
+def measure(backend: str, clients: int, requests: int):
+    server = multiprocessing.Process(target=serve, args=(backend,))
+    server.start()
+    try:
+        time.sleep(1)
+        # Warm up
+        warmup = multiprocessing.Queue()
+        run_client(100, warmup)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=run_client, args=(requests, results))
+            for _ in range(clients)
+        ]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        samples = []
+        for _ in processes:
+            samples.extend(results.get())
+        elapsed = time.perf_counter() - start
+        for process in processes:
+            process.join()
+    finally:
+        server.terminate()
+        server.join()
+    samples.sort()
+    return {
+        "throughput": len(samples) / elapsed,
+        "p50": samples[len(samples) // 2] * 1e6,
+        "p99": samples[int(len(samples) * 0.99)] * 1e6,
+    }
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    for backend in ("trio", "asyncio"):
+        result = measure(backend, clients, requests)
+        print(
+            f"{backend}: {clients} clients x {requests} requests, {result['throughput']:.0f} req/s, "
+            f"p50 {result['p50']:.1f}us, p99 {result['p99']:.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
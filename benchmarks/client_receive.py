@@ -0,0 +1,87 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compares how fast the synchronous client reads responses of various sizes over loopback
+TCP with the line rate, that is, how fast the same bytes are drained from the socket
+without any framing. Usage: python benchmarks/client_receive.py [megabytes]
+"""
+
+import sys
+import time
+import socket
+import threading
+from asyncapy.client import Client
+
+
+def stream(data: bytes) -> socket.socket:
+    """
+    Returns a connected socket a thread writes ``data`` to, closing it afterwards
+    """
+
+    listener = socket.create_server(("127.0.0.1", 0))
+    sock = socket.create_connection(listener.getsockname())
+    peer, _ = listener.accept()
+    listener.close()
+
+    def write():
+        with peer:
+            peer.sendall(data)
+
+    threading.Thread(target=write, daemon=True).start()
+    return sock
+
+
+def line_rate(data: bytes) -> float:
+    sock = stream(data)
+    buffer = memoryview(bytearray(1 << 20))
+    start = time.perf_counter()
+    while sock.recv_into(buffer):
+        pass
+    elapsed = time.perf_counter() - start
+    sock.close()
+    return elapsed
+
+
+def client_rate(data: bytes, frames: int) -> float:
+    client = Client(tls=False)
+    client.sock = stream(data)
+    start = time.perf_counter()
+    for _ in range(frames):
+        client.receive_raw()
+    elapsed = time.perf_counter() - start
+    client.disconnect()
+    return elapsed
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    for size in (256, 4096, 65536, 1 << 20, 16 << 20):
+        frames = max(megabytes * (1 << 20) // size, 1)
+        frame = (size + 2).to_bytes(4, "big") + bytes((22, 0)) + b"x" * size
+        data = frame * frames
+        line = len(data) / line_rate(data) / (1 << 20)
+        client = len(data) / client_rate(data, frames) / (1 << 20)
+        print(
+            f"{size:>9} byte responses: line rate {line:8.1f} MiB/s, client {client:8.1f} MiB/s "
+            f"({client / line:.0%}), {frames / (len(data) / (client * (1 << 20))):,.0f} responses/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the cost of recording metrics, which the server does several times per
+request, and of rendering them for a scrape. Usage: python benchmarks/metrics.py [iterations]
+"""
+
+import sys
+import timeit
+from asyncapy.metrics import Registry
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    registry = Registry()
+    counter = registry.counter("bench_counter", "A counter")
+    labelled = registry.counter("bench_labelled", "A labelled counter", ("error",))
+    histogram = registry.histogram("bench_histogram", "A labelled histogram", ("handler", "group"))
+    cases = {
+        "empty loop": lambda: None,
+        "Counter.inc()": counter.inc,
+        "Counter.labels(...).inc()": lambda: labelled.labels("ERR_TIMED_OUT").inc(),
+        "Histogram.labels(...).observe()": lambda: histogram.labels("echo", 0).observe(0.0042),
+    }
+    baseline = None
+    for name, case in cases.items():
+        elapsed = min(timeit.repeat(case, number=iterations, repeat=3)) / iterations * 1e9
+        if baseline is None:
+            baseline = elapsed
+            print(f"{name}: {elapsed:.0f}ns")
+        else:
+            print(f"{name}: {elapsed:.0f}ns ({elapsed - baseline:.0f}ns over the empty loop)")
+    for handler in range(50):
+        histogram.labels(f"handler_{handler}", 0).observe(0.001)
+    elapsed = min(timeit.repeat(registry.render, number=100, repeat=3)) / 100 * 1e3
+    print(f"Registry.render() with 50 histograms: {elapsed:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compares sending requests in lockstep (send, then wait for the response) with pipelining
+them with Client.request_many(), for several window sizes.
+Usage: python benchmarks/pipelining.py [requests]
+"""
+
+import sys
+import time
+import logging
+import multiprocessing
+from asyncapy import Server
+from asyncapy.client import Client
+
+
+PORT = 1511
+
+
+def serve():
+    server = Server(port=PORT, keep_alive=True, logging_level=logging.WARNING)
+
+    @server.add_handler()
+    async def echo(client, packet):
+        await client.send(packet)
+
+    server.start()
+
+
+def lockstep(client: Client, requests: int):
+    for n in range(requests):
+        client.send({"item": n})
+        client.receive()
+
+
+def pipelined(client: Client, requests: int, window: int):
+    for _ in client.request_many(({"item": n} for n in range(requests)), window=window):
+        pass
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    process = multiprocessing.Process(target=serve)
+    process.start()
+    try:
+        time.sleep(1)
+        client = Client(tls=False)
+        client.connect("127.0.0.1", PORT)
+        # Warm up the connection
+        lockstep(client, 100)
+        runs = [("lockstep", lambda: lockstep(client, requests))]
+        for window in (10, 100, 1000):
+            runs.append((f"window {window}", lambda window=window: pipelined(client, requests, window)))
+        for name, run in runs:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            print(f"{name:<12} {requests} requests in {elapsed:.2f}s, {requests / elapsed:,.0f} requests/s")
+        client.disconnect()
+    finally:
+        process.terminate()
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
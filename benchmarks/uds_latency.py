@@ -0,0 +1,89 @@
+# AsyncAPY - A fully fledged Python 3.6+ library to serve APIs asynchronously
+# Copyright (C) 2019-2020 intellivoid <https://github.com/intellivoid>
+#
+# This file is part of AsyncAPY.
+#
+# AsyncAPY is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AsyncAPY is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with AsyncAPY.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compares the round trip latency of an echo request over loopback TCP and over
+a Unix domain socket. Usage: python benchmarks/uds_latency.py [requests]
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import multiprocessing
+from asyncapy import Server
+from asyncapy.client import Client
+
+
+PORT = 1510
+UNIX_PATH = os.path.join(tempfile.gettempdir(), "asyncapy-bench.sock")
+
+
+def serve():
+    server = Server(port=PORT, unix_path=UNIX_PATH, keep_alive=True, logging_level=logging.WARNING)
+
+    @server.add_handler()
+    async def echo(client, packet):
+        await client.send(packet)
+
+    server.start()
+
+
+def measure(client: Client, requests: int):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.send({"foo": "bar"})
+        client.receive_raw()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "p50": samples[len(samples) // 2] * 1e6,
+        "p99": samples[int(len(samples) * 0.99)] * 1e6,
+        "mean": sum(samples) / len(samples) * 1e6,
+    }
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    process = multiprocessing.Process(target=serve)
+    process.start()
+    try:
+        time.sleep(1)
+        tcp = Client(tls=False)
+        tcp.connect("127.0.0.1", PORT)
+        uds = Client(tls=False)
+        uds.connect_unix(UNIX_PATH)
+        # Warm up both connections
+        measure(tcp, 100)
+        measure(uds, 100)
+        for name, client in (("TCP", tcp), ("UDS", uds)):
+            result = measure(client, requests)
+            print(
+                f"{name}: {requests} requests, p50 {result['p50']:.1f}us, p99 {result['p99']:.1f}us, "
+                f"mean {result['mean']:.1f}us"
+            )
+            client.disconnect()
+    finally:
+        process.terminate()
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
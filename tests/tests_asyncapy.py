@@ -1,4 +1,33 @@
 from asyncapy.client import Client
+from asyncapy.timers import TimerWheel
+from asyncapy.backends import AsyncioBackend
+from asyncapy.util import configure_socket, DroppingQueueHandler, SQLiteAPIKeyFactory, APIKeyFactory, SQLiteUsageSink
+from asyncapy.access import AccessLog, AccessRecord
+from asyncapy.metrics import Registry
+from asyncapy.watchdog import Watchdog
+from asyncapy.bench import run_scenario, encode_frame
+from asyncapy.bench import micro
+from asyncapy.capture import CaptureWriter, CaptureReader, REQUEST, CLOSE
+from asyncapy.filters import Filters
+from asyncapy.errors import RequestRejected
+from asyncapy.core import Packet, Handler
+from asyncapy import core
+from asyncapy.overload import OverloadController
+from asyncapy.server import Server
+from asyncapy.cache import ResponseCache, Flight, request_key
+from asyncapy.async_client import AsyncClient
+import pytest
+import trio
+import trio.testing
+import asyncio
+import logging
+import queue
+import socket
+import threading
+import signal
+import multiprocessing
+import os
+import tempfile
 import json
 import ziproto
 import time
@@ -89,3 +118,877 @@ class TestAsyncAPY:
         client.connect("127.0.0.1", 1500)
         time.sleep(15)
         assert client.receive() == {"status": "failure", "error": "ERR_TIMED_OUT"}
+
+    def test_timer_wheel(self):
+        """
+        Tests that the timer wheel fires deadlines on time, that
+        resetting a timer postpones it and that cancelled timers
+        never fire
+        """
+
+        now = [0.0]
+        wheel = TimerWheel(resolution=0.1, slots=8, clock=lambda: now[0])
+        fired = []
+        idle = wheel.schedule(1, lambda: fired.append("idle"), "idle")
+        cancelled = wheel.schedule(0.5, lambda: fired.append("cancelled"))
+        cancelled.cancel()
+        now[0] = 0.9
+        idle.reset(1, "read")  # Activity on the connection pushes the deadline forward
+        now[0] = 1.5
+        wheel.advance()
+        assert fired == []
+        now[0] = 1.95
+        wheel.advance()
+        assert fired == ["idle"] and idle.expired and idle.reason == "read"
+        assert len(wheel) == 0
+
+    def test_asyncio_cancel_scope(self):
+        """
+        Tests that cancelling a scope on the asyncio backend
+        only interrupts the code running inside it
+        """
+
+        backend = AsyncioBackend(use_uvloop=False)
+
+        async def main():
+            scope = backend.cancel_scope()
+            asyncio.get_running_loop().call_later(0.1, scope.cancel)
+            with scope:
+                await asyncio.sleep(10)
+            await asyncio.sleep(0)  # The task itself must not be cancelled
+            return scope.cancelled_caught
+
+        assert backend.run(main)
+
+    def test_log_queue_overflow(self):
+        """
+        Tests that log records are dropped and counted,
+        instead of blocking, when the log queue is full
+        """
+
+        handler = DroppingQueueHandler(queue.Queue(2))
+        logger = logging.getLogger("asyncapy.tests")
+        logger.addHandler(handler)
+        try:
+            for i in range(5):
+                logger.warning("record %s", i)
+        finally:
+            logger.removeHandler(handler)
+        assert handler.queue.qsize() == 2 and handler.dropped == 3
+        assert handler.queue.get().getMessage() == "record 0"
+
+    def test_access_log(self):
+        """
+        Tests that the access log writes one JSON line
+        per request and rotates its file
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "access.log")
+            access_log = AccessLog(path, max_bytes=1, backup_count=2, flush_interval=0.05)
+            access_log.start()
+            for status in ("ok", "ERR_REQUEST_MALFORMED", "unhandled"):
+                record = AccessRecord("session", "127.0.0.1")
+                record.lap("read")
+                record.finish(status)
+                access_log.write(record)
+                time.sleep(access_log.flush_interval * 2)
+            access_log.stop()
+            assert sorted(os.listdir(directory)) == ["access.log", "access.log.1", "access.log.2"]
+            with open(path + ".1") as rotated:
+                line = json.loads(rotated.read())
+            assert line["status"] == "unhandled" and line["peer"] == "127.0.0.1"
+            assert set(line["stages"]) == {"read"}
+
+    def test_metrics(self):
+        """
+        Tests that counters and histograms are rendered
+        in the Prometheus text format
+        """
+
+        registry = Registry()
+        errors = registry.counter("errors", "Error responses", ("error",))
+        latency = registry.histogram("latency_seconds", "Latency", ("handler",), buckets=(0.1, 1))
+        errors.labels("ERR_TIMED_OUT").inc()
+        errors.labels("ERR_TIMED_OUT").inc()
+        for value in (0.05, 0.5, 0.7, 5):
+            latency.labels("echo").observe(value)
+        text = registry.render()
+        assert 'errors_total{error="ERR_TIMED_OUT"} 2' in text
+        assert 'latency_seconds_bucket{handler="echo",le="1"} 3' in text
+        assert 'latency_seconds_bucket{handler="echo",le="+Inf"} 4' in text
+        assert 'latency_seconds_count{handler="echo"} 4' in text
+        assert latency.labels("echo").quantile(0.5) == 1
+
+    def test_watchdog(self):
+        """
+        Tests that the watchdog reports a handler that blocks
+        the event loop, and records the lag
+        """
+
+        async def blocking(client, packet):
+            time.sleep(0.2)
+
+        registry = Registry()
+        watchdog = Watchdog(0.05, registry, lambda: [blocking], interval=0.01)
+
+        async def main():
+            watchdog.start()
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(watchdog.run, trio.sleep)
+                await trio.sleep(0.05)
+                await blocking(None, None)
+                await trio.sleep(0.05)
+                nursery.cancel_scope.cancel()
+            watchdog.stop()
+
+        trio.run(main)
+        text = registry.render()
+        assert 'asyncapy_event_loop_stalls_total{handler="blocking"} 1' in text
+        assert watchdog.lag_quantile(1) > 0.1
+
+    def test_load_generator(self):
+        """
+        Tests the load generator against the echo scenario,
+        with pipelined and fragmented ziproto requests
+        """
+
+        result = run_scenario("echo", encoding="ziproto", connections=4, pipeline=2, fragments=3, requests=200)
+        assert result.sent == result.responses == 200
+        assert not result.errors and not result.unanswered
+        assert result.percentile(50) <= result.percentile(99) <= result.percentile(100)
+
+    def test_micro_benchmarks(self):
+        """
+        Tests that micro-benchmarks run and that
+        regressions past the tolerance are reported
+        """
+
+        results = micro.run(["parse_header", "dispatch_1_handlers"], repeat=1, min_time=0.01)
+        assert all(elapsed > 0 for elapsed in results.values())
+        baseline = {"parse_header": results["parse_header"] / 2, "dispatch_1_handlers": results["dispatch_1_handlers"]}
+        assert micro.compare(results, baseline, tolerance=0.25) == ["parse_header"]
+        assert micro.compare(results, baseline, tolerance=1.5) == []
+
+    def test_capture(self):
+        """
+        Tests that captured frames are read back in order,
+        and that a truncated last record is ignored
+        """
+
+        path = os.path.join(tempfile.mkdtemp(), "capture.bin")
+        capture = CaptureWriter(path, flush_interval=0.05)
+        capture.start()
+        capture.write(REQUEST, 0, b"\x16\x00{}", prefix=(4).to_bytes(4, "big"))
+        capture.write(REQUEST, 1, b"\x00\x00\x00\x04\x16\x01\x80")
+        capture.write(CLOSE, 0)
+        capture.stop()
+        with open(path, "ab") as file:
+            file.write(b"\x00\x01")
+        with CaptureReader(path) as reader:
+            records = [(record.kind, record.connection, bytes(record.frame)) for record in reader]
+            offsets = [record.offset for record in reader]
+        assert records == [
+            (REQUEST, 0, b"\x00\x00\x00\x04\x16\x00{}"),
+            (REQUEST, 1, b"\x00\x00\x00\x04\x16\x01\x80"),
+            (CLOSE, 0, b""),
+        ]
+        assert offsets == sorted(offsets)
+
+    def test_rate_limit(self):
+        """
+        Tests that the rate limit filter allows bursts,
+        rejects requests over the limit, forgets the
+        least recently seen keys and groups malformed
+        API keys by address
+        """
+
+        class FakeClient:
+            def __init__(self, address):
+                self.address = address
+
+        rate_limit = Filters.RateLimit(10, burst=3, max_keys=2)
+        packet = Packet({"foo": "bar"}, encoding="json")
+        client = FakeClient("10.0.0.1")
+        for _ in range(3):
+            assert rate_limit.check(client, packet)
+        with pytest.raises(RequestRejected) as rejected:
+            rate_limit.check(client, packet)
+        assert rejected.value.error == "ERR_RATE_LIMITED"
+        time.sleep(0.11)
+        assert rate_limit.check(client, packet)
+        rate_limit.check(FakeClient("10.0.0.2"), packet)
+        rate_limit.check(FakeClient("10.0.0.3"), packet)
+        assert len(rate_limit) == 2
+        assert rate_limit.check(client, packet)
+        # API keys that aren't strings are grouped by address instead
+        rate_limit = Filters.RateLimit(10, burst=1, key="api_key")
+        assert rate_limit.check(client, Packet({"api_key": ["a", "list"]}, encoding="json"))
+        with pytest.raises(RequestRejected):
+            rate_limit.check(client, Packet({"api_key": {"a": "dict"}}, encoding="json"))
+        assert rate_limit.check(client, Packet({"api_key": "key"}, encoding="json"))
+
+    def test_overload_controller(self):
+        """
+        Tests that the overload controller rejects requests
+        over its limit, sheds less important requests first
+        and adapts the limit to the sojourn time
+        """
+
+        overload = OverloadController(0.01, interval=0.01, initial_limit=10)
+        for _ in range(9):
+            assert overload.try_acquire()
+        assert overload.admits(0)
+        assert not overload.admits(1)
+        assert not overload.admits(5)
+        assert overload.try_acquire()
+        assert not overload.try_acquire()
+        time.sleep(0.02)
+        overload.release(0.05)
+        assert overload.limit == 9
+        time.sleep(0.02)
+        overload.release(0.001)
+        assert overload.limit == 10
+
+    def test_frame_limits(self):
+        """
+        Tests that frames over the maximum size, frames
+        sent too slowly and frames over the memory budget
+        are refused with their own error codes
+        """
+
+        server = Server(
+            logging_level=logging.CRITICAL,
+            timer_resolution=0.01,
+            max_frame_size=1000,
+            min_read_rate=100,
+            read_grace_period=0.2,
+            frame_memory_budget=1500,
+        )
+
+        async def send(*chunks, delay=0.0):
+            client, stream = trio.testing.memory_stream_pair()
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(server._handle_client, stream)
+                try:
+                    for chunk in chunks:
+                        await client.send_all(chunk)
+                        await trio.sleep(delay)
+                except trio.BrokenResourceError:
+                    # The server refused the frame before it was complete
+                    pass
+                response = b""
+                with trio.move_on_after(2):
+                    chunk = await client.receive_some()
+                    while chunk:
+                        response += chunk
+                        chunk = await client.receive_some()
+                nursery.cancel_scope.cancel()
+            return json.loads(response[6:])["error"]
+
+        async def main():
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(server._timers.run)
+                assert await send((1001).to_bytes(4, "big")) == "ERR_FRAME_TOO_LARGE"
+                # 100 bytes take 1.2 seconds at 100 bytes/s, with the grace period
+                assert await send((100).to_bytes(4, "big"), *[b"x"] * 10, delay=0.15) == "ERR_READ_TOO_SLOW"
+                assert await send(b"\x00", b"\x00", delay=0.3) == "ERR_READ_TOO_SLOW"
+                # The first frame holds 1000 bytes of the budget until it's complete
+                client, stream = trio.testing.memory_stream_pair()
+                nursery.start_soon(server._handle_client, stream)
+                await client.send_all((1000).to_bytes(4, "big") + b"{")
+                await trio.sleep(0.05)
+                assert await send((600).to_bytes(4, "big")) == "ERR_MEMORY_BUDGET_EXCEEDED"
+                metrics = server.metrics.render()
+                assert "asyncapy_frame_memory_bytes 1000" in metrics
+                assert 'asyncapy_rejected_frames_total{reason="too_slow"} 2' in metrics
+                nursery.cancel_scope.cancel()
+
+        trio.run(main)
+
+    def test_response_cache(self):
+        """
+        Tests that responses of cached handlers are replayed
+        for requests with the same fields, in any order, that
+        the handler's filters still run on cache hits, and
+        that the cache evicts the least recently used entries
+        """
+
+        server = Server(logging_level=logging.CRITICAL, keep_alive=True)
+        calls = []
+
+        @server.add_handler(
+            Filters.Fields(cached_op="^square$", n=r"^\d+$"), Filters.RateLimit(0.001, burst=2), cache=60
+        )
+        async def square(client, packet):
+            calls.append(packet["n"])
+            await client.send(Packet({"result": int(packet["n"]) ** 2}, encoding=packet.encoding))
+
+        async def main():
+            async with trio.open_nursery() as nursery:
+                listeners = await nursery.start(trio.serve_tcp, server._handle_client, 0)
+                stream = await trio.open_tcp_stream("127.0.0.1", listeners[0].socket.getsockname()[1])
+                responses = []
+                for payload in (
+                    {"cached_op": "square", "n": "12"},
+                    {"n": "12", "cached_op": "square"},
+                    {"cached_op": "square", "n": "12"},
+                ):
+                    await stream.send_all(encode_frame(payload))
+                    responses.append(await stream.receive_some())
+                nursery.cancel_scope.cancel()
+            return responses
+
+        first, second, third = trio.run(main)
+        assert first == second
+        assert json.loads(first[6:]) == {"result": 144}
+        # The rate limit applies to cache hits too
+        assert json.loads(third[6:])["error"] == "ERR_RATE_LIMITED"
+        assert calls == ["12"]
+        assert 'asyncapy_response_cache_lookups_total{result="hit"} 1' in server.metrics.render()
+        cache = ResponseCache(max_bytes=10)
+        cache.put(("a", "json"), b"1234", 60)
+        cache.put(("b", "json"), b"1234", 60)
+        assert cache.get(("a", "json")) == b"1234"
+        cache.put(("c", "json"), b"1234", 60)
+        assert cache.get(("b", "json")) is None
+        assert len(cache) == 2 and cache.size == 8
+
+    def test_async_client(self):
+        """
+        Tests that the async client runs concurrent requests
+        over a bounded pool of connections on trio, retries
+        requests on pooled connections that broke, and that
+        it stops pooling them on asyncio against a server
+        that closes connections after responding
+        """
+
+        server = Server(logging_level=logging.CRITICAL, keep_alive=True)
+
+        @server.add_handler(Filters.Fields(pooled_op="^double$", n=r"^\d+$"))
+        async def double(client, packet):
+            await trio.sleep(0.05)
+            await client.send(Packet({"result": int(packet["n"]) * 2}, encoding=packet.encoding))
+
+        async def main():
+            results = {}
+            async with trio.open_nursery() as nursery:
+                listeners = await nursery.start(trio.serve_tcp, server._handle_client, 0)
+                port = listeners[0].socket.getsockname()[1]
+                async with AsyncClient(port=port, tls=False, min_size=1, max_size=3, encoding="ziproto") as client:
+
+                    async def request(n):
+                        results[n] = await client.request({"pooled_op": "double", "n": str(n)})
+
+                    async with trio.open_nursery() as requests:
+                        for n in range(12):
+                            requests.start_soon(request, n)
+                    size = client.size
+
+                    async def reset(data):
+                        raise trio.BrokenResourceError("Connection reset by peer")
+
+                    # Writing to a pooled connection the server dropped fails, the request is sent again
+                    client._idle[-1].stream.send_all = reset
+                    retried = await client.request({"pooled_op": "double", "n": "21"})
+                nursery.cancel_scope.cancel()
+            return results, size, retried
+
+        results, size, retried = trio.run(main)
+        assert results == {n: {"result": n * 2} for n in range(12)}
+        assert size == 3
+        assert retried == {"result": 42}
+
+        async def echo():
+            client = AsyncClient(port=1500, tls=False)
+            responses = await asyncio.gather(*(client.request({"echo": str(n)}) for n in range(3)))
+            await asyncio.sleep(0.1)
+            responses.append(await client.request({"echo": "again"}))
+            keep_alive = client.keep_alive
+            await client.aclose()
+            return responses, keep_alive
+
+        responses, keep_alive = asyncio.run(echo())
+        assert responses == [{"echo": "0"}, {"echo": "1"}, {"echo": "2"}, {"echo": "again"}]
+        assert keep_alive is False
+
+    def test_singleflight(self):
+        """
+        Tests that identical concurrent requests to a
+        singleflight handler share a single execution,
+        whatever their encoding
+        """
+
+        server = Server(logging_level=logging.CRITICAL, keep_alive=True)
+        calls = []
+
+        @server.add_handler(Filters.Fields(coalesced_op="^slow$"), singleflight=True)
+        async def slow(client, packet):
+            calls.append(packet.encoding)
+            await trio.sleep(0.2)
+            await client.send(Packet({"result": 42}, encoding=packet.encoding))
+
+        async def main():
+            responses = {}
+
+            async def request(index, encoding):
+                stream = await trio.open_tcp_stream("127.0.0.1", port)
+                await stream.send_all(encode_frame({"coalesced_op": "slow"}, encoding))
+                responses[index] = await stream.receive_some()
+
+            async with trio.open_nursery() as nursery:
+                listeners = await nursery.start(trio.serve_tcp, server._handle_client, 0)
+                port = listeners[0].socket.getsockname()[1]
+                async with trio.open_nursery() as clients:
+                    for index, encoding in enumerate(("json", "json", "ziproto")):
+                        clients.start_soon(request, index, encoding)
+                nursery.cancel_scope.cancel()
+            return responses
+
+        responses = trio.run(main)
+        assert len(calls) == 1
+        assert responses[0] == responses[1]
+        assert json.loads(responses[0][6:]) == {"result": 42}
+        assert ziproto.decode(responses[2][6:]) == {"result": 42}
+        assert 'asyncapy_coalesced_requests_total{handler="slow"} 2' in server.metrics.render()
+
+        async def fails(client, packet):
+            calls.append("fallback")
+            await client.send(Packet({"result": 42}, encoding=packet.encoding))
+
+        class Sink:
+            async def send_all(self, data):
+                pass
+
+        handler = Handler(fails, singleflight=True)
+        client = core.Client("127.0.0.1", server, Sink(), "session", "json")
+        packet = Packet({"coalesced_op": "fails"}, encoding="json")
+
+        async def wait(flight):
+            flight.done.set()
+            server._flights[handler, request_key(packet.dict_payload)] = flight
+            try:
+                await server._call_once("session", handler, client, packet)
+            finally:
+                server._flights.clear()
+
+        # Every waiting request raises its own copy of the exception
+        flight = Flight(trio.Event(), "json")
+        flight.error = original = ValueError("boom")
+        errors = []
+        for _ in range(2):
+            with pytest.raises(ValueError) as raised:
+                trio.run(wait, flight)
+            errors.append(raised.value)
+        assert errors[0] is not errors[1] and errors[0].__cause__ is errors[1].__cause__ is original
+        # A response with bytes can't be converted to JSON, so the handler runs again
+        flight = Flight(trio.Event(), "ziproto")
+        payload = ziproto.encode({"data": b"\x00"})
+        flight.frames = [(len(payload) + 2).to_bytes(4, "big") + bytes((22, 1)) + payload]
+        trio.run(wait, flight)
+        assert calls[-1] == "fallback"
+
+    def test_sqlite_api_keys(self):
+        """
+        Tests that the SQLite API key factory persists
+        hashed keys and their metadata across restarts,
+        and caches unknown keys separately
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "keys.db")
+            factory = SQLiteAPIKeyFactory(path, cache_size=10)
+            keys = factory.issue_many(100, {"plan": "free"})
+            assert len(set(keys)) == 100 and all(len(key) == 32 and key.isalnum() for key in keys)
+            assert keys[0] in factory and "nope" not in factory
+            factory.update(keys[1], {"plan": "pro"})
+            factory.revoke(keys[2])
+            with pytest.raises(KeyError):
+                factory.revoke(keys[2])
+            factory.close()
+            with open(path, "rb") as database:
+                assert keys[0].encode() not in database.read()
+            factory = SQLiteAPIKeyFactory(path)
+            assert len(factory) == 99
+            assert factory.get(keys[0]) == {"plan": "free"}
+            assert factory.get(keys[1]) == {"plan": "pro"}
+            assert keys[2] not in factory
+            assert Filters.APIFactory(factory, "key").check(None, Packet({"key": keys[3]}, encoding="json"))
+            factory.close()
+            # Unknown keys don't evict the valid ones from the cache
+            factory = SQLiteAPIKeyFactory(path, cache_size=2, negative_cache_size=5)
+            assert keys[0] in factory
+            for index in range(100):
+                assert f"unknown-{index}" not in factory
+            assert list(factory._cache) == [factory._hash(keys[0])] and len(factory._misses) == 5
+            factory.close()
+
+    def test_api_key_quotas(self):
+        """
+        Tests that API key usage is counted, flushed to
+        the usage sink and that keys over their quota
+        are rejected, across processes sharing a sink
+        """
+
+        flushed = []
+        factory = APIKeyFactory(usage_sink=lambda period, counts: flushed.append(counts), default_quota=3)
+        key = factory.issue()
+        api_filter = Filters.APIFactory(factory, "api_key")
+        packet = Packet({"api_key": key}, encoding="json")
+        # Checking the filter doesn't count the request, the server does once a handler is chosen
+        assert api_filter.check(None, packet) and factory.usage(key) == 0
+        for _ in range(3):
+            assert api_filter.check(None, packet) and api_filter.consume(packet)
+        with pytest.raises(RequestRejected) as rejected:
+            api_filter.check(None, packet)
+        assert rejected.value.error == "ERR_QUOTA_EXCEEDED"
+        factory.set_quota(key, 5)
+        assert api_filter.check(None, packet) and api_filter.consume(packet)
+        assert not api_filter.check(None, Packet({"api_key": "nope"}, encoding="json"))
+        factory.flush()
+        assert flushed == [{key: 4}] and factory.usage(key) == 4
+        with tempfile.TemporaryDirectory() as directory:
+            sink = SQLiteUsageSink(os.path.join(directory, "usage.db"))
+            first, second = (APIKeyFactory(usage_sink=sink, default_quota=3, flush_interval=0) for _ in range(2))
+            key = first.issue()
+            second.update(key, None)
+            assert first.consume(key) and first.consume(key)
+            first.flush()
+            assert second.consume(key)
+            second.flush()
+            # The total usage came back from the sink
+            assert not second.consume(key)
+            assert sink.usage(key, time.time() // 86400 * 86400) == 3
+        # The server flushes usage periodically without traffic, and when it stops
+        flushed = []
+        factory = APIKeyFactory(usage_sink=lambda period, counts: flushed.append(counts), flush_interval=0.05)
+        key = factory.issue()
+        server = Server(logging_level=logging.CRITICAL)
+
+        @server.add_handler(Filters.APIFactory(factory, "usage_key"))
+        async def metered(client, packet):
+            pass
+
+        assert server._usage_factories() == [factory]
+        factory.consume(key)
+
+        async def idle():
+            with trio.move_on_after(0.3):
+                await server._tick_usage(trio.sleep)
+
+        trio.run(idle)
+        time.sleep(0.1)
+        assert flushed == [{key: 1}]
+        factory.consume(key)
+        server._flush_usage()
+        assert flushed == [{key: 1}, {key: 1}]
+
+    def test_unix_socket_client(self):
+        """
+        Tests that the default clients (with TLS enabled)
+        connect to a server over a Unix domain socket
+        without attempting a TLS handshake
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            server = Server(logging_level=logging.CRITICAL, unix_path=os.path.join(directory, "api.sock"))
+
+            @server.add_handler(Filters.Fields(uds_op="^ping$"))
+            async def ping(client, packet):
+                await client.send(Packet({"uds": "pong"}, encoding=packet.encoding))
+
+            def request():
+                client = Client()
+                client.connect_unix(server.unix_path)
+                client.send({"uds_op": "ping"})
+                response = client.receive()
+                client.disconnect()
+                return response
+
+            async def main():
+                listener = trio.SocketListener(trio.socket.from_stdlib_socket(server._bind_unix_socket()))
+                async with trio.open_nursery() as nursery:
+                    nursery.start_soon(trio.serve_listeners, server._handle_client, [listener])
+                    response = await trio.to_thread.run_sync(request)
+                    async with AsyncClient(unix_path=server.unix_path) as client:
+                        assert await client.request({"uds_op": "ping"}) == {"uds": "pong"}
+                    nursery.cancel_scope.cancel()
+                return response
+
+            assert trio.run(main) == {"uds": "pong"}
+
+    def test_overload_shedding_closes(self):
+        """
+        Tests that a request shed because the server is
+        overloaded closes the connection when the server
+        doesn't keep connections alive
+        """
+
+        server = Server(logging_level=logging.CRITICAL, keep_alive=False, overload_target=0.1)
+        server._start_overload()
+        # Every new request is over the limit
+        server._overload.limit = 0
+
+        async def main():
+            async with trio.open_nursery() as nursery:
+                listeners = await nursery.start(trio.serve_tcp, server._handle_client, 0)
+                stream = await trio.open_tcp_stream("127.0.0.1", listeners[0].socket.getsockname()[1])
+                await stream.send_all(encode_frame({"shed": "me"}))
+                response = b""
+                with trio.fail_after(2):
+                    chunk = await stream.receive_some()
+                    while chunk:
+                        response += chunk
+                        chunk = await stream.receive_some()
+                nursery.cancel_scope.cancel()
+            return response
+
+        assert json.loads(trio.run(main)[6:])["error"] == "ERR_OVERLOADED"
+
+    def test_reload_config(self):
+        """
+        Tests that reloading the configuration file only
+        applies the options listed in Server.RELOADABLE
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "config.ini")
+            with open(path, "w") as config:
+                config.write("[AsyncAPY]\nport = 1600\nheader_size = 4\ntimeout = 5\nlogging_level = 50\n")
+            server = Server(config=path)
+            assert (server.port, server.header_size, server.timeout) == (1600, 4, 5)
+            with open(path, "w") as config:
+                config.write(
+                    "[AsyncAPY]\nport = 1700\nheader_size = 2\ntimeout = 7\nlogging_level = 50\n"
+                    "keep_alive = true\nmax_frame_size = 1024\n"
+                )
+            server.reload_config()
+            assert (server.port, server.header_size) == (1600, 4)
+            assert (server.timeout, server.keep_alive, server.max_frame_size) == (7, True, 1024)
+
+    def test_workers(self):
+        """
+        Tests that the supervisor starts workers sharing
+        the port, that all of them serve requests and
+        that they all exit on SIGTERM
+        """
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        server = Server(port=port, logging_level=logging.CRITICAL)
+
+        @server.add_handler(Filters.Fields(worker_op="^whoami$"))
+        async def whoami(client, packet):
+            await client.send(Packet({"worker": server.worker_id, "pid": os.getpid()}, encoding=packet.encoding))
+
+        supervisor = multiprocessing.get_context("fork").Process(target=server.start, kwargs={"workers": 2})
+        supervisor.start()
+        try:
+            workers = {}
+            deadline = time.monotonic() + 10
+            while len(workers) < 2 and time.monotonic() < deadline:
+                client = Client(tls=False, timeout=2)
+                try:
+                    client.connect("127.0.0.1", port)
+                    client.send({"worker_op": "whoami"})
+                    response = client.receive()
+                    workers[response["worker"]] = response["pid"]
+                except (OSError, ValueError):
+                    time.sleep(0.1)
+                finally:
+                    if client.sock is not None:
+                        client.sock.close()
+            assert sorted(workers) == [0, 1]
+        finally:
+            os.kill(supervisor.pid, signal.SIGTERM)
+            supervisor.join(10)
+        assert supervisor.exitcode is not None
+        for pid in workers.values():
+            with pytest.raises(ProcessLookupError):
+                os.kill(pid, 0)
+
+    def test_configure_socket(self):
+        """
+        Tests that socket tuning options are applied,
+        and that TCP options are skipped on Unix sockets
+        """
+
+        with socket.socket() as sock:
+            configure_socket(sock, nodelay=True, rcvbuf=65536, sndbuf=65536, keepalive=30)
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+            # Linux doubles the buffer sizes to account for bookkeeping
+            assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 65536
+            assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= 65536
+            assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE) == 30
+            if hasattr(socket, "TCP_KEEPINTVL"):
+                assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL) == 30
+            configure_socket(sock, nodelay=False)
+            assert not sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        with socket.socket(socket.AF_UNIX) as sock:
+            configure_socket(sock, nodelay=True, sndbuf=65536, keepalive=30)
+            assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= 65536
+            assert not sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+
+    def test_tracing(self):
+        """
+        Tests that sampled requests have the duration of
+        each stage recorded, and that slow requests are
+        profiled
+        """
+
+        records = []
+        with tempfile.TemporaryDirectory() as directory:
+            server = Server(
+                logging_level=logging.CRITICAL,
+                keep_alive=True,
+                trace_sample_rate=1,
+                trace_sink=records.append,
+                profile_threshold=0,
+                profile_dir=directory,
+            )
+
+            @server.add_handler(Filters.Fields(traced_op="^sleep$"))
+            async def traced(client, packet):
+                await trio.sleep(0.01)
+                await client.send(Packet({"traced": True}, encoding=packet.encoding))
+
+            async def main():
+                async with trio.open_nursery() as nursery:
+                    listeners = await nursery.start(trio.serve_tcp, server._handle_client, 0)
+                    stream = await trio.open_tcp_stream("127.0.0.1", listeners[0].socket.getsockname()[1])
+                    await stream.send_all(encode_frame({"traced_op": "sleep"}))
+                    await stream.receive_some()
+                    await stream.aclose()
+                    with trio.fail_after(2):
+                        while not records:
+                            await trio.sleep(0.01)
+                    nursery.cancel_scope.cancel()
+
+            trio.run(main)
+            record = records[0]
+            assert record.handler == "traced"
+            assert {"read", "decode", "prepare", "filters", "handler", "encode", "send"} <= set(record.stages)
+            assert record.stages["handler"] >= 0.01
+            assert [name for name in os.listdir(directory) if name.endswith("-traced-" + record.session_id + ".prof")]
+
+    def test_buffered_receive(self):
+        """
+        Tests that the client reassembles responses
+        split across reads, keeps the responses that
+        come after them, and only grows its buffer
+        while responses larger than it are read
+        """
+
+        client = Client(tls=False, header_size=2, buffer_size=16)
+        client.sock, server = socket.socketpair()
+        frames = [encode_frame({"n": n, "pad": "x" * n * 10}, header_size=2) for n in range(5)]
+        data = b"".join(frames)
+        for index in range(0, len(data), 7):
+            server.sendall(data[index:index + 7])
+        server.close()
+        assert [client.receive_raw() for _ in frames] == frames
+        assert client.receive_raw() == b""
+        assert len(client._buffer) == 16
+
+    def test_request_many(self):
+        """
+        Tests that pipelined requests get their
+        responses in order, with a small window,
+        and that stopping early doesn't leave the
+        responses in flight for the next requests
+        """
+
+        client = Client(tls=False, encoding="ziproto")
+        client.sock, server = socket.socketpair()
+
+        def echo():
+            with server:
+                data = server.recv(65536)
+                while data:
+                    server.sendall(data)
+                    data = server.recv(65536)
+
+        threading.Thread(target=echo, daemon=True).start()
+        payloads = [{"n": n} for n in range(1000)]
+        assert list(client.request_many(iter(payloads), window=16)) == payloads
+        responses = client.request_many(iter(payloads), window=16)
+        assert [next(responses) for _ in range(3)] == payloads[:3]
+        responses.close()
+        assert client.send_many([{"a": 1}, {"b": 2}]) == 2
+        assert [client.receive(), client.receive()] == [{"a": 1}, {"b": 2}]
+        client.disconnect()
+
+    def test_cancelled_record(self):
+        """
+        Tests that a connection cancelled in the middle
+        of a request writes a single access log line
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "access.log")
+            server = Server(logging_level=logging.CRITICAL, keep_alive=True, access_log=path)
+            started = trio.Event()
+
+            @server.add_handler(Filters.Fields(cancelled_op="^hang$"))
+            async def hang(client, packet):
+                started.set()
+                await trio.sleep_forever()
+
+            async def main():
+                async with trio.open_nursery() as nursery:
+                    listeners = await nursery.start(trio.serve_tcp, server._handle_client, 0)
+                    stream = await trio.open_tcp_stream("127.0.0.1", listeners[0].socket.getsockname()[1])
+                    await stream.send_all(encode_frame({"cancelled_op": "hang"}))
+                    with trio.fail_after(2):
+                        await started.wait()
+                    nursery.cancel_scope.cancel()
+
+            server._start_access_log()
+            trio.run(main)
+            server._stop_access_log()
+            with open(path) as access_log:
+                lines = [json.loads(line) for line in access_log]
+            assert [line["status"] for line in lines] == ["cancelled"]
+
+    def test_api_key_charged_once(self):
+        """
+        Tests that a request is counted once against its
+        API key's quota, even if handlers in several groups
+        are called for it, and not by handlers whose other
+        filters didn't pass
+        """
+
+        factory = APIKeyFactory(default_quota=10)
+        key = factory.issue()
+        server = Server(logging_level=logging.CRITICAL, keep_alive=True)
+        called = []
+
+        @server.add_handler(Filters.APIFactory(factory, "charged_key"), Filters.Fields(charged_op="^never$"))
+        async def unmatched(client, packet):
+            called.append("unmatched")
+
+        @server.add_handler(Filters.APIFactory(factory, "charged_key"))
+        async def first(client, packet):
+            called.append("first")
+
+        @server.add_handler(Filters.APIFactory(factory, "charged_key"), group=1)
+        async def second(client, packet):
+            called.append("second")
+            await client.send(Packet({"charged": True}, encoding=packet.encoding))
+
+        async def main():
+            async with trio.open_nursery() as nursery:
+                listeners = await nursery.start(trio.serve_tcp, server._handle_client, 0)
+                stream = await trio.open_tcp_stream("127.0.0.1", listeners[0].socket.getsockname()[1])
+                await stream.send_all(encode_frame({"charged_key": key, "charged_op": "call"}))
+                with trio.fail_after(2):
+                    await stream.receive_some()
+                await stream.aclose()
+                nursery.cancel_scope.cancel()
+
+        trio.run(main)
+        assert called == ["first", "second"]
+        assert factory.usage(key) == 1